@@ -0,0 +1,170 @@
+import json
+import time
+import random
+import asyncio
+import argparse
+import itertools
+from datetime import datetime, timezone
+
+import discord
+from aiohttp import web
+
+import bot as mentor
+
+
+# Compares the old one-channel-at-a-time announcement loop with BroadcastDispatcher,
+# both going through discord.py's real HTTP client against a local fake Discord API.
+#
+#   python -m benchmarks.broadcast_bench --channels 50 --latency 0.08 --error-rate 0.02
+
+
+def json_response(data, status=200, headers=None):
+    # discord.py only decodes bodies whose content-type is exactly application/json
+    return web.Response(body=json.dumps(data).encode(), status=status,
+                        headers={**(headers or {}), 'Content-Type': 'application/json'})
+
+
+class FakeDiscordAPI:
+    """Minimal Discord REST endpoint with latency, per-channel rate limits and 5xx errors."""
+
+    def __init__(self, latency, error_rate, channel_limit=5, channel_window=5.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.channel_limit = channel_limit
+        self.channel_window = channel_window
+        self.windows = {}
+        self.ids = itertools.count(1)
+        self.stats = {'requests': 0, 'rate_limited': 0, 'errors': 0, 'delivered': 0}
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get('/api/v10/users/@me', self.me)
+        app.router.add_post('/api/v10/channels/{channel_id}/messages', self.create_message)
+        return app
+
+    async def me(self, request):
+        return json_response(self.user())
+
+    def user(self):
+        return {'id': '1', 'username': 'sql-mentor', 'discriminator': '0', 'avatar': None, 'bot': True}
+
+    async def create_message(self, request):
+        self.stats['requests'] += 1
+        channel_id = request.match_info['channel_id']
+        payload = await request.json()
+        await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+
+        now = time.monotonic()
+        window_start, count = self.windows.get(channel_id, (now, 0))
+        if now - window_start >= self.channel_window:
+            window_start, count = now, 0
+        reset_after = self.channel_window - (now - window_start)
+        headers = {
+            'X-RateLimit-Limit': str(self.channel_limit),
+            'X-RateLimit-Reset-After': f"{reset_after:.3f}",
+            'X-RateLimit-Reset': f"{time.time() + reset_after:.3f}",
+            'X-RateLimit-Bucket': f"channel-{channel_id}",
+        }
+        if count >= self.channel_limit:
+            self.stats['rate_limited'] += 1
+            headers['X-RateLimit-Remaining'] = '0'
+            headers['X-RateLimit-Scope'] = 'user'
+            return json_response({'message': 'You are being rate limited.', 'retry_after': reset_after, 'global': False},
+                                 status=429, headers=headers)
+        if random.random() < self.error_rate:
+            self.stats['errors'] += 1
+            return json_response({'message': 'Service Unavailable', 'code': 0}, status=503)
+
+        self.windows[channel_id] = (window_start, count + 1)
+        headers['X-RateLimit-Remaining'] = str(self.channel_limit - count - 1)
+        self.stats['delivered'] += 1
+        return json_response({
+            'id': str(next(self.ids)),
+            'channel_id': channel_id,
+            'author': self.user(),
+            'content': payload.get('content', ''),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'edited_timestamp': None,
+            'tts': False,
+            'mention_everyone': False,
+            'mentions': [],
+            'mention_roles': [],
+            'attachments': [],
+            'embeds': [],
+            'pinned': False,
+            'type': 0,
+        }, headers=headers)
+
+
+async def sequential_broadcast(client, channel_ids, message):
+    # The pre-dispatcher behaviour: one channel, one await at a time
+    sent = 0
+    for channel_id in channel_ids:
+        channel = client.get_partial_messageable(channel_id)
+        for chunk in mentor.split_message(message):
+            try:
+                await channel.send(chunk)
+                sent += 1
+            except discord.HTTPException:
+                pass
+    return sent
+
+
+async def run(args):
+    api = FakeDiscordAPI(args.latency, args.error_rate)
+    runner = web.AppRunner(api.app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    discord.http.Route.BASE = f'http://127.0.0.1:{port}/api/v10'
+
+    client = discord.Client(intents=discord.Intents.default())
+    await client.http.static_login('fake-token')
+
+    channel_ids = [1000 + i for i in range(args.channels)]
+    messages = {
+        'short': 'Daily All-Time Top 10\n' + '\n'.join(f'player{i}: {1000 - i} points' for i in range(10)),
+        'long': 'DAILY SQL CHALLENGE\n```sql\n' + '\n'.join(
+            f"INSERT INTO orders VALUES ({i}, 'customer_{i}', {i * 3.5});" for i in range(150)) + '\n```\nGood luck!',
+    }
+
+    print(f"{args.channels} channels, {args.latency * 1000:.0f} ms latency, {args.error_rate:.0%} 5xx rate\n")
+    print(f"{'message':<8} {'chunks':>6} {'mode':<12} {'seconds':>8} {'sent':>6} {'failed ch':>9}")
+    for name, message in messages.items():
+        chunks = len(mentor.split_message(message))
+
+        started = time.perf_counter()
+        sent = await sequential_broadcast(client, channel_ids, message)
+        sequential = time.perf_counter() - started
+        print(f"{name:<8} {chunks:>6} {'sequential':<12} {sequential:>8.2f} {sent:>6} {'-':>9}")
+
+        # Let the fake per-channel windows reset between runs
+        await asyncio.sleep(api.channel_window)
+
+        dispatcher = mentor.BroadcastDispatcher(client.get_partial_messageable)
+        started = time.perf_counter()
+        results = await dispatcher.broadcast(channel_ids, message)
+        concurrent = time.perf_counter() - started
+        failed = sum(1 for result in results if not result.ok)
+        sent = sum(result.messages_sent for result in results)
+        print(f"{name:<8} {chunks:>6} {'dispatcher':<12} {concurrent:>8.2f} {sent:>6} {failed:>9}"
+              f"   ({sequential / concurrent:.1f}x)")
+        await asyncio.sleep(api.channel_window)
+
+    print(f"\nfake API: {api.stats}")
+    await client.close()
+    await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark channel broadcasts against a fake Discord API')
+    parser.add_argument('--channels', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.08, help='mean response latency in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.02, help='fraction of sends answered with 503')
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
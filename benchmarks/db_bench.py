@@ -0,0 +1,298 @@
+import os
+import sys
+import ast
+import json
+import random
+import asyncio
+import inspect
+import argparse
+import textwrap
+import statistics
+from datetime import timedelta
+
+import bot as mentor
+
+
+# Seeds a local Postgres with a large synthetic dataset and times the hot
+# statements of bot.py with EXPLAIN (ANALYZE, BUFFERS).
+#
+#   DATABASE_SSL=disable python -m benchmarks.db_bench --database-url postgresql://localhost/sql_mentor_bench \
+#       --output before.json
+#   (add an index in ensure_tables_exist, then)
+#   python -m benchmarks.db_bench --database-url ... --baseline before.json
+#
+# The SQL is read out of the bot.py functions themselves, so the numbers always
+# describe the statements that ship. Seeding 10M submissions takes a few
+# minutes; it is skipped when the database already holds a dataset of the same
+# size (--reseed forces it). Use --scale 0.01 for a quick smoke run.
+
+BASE_USERS = 100_000
+BASE_QUESTIONS = 10_000
+BASE_SUBMISSIONS = 10_000_000
+SEED_BATCH = 1_000_000
+
+TOPICS = ['joins', 'aggregation', 'window functions', 'subqueries', 'ctes', 'date functions',
+          'string functions', 'case when', 'group by', 'having', 'set operations', 'indexes']
+COMPANIES = ['Amazon', 'Google', 'Meta', 'Microsoft', 'Netflix', 'Uber', 'Flipkart', 'Swiggy', 'Zomato', 'Paytm']
+
+# name, function, which SQL literal inside it, parameters for a sampled user
+HOT_STATEMENTS = [
+    ('question catalog load', mentor.QuestionCatalog.load, 0, lambda s: ()),
+    ('solved question ids', mentor.get_solved_question_ids, 0, lambda s: (s.user,)),
+    ('question text by id', mentor.QuestionCatalog.get_many, 0, lambda s: ([s.question],)),
+    ('get_top_10', mentor.get_top_10, 0, lambda s: ()),
+    ('get_weekly_heroes', mentor.get_weekly_heroes, 0, lambda s: (s.week_start,)),
+    ('daily counters seed', mentor.DailyCounterStore._seed, 0,
+     lambda s: (s.user, *mentor.DailyCounterStore.day_bounds(s.today))),
+    ('profile load', mentor.UserProfileStore._load, 0,
+     lambda s: (s.user, *mentor.DailyCounterStore.day_bounds(s.today))),
+    ('update_user_streak: solved yesterday', mentor.update_user_streak, 0,
+     lambda s: (s.user, *mentor.DailyCounterStore.day_bounds(s.today - timedelta(days=1)))),
+]
+
+
+def function_statements(func):
+    """SQL literals passed to conn.fetch*/execute inside func, in source order."""
+    tree = ast.parse(textwrap.dedent(inspect.getsource(func)))
+    names, statements = {}, []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Assign) and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str):
+            for target in node.targets:
+                if isinstance(target, ast.Name):
+                    names[target.id] = node.value.value
+    for node in ast.walk(tree):
+        if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.args):
+            continue
+        if node.func.attr not in ('fetch', 'fetchrow', 'fetchval', 'execute'):
+            continue
+        arg = node.args[0]
+        if isinstance(arg, ast.Constant) and isinstance(arg.value, str):
+            statements.append((arg.lineno, arg.value))
+        elif isinstance(arg, ast.Name) and arg.id in names:
+            statements.append((arg.lineno, names[arg.id]))
+    return [sql for _, sql in sorted(statements)]
+
+
+class Sample:
+    def __init__(self, user, question, today):
+        self.user = user
+        self.question = question
+        self.today = today
+        self.week_start = mentor.get_ist_time().replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None) \
+            - timedelta(days=today.weekday())
+
+
+async def seed(conn, users, questions, submissions):
+    await conn.execute('ALTER TABLE questions ADD COLUMN IF NOT EXISTS datasets TEXT')
+    await conn.execute('ALTER TABLE questions ADD COLUMN IF NOT EXISTS hint TEXT')
+    await conn.execute('TRUNCATE users, questions, user_submissions, user_stats, daily_points, weekly_points RESTART IDENTITY')
+
+    print(f"seeding {users} users, {questions} questions...")
+    await conn.execute('''
+        INSERT INTO users (user_id, username)
+        SELECT n, 'user' || n FROM generate_series(1, $1::INT) AS n
+    ''', users)
+    await conn.execute('''
+        INSERT INTO questions (question, answer, difficulty, topic, company, datasets, hint)
+        SELECT 'Benchmark question ' || n,
+               'SELECT customer_id, SUM(amount) FROM orders_' || n || ' GROUP BY customer_id',
+               (ARRAY['easy', 'medium', 'hard'])[1 + n % 3],
+               ($2::TEXT[])[1 + n % cardinality($2::TEXT[])],
+               CASE WHEN n % 3 = 0 THEN NULL ELSE ($3::TEXT[])[1 + n % cardinality($3::TEXT[])] END,
+               repeat('orders_' || n || '(customer_id INT, amount NUMERIC) ', 20),
+               'Group before you sort.'
+        FROM generate_series(1, $1::INT) AS n
+    ''', questions, TOPICS, COMPANIES)
+
+    # Cubing random() gives a long tail: a few heavy users own most submissions,
+    # and squaring the age puts most activity in the last weeks.
+    done = 0
+    while done < submissions:
+        batch = min(SEED_BATCH, submissions - done)
+        await conn.execute('''
+            INSERT INTO user_submissions (user_id, question_id, is_correct, points, submitted_at)
+            SELECT u, q, correct,
+                   CASE WHEN correct THEN (ARRAY[60, 80, 120])[1 + q % 3] ELSE -10 END,
+                   NOW() AT TIME ZONE 'UTC' - random() ^ 2 * INTERVAL '180 days'
+            FROM (
+                SELECT 1 + floor($2::INT * random() ^ 3)::INT AS u,
+                       1 + floor($3::INT * random() ^ 2)::INT AS q,
+                       random() < 0.55 AS correct
+                FROM generate_series(1, $1::INT)
+            ) s
+        ''', batch, users, questions)
+        done += batch
+        print(f"  user_submissions {done:,}/{submissions:,}")
+
+    await conn.execute('''
+        INSERT INTO user_stats (user_id, streak, last_streak_update)
+        SELECT user_id, 1 + (COUNT(*) % 30)::INT, MAX(submitted_at) AT TIME ZONE 'UTC'
+        FROM user_submissions WHERE is_correct GROUP BY user_id
+    ''')
+    await conn.execute('''
+        INSERT INTO daily_points (user_id, date, points)
+        SELECT user_id, DATE(submitted_at AT TIME ZONE 'UTC' AT TIME ZONE 'Asia/Kolkata'), SUM(points)
+        FROM user_submissions
+        WHERE submitted_at >= NOW() AT TIME ZONE 'UTC' - INTERVAL '30 days'
+        GROUP BY 1, 2
+    ''')
+    await conn.execute('CREATE TABLE IF NOT EXISTS bench_meta (key TEXT PRIMARY KEY, value TEXT)')
+    await conn.execute('''
+        INSERT INTO bench_meta (key, value) VALUES ('dataset', $1)
+        ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value
+    ''', f"{users}/{questions}/{submissions}")
+    print("analyzing...")
+    await conn.execute('ANALYZE')
+
+
+async def dataset_marker(conn):
+    if not await conn.fetchval("SELECT to_regclass('bench_meta') IS NOT NULL"):
+        return None
+    return await conn.fetchval("SELECT value FROM bench_meta WHERE key = 'dataset'")
+
+
+async def sample_users(conn, count, rng):
+    # Mix of the heaviest users and uniformly picked ones, so skew shows up in the numbers
+    heavy = [row['user_id'] for row in await conn.fetch('''
+        SELECT user_id FROM user_submissions GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT $1
+    ''', max(1, count // 2))]
+    max_user = await conn.fetchval('SELECT MAX(user_id) FROM users')
+    return heavy + [rng.randint(1, max_user) for _ in range(count - len(heavy))]
+
+
+async def explain(conn, sql, params):
+    transaction = conn.transaction()
+    await transaction.start()
+    try:
+        plan = await conn.fetchval(f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}', *params)
+    finally:
+        await transaction.rollback()
+    plan = json.loads(plan)[0] if isinstance(plan, str) else plan[0]
+    nodes, stack = [], [plan['Plan']]
+    while stack:
+        node = stack.pop()
+        nodes.append(node)
+        stack.extend(node.get('Plans', []))
+    return {
+        'execution_ms': plan['Execution Time'],
+        'planning_ms': plan['Planning Time'],
+        'shared_hit': plan['Plan'].get('Shared Hit Blocks', 0),
+        'shared_read': plan['Plan'].get('Shared Read Blocks', 0),
+        'seq_scans': sorted({node['Relation Name'] for node in nodes if node['Node Type'] == 'Seq Scan'}),
+        'top_node': plan['Plan']['Node Type'],
+    }
+
+
+async def run(args):
+    os.environ['DATABASE_URL'] = args.database_url
+    await mentor.create_db_pool()
+    await mentor.ensure_tables_exist()
+    rng = random.Random(args.seed)
+
+    users = int(BASE_USERS * args.scale)
+    questions = int(BASE_QUESTIONS * args.scale)
+    submissions = int(BASE_SUBMISSIONS * args.scale)
+    async with mentor.bot.db.acquire() as conn:
+        if args.reseed or await dataset_marker(conn) != f"{users}/{questions}/{submissions}":
+            await seed(conn, users, questions, submissions)
+        else:
+            print("dataset already seeded, reusing it (--reseed to rebuild)")
+            await conn.execute('ANALYZE')
+
+        today = mentor.get_ist_time().date()
+        samples = [Sample(user, rng.randint(1, questions), today)
+                   for user in await sample_users(conn, args.runs, rng)]
+        indexes = [row['indexdef'] for row in await conn.fetch('''
+            SELECT indexdef FROM pg_indexes WHERE schemaname = 'public' ORDER BY tablename, indexname
+        ''')]
+
+        results = {}
+        for name, func, index, params in HOT_STATEMENTS:
+            statements = function_statements(func)
+            if index >= len(statements):
+                print(f"{name}: statement #{index} not found in {func.__name__}, skipped")
+                continue
+            sql = statements[index]
+            await explain(conn, sql, params(samples[0]))  # warm the cache before timing
+            runs = [await explain(conn, sql, params(sample)) for sample in samples]
+            executions = [r['execution_ms'] for r in runs]
+            results[name] = {
+                'median_ms': round(statistics.median(executions), 3),
+                'max_ms': round(max(executions), 3),
+                'planning_ms': round(statistics.median(r['planning_ms'] for r in runs), 3),
+                'shared_hit': max(r['shared_hit'] for r in runs),
+                'shared_read': max(r['shared_read'] for r in runs),
+                'seq_scans': sorted({table for r in runs for table in r['seq_scans']}),
+                'top_node': runs[0]['top_node'],
+            }
+    await mentor.bot.db.close()
+    return {
+        'dataset': {'users': users, 'questions': questions, 'submissions': submissions},
+        'runs': args.runs,
+        'indexes': indexes,
+        'statements': results,
+    }
+
+
+def print_report(report):
+    dataset = report['dataset']
+    print(f"\n{dataset['users']:,} users, {dataset['questions']:,} questions, {dataset['submissions']:,} submissions, "
+          f"{report['runs']} runs per statement")
+    print(f"{'statement':<38} {'median ms':>10} {'max ms':>10} {'buffers':>9}  seq scans")
+    for name, entry in report['statements'].items():
+        buffers = entry['shared_hit'] + entry['shared_read']
+        print(f"{name:<38} {entry['median_ms']:>10.2f} {entry['max_ms']:>10.2f} {buffers:>9}  "
+              f"{', '.join(entry['seq_scans']) or '-'}")
+
+
+def compare(report, baseline, tolerance):
+    added = sorted(set(report['indexes']) - set(baseline['indexes']))
+    removed = sorted(set(baseline['indexes']) - set(report['indexes']))
+    for index in added:
+        print(f"+ {index}")
+    for index in removed:
+        print(f"- {index}")
+
+    regressions = []
+    print(f"\n{'statement':<38} {'before ms':>10} {'after ms':>10} {'change':>8}")
+    for name, entry in report['statements'].items():
+        old = baseline['statements'].get(name)
+        if not old:
+            continue
+        change = (entry['median_ms'] - old['median_ms']) / old['median_ms'] if old['median_ms'] else 0.0
+        print(f"{name:<38} {old['median_ms']:>10.2f} {entry['median_ms']:>10.2f} {change:>+8.0%}")
+        if change > tolerance:
+            regressions.append(f"{name} {old['median_ms']} -> {entry['median_ms']} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the hot SQL of bot.py on a large synthetic dataset')
+    parser.add_argument('--database-url', default=os.getenv('BENCH_DATABASE_URL'),
+                        help='throwaway database (default: $BENCH_DATABASE_URL)')
+    parser.add_argument('--scale', type=float, default=1.0, help='dataset size relative to 100k users / 10M submissions')
+    parser.add_argument('--reseed', action='store_true', help='rebuild the dataset even if it is already there')
+    parser.add_argument('--runs', type=int, default=10, help='sampled users per statement')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the JSON report here')
+    parser.add_argument('--baseline', help='JSON report to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed median slowdown before failing')
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error('--database-url or BENCH_DATABASE_URL is required')
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print("\nREGRESSION: " + '; '.join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+import os
+import sys
+import json
+import time
+import argparse
+import importlib
+import collections
+from concurrent.futures import ProcessPoolExecutor
+
+
+# Measures a grading engine on the labelled corpus in grading_corpus.jsonl:
+# per-grade latency, process-pool throughput and precision/recall of "accept".
+#
+#   python -m benchmarks.grading_bench                          # bot.check_answer
+#   python -m benchmarks.grading_bench --engine mypkg.grader:grade --baseline before.json
+#
+# An engine is any importable callable taking (submission, reference) and
+# returning a bool or an (is_correct, feedback) tuple, like check_answer.
+#
+# Corpus rows may carry "repeat"/"separator"/"prefix"/"suffix" to build the
+# pathological inputs at load time instead of storing megabytes of SQL.
+
+CORPUS = os.path.join(os.path.dirname(__file__), 'grading_corpus.jsonl')
+
+_engine = None
+
+
+def load_engine(path):
+    module_name, _, attr = path.partition(':')
+    target = importlib.import_module(module_name)
+    for part in attr.split('.'):
+        target = getattr(target, part)
+    return target
+
+
+def load_corpus(path):
+    items = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if 'repeat' in item:
+                body = item.get('separator', '').join([item['submission']] * item['repeat'])
+                item['submission'] = item.get('prefix', '') + body + item.get('suffix', '')
+            items.append(item)
+    return items
+
+
+def verdict(result):
+    return bool(result[0] if isinstance(result, tuple) else result)
+
+
+def grade(engine, submission, reference):
+    # A grader that raises has rejected the answer as far as the user is concerned
+    try:
+        return verdict(engine(submission, reference)), None
+    except Exception as e:
+        return False, type(e).__name__
+
+
+def _init_worker(engine_path):
+    global _engine
+    _engine = load_engine(engine_path)
+
+
+def _grade(pair):
+    return grade(_engine, *pair)[0]
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def measure_latency(engine, items, repeats):
+    per_item, verdicts, errors = {}, {}, {}
+    for item in items:
+        timings = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            verdicts[item['id']], error = grade(engine, item['submission'], item['reference'])
+            timings.append(time.perf_counter() - started)
+        per_item[item['id']] = timings
+        if error:
+            errors[item['id']] = error
+    return per_item, verdicts, errors
+
+
+def measure_throughput(engine_path, items, workers, rounds):
+    pairs = [(item['submission'], item['reference']) for item in items] * rounds
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(engine_path,)) as pool:
+        list(pool.map(_grade, pairs[:workers]))  # spawn and import before the clock starts
+        started = time.perf_counter()
+        # chunksize 1: the pathological rows cost seconds each and would otherwise land on one worker
+        list(pool.map(_grade, pairs, chunksize=1))
+        elapsed = time.perf_counter() - started
+    return len(pairs) / elapsed
+
+
+def accuracy(items, verdicts):
+    counts = collections.Counter()
+    wrong = []
+    for item in items:
+        expected = item['expected'] == 'accept'
+        got = verdicts[item['id']]
+        counts[('t' if got == expected else 'f') + ('p' if got else 'n')] += 1
+        if got != expected:
+            wrong.append({'id': item['id'], 'category': item['category'], 'expected': item['expected'],
+                          'got': 'accept' if got else 'reject'})
+    tp, fp, fn, tn = counts['tp'], counts['fp'], counts['fn'], counts['tn']
+    return {
+        'precision': round(tp / (tp + fp), 4) if tp + fp else 0.0,
+        'recall': round(tp / (tp + fn), 4) if tp + fn else 0.0,
+        'false_accept_rate': round(fp / (fp + tn), 4) if fp + tn else 0.0,
+        'accuracy': round((tp + tn) / len(items), 4),
+        'confusion': {'tp': tp, 'fp': fp, 'fn': fn, 'tn': tn},
+        'misgraded': wrong,
+    }
+
+
+def run(args):
+    items = load_corpus(args.corpus)
+    engine = load_engine(args.engine)
+    grade(engine, items[0]['submission'], items[0]['reference'])  # warm imports and caches
+
+    per_item, verdicts, errors = measure_latency(engine, items, args.repeats)
+    all_timings = [t for timings in per_item.values() for t in timings]
+    by_category = collections.defaultdict(list)
+    for item in items:
+        by_category[item['category']].extend(per_item[item['id']])
+    slowest = sorted(items, key=lambda item: -percentile(per_item[item['id']], 0.5))[:5]
+
+    return {
+        'engine': args.engine,
+        'corpus_size': len(items),
+        'latency_ms': {
+            'p50': round(percentile(all_timings, 0.50) * 1000, 3),
+            'p95': round(percentile(all_timings, 0.95) * 1000, 3),
+            'p99': round(percentile(all_timings, 0.99) * 1000, 3),
+            'max': round(max(all_timings) * 1000, 3),
+        },
+        'category_p50_ms': {category: round(percentile(timings, 0.5) * 1000, 3)
+                            for category, timings in sorted(by_category.items())},
+        'slowest': [{'id': item['id'], 'submission_chars': len(item['submission']),
+                     'p50_ms': round(percentile(per_item[item['id']], 0.5) * 1000, 3)} for item in slowest],
+        'single_process_grades_per_s': round(len(all_timings) / sum(all_timings), 1),
+        'pool_workers': args.workers,
+        'pool_grades_per_s': round(measure_throughput(args.engine, items, args.workers, args.rounds), 1),
+        'accuracy': accuracy(items, verdicts),
+        'errors': errors,
+    }
+
+
+def print_report(report):
+    latency, acc = report['latency_ms'], report['accuracy']
+    print(f"engine {report['engine']} on {report['corpus_size']} labelled submissions")
+    print(f"latency ms: p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  max {latency['max']}")
+    print(f"throughput: {report['single_process_grades_per_s']} grades/s in-process, "
+          f"{report['pool_grades_per_s']} grades/s with {report['pool_workers']} workers")
+    print("slowest: " + ', '.join(f"{s['id']} ({s['submission_chars']:,} chars, {s['p50_ms']} ms)" for s in report['slowest']))
+    print(f"precision {acc['precision']:.1%}  recall {acc['recall']:.1%}  false accepts {acc['false_accept_rate']:.1%}  "
+          f"accuracy {acc['accuracy']:.1%}  {acc['confusion']}")
+    for item_id, error in report['errors'].items():
+        print(f"  engine raised {error} on {item_id}")
+    for wrong in acc['misgraded']:
+        print(f"  misgraded {wrong['id']} [{wrong['category']}]: expected {wrong['expected']}, got {wrong['got']}")
+
+
+def compare(report, baseline, tolerance):
+    regressions = []
+    for metric in ('precision', 'recall'):
+        old, new = baseline['accuracy'][metric], report['accuracy'][metric]
+        print(f"{metric:<10} {old:.1%} -> {new:.1%}")
+        if new < old:
+            regressions.append(f"{metric} {old:.1%} -> {new:.1%}")
+    if len(report['errors']) > len(baseline['errors']):
+        regressions.append(f"engine errors {len(baseline['errors'])} -> {len(report['errors'])}")
+    old, new = baseline['latency_ms']['p95'], report['latency_ms']['p95']
+    print(f"p95 ms     {old} -> {new}")
+    if old and (new - old) / old > tolerance:
+        regressions.append(f"p95 {old} -> {new} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark a SQL grading engine for speed and correctness')
+    parser.add_argument('--engine', default='bot:check_answer', help='module:callable to grade with')
+    parser.add_argument('--corpus', default=CORPUS)
+    parser.add_argument('--repeats', type=int, default=5, help='timed grades per corpus item')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='process pool size')
+    parser.add_argument('--rounds', type=int, default=5, help='passes over the corpus for the pool throughput run')
+    parser.add_argument('--output', help='write the JSON report here')
+    parser.add_argument('--baseline', help='JSON report to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='allowed p95 slowdown before failing')
+    args = parser.parse_args()
+
+    report = run(args)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print("\nREGRESSION: " + '; '.join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
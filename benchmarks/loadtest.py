@@ -0,0 +1,434 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import datetime
+import itertools
+import contextvars
+import collections
+
+from discord.ext import commands
+from discord.ext.commands.view import StringView
+
+import bot as mentor
+
+
+# Drives the real command path (admission check, per-user mailbox, invoke hooks)
+# with fake messages against a local Postgres and reports throughput, latency
+# percentiles, pool wait and errors.
+#
+#   DATABASE_SSL=disable python -m benchmarks.loadtest --database-url postgresql://localhost/sql_mentor_load \
+#       --users 200 --duration 120 --output load.json
+#   python -m benchmarks.loadtest ... --baseline load.json    # exits 1 on regression
+#
+# Use a throwaway database: the run seeds questions, replaces current_challenge
+# and deletes every row belonging to the synthetic user id range.
+
+USER_ID_BASE = 9_000_000_000_000_000
+COMMANDS = ('sql', 'submit', 'hint', 'skip', 'submit_challenge', 'daily_progress')
+COMMAND_TIMEOUT = 60  # seconds; a command the bot never finishes counts as an error instead of stalling the run
+
+current_command = contextvars.ContextVar('current_command', default=None)
+
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.name = f"load{user_id - USER_ID_BASE}"
+        self.bot = False
+
+    def __str__(self):
+        return self.name
+
+
+class FakeChannel:
+    def __init__(self, channel_id, send_latency):
+        self.id = channel_id
+        self.send_latency = send_latency
+        self.sent = 0
+
+    async def send(self, content=None, **kwargs):
+        # Stands in for the Discord REST round trip
+        await asyncio.sleep(self.send_latency)
+        self.sent += 1
+
+
+message_ids = itertools.count(1)
+
+
+class FakeMessage:
+    def __init__(self, author, channel, content):
+        self.id = next(message_ids)
+        self.author = author
+        self.channel = channel
+        self.content = content
+        self.attachments = []
+        self.guild = None
+        self.created_at = datetime.datetime.now(datetime.timezone.utc)
+        self.edited_at = None
+        self._state = None
+
+
+class LoadContext(commands.Context):
+    """A real Context whose replies go to the fake channel; done resolves once the bot has finished with it."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.done = asyncio.get_running_loop().create_future()
+
+    async def send(self, content=None, **kwargs):
+        await self.channel.send(content, **kwargs)
+
+
+def quote_argument(value):
+    text = str(value)
+    if text and not any(char.isspace() or char == '"' for char in text):
+        return text
+    return '"' + text.replace('"', '\\"') + '"'
+
+
+def command_message(name, args, kwargs):
+    # Rebuild what the user typed, so arguments go through the command's own parsing and converters
+    parts = [f"{mentor.bot.command_prefix}{name}"]
+    values = dict(kwargs)
+    params = list(mentor.bot.get_command(name).clean_params.values())
+    for param, value in zip(params, args):
+        values[param.name] = value
+    for param in params:
+        if values.get(param.name) is None:
+            break  # the rest fall back to their defaults
+        value = values[param.name]
+        parts.append(str(value) if param.kind is param.KEYWORD_ONLY else quote_argument(value))
+    return ' '.join(parts)
+
+
+def command_context(message):
+    # What Bot.get_context does, minus the bot.user lookup that needs a gateway login
+    view = StringView(message.content)
+    ctx = LoadContext(prefix=None, view=view, bot=mentor.bot, message=message)
+    if view.skip_string(mentor.bot.command_prefix):
+        ctx.prefix = mentor.bot.command_prefix
+        ctx.invoked_with = view.get_word()
+        ctx.command = mentor.bot.all_commands.get(ctx.invoked_with)
+    return ctx
+
+
+class Recorder(logging.Handler):
+    """Collects per-command latencies; handlers swallow their exceptions, so logged errors count too.
+
+    Shed commands and full mailboxes count as errors: the user got a refusal, not an answer.
+    """
+
+    def __init__(self, channel):
+        super().__init__(level=logging.ERROR)
+        self.channel = channel
+        self.latencies = collections.defaultdict(list)
+        self.errors = collections.Counter()
+
+    def attach(self):
+        logging.getLogger().addHandler(self)
+        mentor.bot.add_listener(self.on_command_completion)
+        mentor.bot.add_listener(self.on_command_error)
+        # Mailbox commands run in the user's actor task; tag it so errors logged there are attributed
+        mentor.bot.add_check(self.tag_command)
+
+    def emit(self, record):
+        command = current_command.get()
+        if command:
+            self.errors[command] += 1
+
+    def tag_command(self, ctx):
+        current_command.set(ctx.command.qualified_name)
+        return True
+
+    async def on_command_completion(self, ctx):
+        if isinstance(ctx, LoadContext) and not ctx.done.done():
+            ctx.done.set_result(None)
+
+    async def on_command_error(self, ctx, error):
+        if isinstance(error, mentor.CommandShed) and ctx.command:
+            self.errors[ctx.command.qualified_name] += 1
+        await self.on_command_completion(ctx)
+
+    async def invoke(self, name, author, *args, **kwargs):
+        token = current_command.set(name)
+        started = time.perf_counter()
+        try:
+            ctx = command_context(FakeMessage(author, self.channel, command_message(name, args, kwargs)))
+            # Simulated users fire far faster than cooldowns allow; skip them so every call does the real work
+            ctx.command.reset_cooldown(ctx)
+            # Routed the way on_message routes a real message
+            if name in mentor.UNSERIALIZED_COMMANDS:
+                await mentor.bot.invoke(ctx)
+            elif not mentor.MAILBOXES.post(author.id, ctx):
+                self.errors[name] += 1
+                return
+            await asyncio.wait_for(ctx.done, COMMAND_TIMEOUT)
+        except Exception:
+            self.errors[name] += 1
+        finally:
+            self.latencies[name].append(time.perf_counter() - started)
+            current_command.reset(token)
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def histogram_quantile(histogram, q):
+    # Upper bucket bound holding the q-th observation, as Prometheus would estimate it
+    counts, _, count = histogram.series.get((), ([0] * len(histogram.buckets), 0.0, 0))
+    if not count:
+        return 0.0
+    rank, cumulative = q * count, 0
+    for bound, bucket_count in zip(histogram.buckets, counts):
+        cumulative += bucket_count
+        if cumulative >= rank:
+            return bound
+    return float('inf')
+
+
+async def prepare_database(conn, args):
+    await conn.execute('ALTER TABLE questions ADD COLUMN IF NOT EXISTS datasets TEXT')
+    await conn.execute('ALTER TABLE questions ADD COLUMN IF NOT EXISTS hint TEXT')
+    existing = await conn.fetchval('SELECT COUNT(*) FROM questions')
+    if existing < args.questions:
+        await conn.execute('''
+            INSERT INTO questions (question, answer, difficulty, topic, company, datasets, hint)
+            SELECT 'Load test question ' || n,
+                   'SELECT customer_id, SUM(amount) AS total FROM orders_' || n || ' GROUP BY customer_id ORDER BY total DESC',
+                   (ARRAY['easy', 'medium', 'hard'])[1 + n % 3],
+                   (ARRAY['joins', 'aggregation', 'window functions', 'subqueries'])[1 + n % 4],
+                   (ARRAY['Amazon', 'Google', 'Meta', NULL])[1 + n % 4],
+                   'orders_' || n || '(customer_id INT, amount NUMERIC)',
+                   'Group before you sort.'
+            FROM generate_series($1::INT, $2::INT) AS n
+        ''', existing + 1, args.questions)
+
+    # Start every run from the same state so reports stay comparable
+    tables = await conn.fetch('''
+        SELECT table_name FROM information_schema.columns
+        WHERE table_schema = 'public' AND column_name = 'user_id'
+    ''')
+    for table in tables:
+        await conn.execute(f'DELETE FROM "{table["table_name"]}" WHERE user_id BETWEEN $1 AND $2',
+                           USER_ID_BASE, USER_ID_BASE + args.users)
+
+    question_id = await conn.fetchval('SELECT id FROM questions ORDER BY id LIMIT 1')
+    await conn.execute('DELETE FROM current_challenge')
+    await conn.execute('''
+        INSERT INTO current_challenge (question_id, start_time, end_time)
+        VALUES ($1, NOW(), NOW() + INTERVAL '1 day')
+    ''', question_id)
+    return await conn.fetchval('SELECT answer FROM questions WHERE id = $1', question_id)
+
+
+async def think(rng, mean):
+    await asyncio.sleep(rng.expovariate(1 / mean) if mean > 0 else 0)
+
+
+async def simulate_user(user, recorder, rng, args, deadline):
+    while time.monotonic() < deadline:
+        await recorder.invoke('sql', user)
+        question = await mentor.user_questions.get(user.id)
+        await think(rng, args.think)
+        if question is None:
+            continue
+
+        if rng.random() < args.hint_rate:
+            await recorder.invoke('hint', user)
+            await think(rng, args.think)
+        if rng.random() < args.skip_rate:
+            await recorder.invoke('skip', user)
+            await think(rng, args.think)
+            continue
+
+        answer = question['answer'] if rng.random() < args.correct_rate else 'SELECT * FROM orders'
+        await recorder.invoke('submit', user, answer)
+        await think(rng, args.think)
+        if rng.random() < args.progress_rate:
+            await recorder.invoke('daily_progress', user)
+            await think(rng, args.think)
+
+
+async def challenge_spike(users, recorder, rng, args, answer):
+    # The 17:30 IST daily challenge: most users submit within a few seconds of the post
+    await asyncio.sleep(args.spike_at)
+    logging.warning(f"Challenge spike: ~{args.spike_share:.0%} of {len(users)} users over {args.spike_window}s")
+
+    async def submit(user):
+        await asyncio.sleep(rng.uniform(0, args.spike_window))
+        await recorder.invoke('submit_challenge', user, answer if rng.random() < args.correct_rate else 'SELECT 1')
+
+    await asyncio.gather(*(submit(user) for user in users if rng.random() < args.spike_share))
+
+
+async def start_services():
+    # The background workers setup() starts, so commands hit the same caches and batchers as in the bot
+    await mentor.KNOWN_USERS.warm()
+    await mentor.QUESTIONS.load()
+    mentor.GRADER.start()
+    mentor.KNOWN_USERS.start()
+    mentor.ACTIVITY.start()
+    mentor.CHALLENGE_BURST.start()
+
+
+async def stop_services():
+    mentor.MAILBOXES.close()
+    await mentor.KNOWN_USERS.stop()
+    await mentor.ACTIVITY.stop()
+    await mentor.CHALLENGE_BURST.stop()
+    mentor.GRADER.stop()
+    for timer in mentor.user_timers.values():
+        timer.cancel()
+
+
+def build_report(recorder, elapsed, config, command_names=COMMANDS):
+    commands = {}
+    for name in command_names:
+        latencies = recorder.latencies.get(name, [])
+        commands[name] = {
+            'count': len(latencies),
+            'errors': recorder.errors.get(name, 0),
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            'max_ms': round(max(latencies, default=0) * 1000, 2),
+        }
+    total = sum(entry['count'] for entry in commands.values())
+    _, wait_total, wait_count = mentor.DB_SEMAPHORE_WAIT.series.get((), (None, 0.0, 0))
+    return {
+        'config': config,
+        'pool_size': mentor.DB_POOL_MAX_SIZE,
+        'elapsed_s': round(elapsed, 2),
+        'commands_total': total,
+        'commands_per_s': round(total / elapsed, 2),
+        'errors_total': sum(entry['errors'] for entry in commands.values()),
+        'pool_wait': {
+            'acquires': wait_count,
+            'mean_ms': round(wait_total / wait_count * 1000, 2) if wait_count else 0.0,
+            'p95_ms_le': histogram_quantile(mentor.DB_SEMAPHORE_WAIT, 0.95) * 1000,
+            'p99_ms_le': histogram_quantile(mentor.DB_SEMAPHORE_WAIT, 0.99) * 1000,
+        },
+        'commands': commands,
+    }
+
+
+def print_report(report):
+    print(f"\n{report['commands_total']} commands in {report['elapsed_s']}s "
+          f"({report['commands_per_s']} cmd/s), {report['errors_total']} errors, pool size {report['pool_size']}")
+    print(f"{'command':<17} {'count':>6} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, entry in report['commands'].items():
+        print(f"{name:<17} {entry['count']:>6} {entry['errors']:>6} {entry['p50_ms']:>9.1f} "
+              f"{entry['p95_ms']:>9.1f} {entry['p99_ms']:>9.1f} {entry['max_ms']:>9.1f}")
+    wait = report['pool_wait']
+    print(f"pool wait: {wait['acquires']} acquires, mean {wait['mean_ms']} ms, "
+          f"p95 <= {wait['p95_ms_le']} ms, p99 <= {wait['p99_ms_le']} ms")
+
+
+def compare(report, baseline, tolerance):
+    regressions = []
+    if report['commands_per_s'] < baseline['commands_per_s'] * (1 - tolerance):
+        regressions.append(f"throughput {baseline['commands_per_s']} -> {report['commands_per_s']} cmd/s")
+    for name, entry in report['commands'].items():
+        old = baseline['commands'].get(name)
+        if not old or not old['count'] or not entry['count']:
+            continue
+        change = (entry['p95_ms'] - old['p95_ms']) / old['p95_ms'] if old['p95_ms'] else 0.0
+        print(f"{name:<17} p95 {old['p95_ms']:>9.1f} -> {entry['p95_ms']:>9.1f} ms ({change:+.0%})")
+        if change > tolerance:
+            regressions.append(f"{name} p95 {old['p95_ms']} -> {entry['p95_ms']} ms")
+        if entry['errors'] > old['errors']:
+            regressions.append(f"{name} errors {old['errors']} -> {entry['errors']}")
+    return regressions
+
+
+async def delayed(delay, coro):
+    await asyncio.sleep(delay)
+    await coro
+
+
+async def run(args):
+    os.environ['DATABASE_URL'] = args.database_url
+    await mentor.create_db_pool()
+    await mentor.ensure_tables_exist()
+    async with mentor.bot.db.acquire() as conn:
+        challenge_answer = await prepare_database(conn, args)
+
+    rng = random.Random(args.seed)
+    users = [FakeUser(USER_ID_BASE + i) for i in range(1, args.users + 1)]
+
+    # Entering the client sets up its loop, which command dispatch needs; no gateway login happens
+    async with mentor.bot:
+        recorder = Recorder(FakeChannel(1, args.send_latency))
+        recorder.attach()
+        # Handlers log at INFO on every call; keep stderr readable (the f-strings are still evaluated)
+        logging.getLogger().setLevel(logging.WARNING)
+        await start_services()
+        mentor.DB_SEMAPHORE_WAIT.series.clear()
+
+        started = time.monotonic()
+        deadline = started + args.duration
+        # Ramp users in over the first tenth of the run instead of a thundering herd at t=0
+        tasks = [asyncio.create_task(delayed(rng.uniform(0, args.duration / 10),
+                                             simulate_user(user, recorder, random.Random(rng.random()), args, deadline)))
+                 for user in users]
+        if args.spike_at >= 0:
+            tasks.append(asyncio.create_task(challenge_spike(users, recorder, rng, args, challenge_answer)))
+        await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - started
+
+        await stop_services()
+    await mentor.bot.db.close()
+    config = {key: getattr(args, key) for key in ('users', 'duration', 'think', 'send_latency', 'spike_at', 'seed')}
+    return build_report(recorder, elapsed, config)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the command handlers against a local Postgres')
+    parser.add_argument('--database-url', default=os.getenv('LOADTEST_DATABASE_URL'),
+                        help='throwaway database (default: $LOADTEST_DATABASE_URL)')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=60, help='seconds')
+    parser.add_argument('--think', type=float, default=2.0, help='mean think time between commands in seconds')
+    parser.add_argument('--send-latency', type=float, default=0.05, help='simulated Discord send latency in seconds')
+    parser.add_argument('--questions', type=int, default=500, help='minimum number of questions to seed')
+    parser.add_argument('--hint-rate', type=float, default=0.3)
+    parser.add_argument('--skip-rate', type=float, default=0.1)
+    parser.add_argument('--correct-rate', type=float, default=0.6)
+    parser.add_argument('--progress-rate', type=float, default=0.2)
+    parser.add_argument('--spike-at', type=float, default=30, help='seconds into the run for the 17:30 spike (-1 disables)')
+    parser.add_argument('--spike-window', type=float, default=5, help='seconds over which the spike arrives')
+    parser.add_argument('--spike-share', type=float, default=0.8, help='fraction of users joining the spike')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the JSON report here')
+    parser.add_argument('--baseline', help='JSON report to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='allowed regression before failing')
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error('--database-url or LOADTEST_DATABASE_URL is required')
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print("\nREGRESSION: " + '; '.join(regressions))
+            sys.exit(1)
+        print("\nNo regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import collections
+
+import bot as mentor
+from benchmarks import loadtest
+
+
+# Replays a TRAFFIC_CAPTURE_PATH capture through the bot's command path and
+# compares latency distributions between builds.
+#
+#   DATABASE_SSL=disable python -m benchmarks.replay run traffic.jsonl \
+#       --database-url postgresql://localhost/sql_mentor_load --speed 10 --output before.json
+#   (check out the other build, same command with --output after.json)
+#   python -m benchmarks.replay compare before.json after.json
+#
+# Each captured user becomes one synthetic user whose commands run in their
+# original order; the schedule is the capture's timeline divided by --speed.
+
+
+def load_capture(path, limit=None):
+    events = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                events.append(json.loads(line))
+    events.sort(key=lambda event: event['ts'])
+    return events[:limit] if limit else events
+
+
+async def replay_user(user, events, recorder, origin, started, speed, skipped):
+    for event in events:
+        delay = started + (event['ts'] - origin) / speed - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if mentor.bot.get_command(event['command']) is None:
+            skipped[event['command']] += 1
+            continue
+        await recorder.invoke(event['command'], user, *event['args'], **event['kwargs'])
+
+
+async def run(args):
+    events = load_capture(args.capture, args.limit)
+    if not events:
+        raise SystemExit(f"{args.capture} has no events")
+    by_user = collections.defaultdict(list)
+    for event in events:
+        by_user[event['user']].append(event)
+
+    os.environ['DATABASE_URL'] = args.database_url
+    await mentor.create_db_pool()
+    await mentor.ensure_tables_exist()
+    async with mentor.bot.db.acquire() as conn:
+        await loadtest.prepare_database(conn, argparse.Namespace(users=len(by_user), questions=args.questions))
+
+    # Handlers use the module-level random; seeding keeps runs of one build comparable
+    random.seed(args.seed)
+    # Entering the client sets up its loop, which command dispatch needs; no gateway login happens
+    async with mentor.bot:
+        recorder = loadtest.Recorder(loadtest.FakeChannel(1, args.send_latency))
+        recorder.attach()
+        logging.getLogger().setLevel(logging.WARNING)
+        await loadtest.start_services()
+        mentor.DB_SEMAPHORE_WAIT.series.clear()
+
+        skipped = collections.Counter()
+        origin = events[0]['ts']
+        started = time.monotonic()
+        await asyncio.gather(*(
+            replay_user(loadtest.FakeUser(loadtest.USER_ID_BASE + i), user_events, recorder,
+                        origin, started, args.speed, skipped)
+            for i, user_events in enumerate(by_user.values(), 1)))
+        elapsed = time.monotonic() - started
+
+        await loadtest.stop_services()
+    await mentor.bot.db.close()
+
+    config = {'capture': os.path.basename(args.capture), 'events': len(events), 'users': len(by_user),
+              'speed': args.speed, 'send_latency': args.send_latency, 'seed': args.seed}
+    report = loadtest.build_report(recorder, elapsed, config, sorted(recorder.latencies))
+    report['captured_span_s'] = round(events[-1]['ts'] - origin, 2)
+    report['skipped'] = dict(skipped)
+    report['samples_ms'] = {name: [round(value * 1000, 3) for value in values]
+                            for name, values in recorder.latencies.items()}
+    return report
+
+
+def ks_statistic(a, b):
+    # Two-sample Kolmogorov-Smirnov D: the largest gap between the two empirical CDFs
+    a, b = sorted(a), sorted(b)
+    i = j = 0
+    d = 0.0
+    while i < len(a) and j < len(b):
+        if a[i] <= b[j]:
+            i += 1
+        else:
+            j += 1
+        d = max(d, abs(i / len(a) - j / len(b)))
+    return d
+
+
+def compare(before, after, tolerance):
+    print(f"{'command':<17} {'n':>11} {'p50 ms':>17} {'p95 ms':>17} {'p99 ms':>17} {'KS D':>6}")
+    regressions = []
+    for name in sorted(set(before['samples_ms']) & set(after['samples_ms'])):
+        a, b = before['samples_ms'][name], after['samples_ms'][name]
+        if not a or not b:
+            continue
+        quantiles = [(loadtest.percentile(a, q), loadtest.percentile(b, q)) for q in (0.50, 0.95, 0.99)]
+        d = ks_statistic(a, b)
+        # 5% significance threshold for the KS test
+        significant = d > 1.36 * ((len(a) + len(b)) / (len(a) * len(b))) ** 0.5
+        cells = ' '.join(f"{old:>7.1f} -> {new:<7.1f}" for old, new in quantiles)
+        print(f"{name:<17} {len(a):>5}/{len(b):<5} {cells} {d:>6.2f}{' *' if significant else ''}")
+        old_p95, new_p95 = quantiles[1]
+        if significant and old_p95 and (new_p95 - old_p95) / old_p95 > tolerance:
+            regressions.append(f"{name} p95 {old_p95:.1f} -> {new_p95:.1f} ms")
+    print(f"\nthroughput {before['commands_per_s']} -> {after['commands_per_s']} cmd/s, "
+          f"errors {before['errors_total']} -> {after['errors_total']}  (* = distributions differ, p < 0.05)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay captured traffic and compare builds')
+    sub = parser.add_subparsers(dest='mode', required=True)
+
+    run_parser = sub.add_parser('run', help='replay a capture against a local Postgres')
+    run_parser.add_argument('capture', help='JSONL written via TRAFFIC_CAPTURE_PATH')
+    run_parser.add_argument('--database-url', default=os.getenv('LOADTEST_DATABASE_URL'),
+                            help='throwaway database (default: $LOADTEST_DATABASE_URL)')
+    run_parser.add_argument('--speed', type=float, default=1.0, help='timeline acceleration, e.g. 10 for 10x')
+    run_parser.add_argument('--send-latency', type=float, default=0.05, help='simulated Discord send latency in seconds')
+    run_parser.add_argument('--questions', type=int, default=500, help='minimum number of questions to seed')
+    run_parser.add_argument('--limit', type=int, help='replay only the first N events')
+    run_parser.add_argument('--seed', type=int, default=1)
+    run_parser.add_argument('--output', help='write the JSON report here')
+
+    compare_parser = sub.add_parser('compare', help='compare two replay reports')
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+    compare_parser.add_argument('--tolerance', type=float, default=0.15, help='allowed p95 regression before failing')
+    args = parser.parse_args()
+
+    if args.mode == 'run':
+        if not args.database_url:
+            run_parser.error('--database-url or LOADTEST_DATABASE_URL is required')
+        report = asyncio.run(run(args))
+        loadtest.print_report(report)
+        if report['skipped']:
+            print(f"skipped unknown commands: {report['skipped']}")
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f)
+        return
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    regressions = compare(before, after, args.tolerance)
+    if regressions:
+        print("\nREGRESSION: " + '; '.join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
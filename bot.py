@@ -10,27 +10,47 @@ import asyncio
 from difflib import SequenceMatcher
 import random
 from logging.handlers import RotatingFileHandler
+from aiohttp import web
 import pytz
 import functools
+import itertools
+import bisect
+import collections
+import time as time_module
+import aiohttp
+import json
+import socket
+import sys
+import contextvars
+import threading
+import traceback
+import tracemalloc
+import io
+import hashlib
+import math
+import zlib
 import sqlparse
+import re
+import numpy as np
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
 
 # Setup
 logging.basicConfig(level=logging.INFO)
 load_dotenv()
 
-async def setup():
-    await create_db_pool()
-    await ensure_tables_exist()
-    update_leaderboard.start()
-    daily_challenge.start()
-    challenge_time_over.start()
-    update_weekly_heroes.start()
-    check_scheduled_posts.start()
-
 intents = discord.Intents.default()
 intents.message_content = True
-bot = commands.Bot(command_prefix='!', intents=intents, help_command=None)
+
+# cluster.py runs several processes, each owning the shards listed in SHARD_IDS
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '0')) or None
+SHARD_IDS = [int(i) for i in os.getenv('SHARD_IDS', '').split(',') if i.strip()] or None
+if SHARD_COUNT:
+    bot = commands.AutoShardedBot(command_prefix='!', intents=intents, help_command=None,
+                                  shard_count=SHARD_COUNT, shard_ids=SHARD_IDS)
+else:
+    bot = commands.Bot(command_prefix='!', intents=intents, help_command=None)
 
 class ThreadSafeDict:
     def __init__(self):
@@ -53,20 +73,283 @@ class ThreadSafeDict:
         async with self._lock:
             return key in self._dict
 
+    def __len__(self):
+        return len(self._dict)
+
+# Metrics, served in Prometheus text format by start_metrics_server()
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in values)
+    return '{' + ','.join(f'{n}="{v}"' for n, v in zip(names, escaped)) + '}'
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.values = collections.defaultdict(float)
+
+    def inc(self, *label_values, amount=1):
+        self.values[label_values] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for label_values, value in self.values.items():
+            lines.append(f"{self.name}{format_labels(self.labels, label_values)} {value}")
+        return lines
+
+class Gauge:
+    """A gauge that is either set directly or read from a callback at scrape time."""
+
+    def __init__(self, name, help_text, callback=None):
+        self.name = name
+        self.help_text = help_text
+        self.callback = callback
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def render(self):
+        value = self.value
+        if self.callback:
+            try:
+                value = self.callback()
+            except Exception:
+                value = float('nan')
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, value, *label_values):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, total, count) in self.series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = format_labels(self.labels + ('le',), label_values + (bound,))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.labels + ('le',), label_values + ('+Inf',))
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, label_values)} {total}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, label_values)} {count}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+METRICS = MetricsRegistry()
+COMMAND_LATENCY = METRICS.register(Histogram('sql_mentor_command_seconds', 'Command latency', labels=('command',)))
+COMMAND_ERRORS = METRICS.register(Counter('sql_mentor_command_errors_total', 'Commands that raised', labels=('command',)))
+DB_QUERY_LATENCY = METRICS.register(Histogram('sql_mentor_db_query_seconds', 'Database statement latency', labels=('query',)))
+DB_SEMAPHORE_WAIT = METRICS.register(Histogram('sql_mentor_db_semaphore_wait_seconds', 'Time spent waiting for DB_SEMAPHORE'))
+DB_SEMAPHORE_WAITING = METRICS.register(Gauge('sql_mentor_db_semaphore_waiting', 'Coroutines queued on DB_SEMAPHORE'))
+GRADING_LATENCY = METRICS.register(Histogram('sql_mentor_grading_seconds', 'Time to grade one answer'))
+GRADING_QUEUE_DEPTH = METRICS.register(Gauge('sql_mentor_grading_queue_depth', 'Answers waiting for or being graded on the process pool'))
+LOOP_LAG = METRICS.register(Histogram('sql_mentor_event_loop_lag_seconds', 'Event loop scheduling delay'))
+LOOP_BLOCKS = METRICS.register(Counter('sql_mentor_event_loop_blocks_total', 'Callbacks that blocked the event loop', labels=('site',)))
+LOOP_BLOCKED_SECONDS = METRICS.register(Counter('sql_mentor_event_loop_blocked_seconds_total', 'Time the event loop spent blocked', labels=('site',)))
+
+def query_label(query):
+    return ' '.join(query.split())[:120]
+
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '250'))
+SLOW_QUERY_EXPLAIN_RATE = float(os.getenv('SLOW_QUERY_EXPLAIN_RATE', '0.2'))  # share of slow statements to EXPLAIN
+SLOW_QUERY_EXPLAIN_COOLDOWN = 300  # seconds between plans for the same statement
+EXPLAINABLE = ('select', 'with')  # re-run under EXPLAIN ANALYZE
+PLAN_ONLY = ('insert', 'update', 'delete')  # planned but never executed a second time
+WRITE_KEYWORD = re.compile(r'\b(insert|update|delete)\b', re.IGNORECASE)  # data-modifying CTEs
+
+slow_query_logger = logging.getLogger('sql_mentor.slow_queries')
+explaining = contextvars.ContextVar('explaining', default=False)
+
+def query_call_site():
+    # First frame in this file outside the connection wrapper, e.g. "get_question (bot.py:512)"
+    frame = sys._getframe(2)
+    while frame is not None:
+        code = frame.f_code
+        if code.co_filename == __file__ and code.co_name not in InstrumentedConnection.WRAPPED:
+            return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+        frame = frame.f_back
+    return 'unknown'
+
+class SlowQueryLog:
+    """Aggregates statements slower than SLOW_QUERY_MS and samples their plans."""
+
+    def __init__(self, threshold_ms, explain_rate, explain_cooldown):
+        self.threshold = threshold_ms / 1000
+        self.explain_rate = explain_rate
+        self.explain_cooldown = explain_cooldown
+        self.stats = {}
+        self.last_explained = {}
+        self.explain_task = None
+
+    def record(self, query, args, duration, call_site):
+        if duration < self.threshold:
+            return
+        label = query_label(query)
+        entry = self.stats.setdefault((label, call_site), {'count': 0, 'total': 0.0, 'max': 0.0, 'plan': None})
+        entry['count'] += 1
+        entry['total'] += duration
+        entry['max'] = max(entry['max'], duration)
+        slow_query_logger.warning(f"{duration * 1000:.0f} ms at {call_site}: {label}")
+        if self._should_explain(query, args):
+            self.last_explained[label] = time_module.monotonic()
+            self.explain_task = asyncio.create_task(self._explain(query, args, entry, call_site))
+
+    def _should_explain(self, query, args):
+        if self.explain_task and not self.explain_task.done():
+            return False  # one plan at a time keeps the sampler off the hot path
+        if args is None or not query.lstrip().lower().startswith(EXPLAINABLE + PLAN_ONLY):
+            return False
+        last = self.last_explained.get(query_label(query))
+        if last is not None and time_module.monotonic() - last < self.explain_cooldown:
+            return False
+        return random.random() < self.explain_rate
+
+    async def _explain(self, query, args, entry, call_site):
+        explaining.set(True)
+        # ANALYZE executes the statement, so writes would lock rows, fire triggers
+        # and burn sequence values on live tables; they only get the planner's estimate
+        analyze = query.lstrip().lower().startswith(EXPLAINABLE) and not WRITE_KEYWORD.search(query)
+        options = '(ANALYZE, BUFFERS) ' if analyze else ''
+        try:
+            async with DB_SEMAPHORE:
+                async with bot.db.acquire() as conn:
+                    # Rolled back regardless, in case a volatile function writes
+                    transaction = conn.transaction()
+                    await transaction.start()
+                    try:
+                        await conn.execute("SET LOCAL statement_timeout = '10s'")
+                        rows = await conn.fetch(f"EXPLAIN {options}{query}", *args)
+                    finally:
+                        await transaction.rollback()
+            entry['plan'] = '\n'.join(row[0] for row in rows)
+            slow_query_logger.warning(f"Plan for {call_site}: {query_label(query)}\n{entry['plan']}")
+        except Exception as e:
+            slow_query_logger.error(f"EXPLAIN failed for {call_site}: {e}")
+
+    def top(self, limit=10):
+        ranked = sorted(self.stats.items(), key=lambda item: item[1]['total'], reverse=True)
+        return ranked[:limit]
+
+SLOW_QUERIES = SlowQueryLog(SLOW_QUERY_MS, SLOW_QUERY_EXPLAIN_RATE, SLOW_QUERY_EXPLAIN_COOLDOWN)
+
+class InstrumentedConnection(asyncpg.Connection):
+    """asyncpg connection that times every statement; used as the pool's connection_class."""
+
+    WRAPPED = frozenset({'_timed', 'execute', 'executemany', 'fetch', 'fetchrow', 'fetchval'})
+
+    async def _timed(self, method, query, *args, **kwargs):
+        if explaining.get():
+            return await method(query, *args, **kwargs)
+        call_site = query_call_site()
+        started = time_module.perf_counter()
+        try:
+            return await method(query, *args, **kwargs)
+        finally:
+            duration = time_module.perf_counter() - started
+            DB_QUERY_LATENCY.observe(duration, query_label(query))
+            # executemany passes one list of argument tuples; those are not explained
+            SLOW_QUERIES.record(query, None if method.__name__ == 'executemany' else args, duration, call_site)
+
+    async def execute(self, query, *args, **kwargs):
+        return await self._timed(super().execute, query, *args, **kwargs)
+
+    async def executemany(self, command, args, **kwargs):
+        return await self._timed(super().executemany, command, args, **kwargs)
+
+    async def fetch(self, query, *args, **kwargs):
+        return await self._timed(super().fetch, query, *args, **kwargs)
+
+    async def fetchrow(self, query, *args, **kwargs):
+        return await self._timed(super().fetchrow, query, *args, **kwargs)
+
+    async def fetchval(self, query, *args, **kwargs):
+        return await self._timed(super().fetchval, query, *args, **kwargs)
+
+class InstrumentedSemaphore(asyncio.Semaphore):
+    async def acquire(self):
+        started = time_module.perf_counter()
+        DB_SEMAPHORE_WAITING.inc()
+        try:
+            return await super().acquire()
+        finally:
+            DB_SEMAPHORE_WAITING.dec()
+            waited = time_module.perf_counter() - started
+            DB_SEMAPHORE_WAIT.observe(waited)
+            ADMISSION.observe_wait(waited)
+
 #Global Dictionaries
 user_questions = ThreadSafeDict()
 user_attempts = ThreadSafeDict()
 user_skips = ThreadSafeDict()
-user_last_active = ThreadSafeDict()
 
 CHANNEL_IDS = [int(id.strip()) for id in os.getenv('CHANNEL_ID', '').split(',') if id.strip()]
 
-DB_SEMAPHORE = asyncio.Semaphore(10)  
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', '10'))
+DATABASE_SSL = os.getenv('DATABASE_SSL', 'require')  # 'disable' for a local Postgres
+
+DB_SEMAPHORE = InstrumentedSemaphore(DB_POOL_MAX_SIZE)
 
 user_timers = {}
 
+METRICS.register(Gauge('sql_mentor_active_sessions', 'Users with an active question', lambda: len(user_questions)))
+METRICS.register(Gauge('sql_mentor_active_timers', 'Running question timers',
+                       lambda: sum(1 for timer in user_timers.values() if not timer.done())))
+METRICS.register(Gauge('sql_mentor_db_pool_size', 'Open database connections', lambda: bot.db.get_size()))
+METRICS.register(Gauge('sql_mentor_db_pool_idle', 'Idle database connections', lambda: bot.db.get_idle_size()))
+METRICS.register(Gauge('sql_mentor_db_pool_max', 'Database pool capacity', lambda: bot.db.get_max_size()))
+
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9100'))  # 0 disables the endpoint
+
 ADMIN_IDS = [1235457227733864469]  # Admin user ID
 
+# Leader election: only the instance holding this advisory lock runs scheduled jobs
+LEADER_LOCK_KEY = int(os.getenv('LEADER_LOCK_KEY', '7345901'))
+LEADER_POLL_INTERVAL = float(os.getenv('LEADER_POLL_INTERVAL', '2'))
+INSTANCE_ID = os.getenv('INSTANCE_ID') or f"{socket.gethostname()}:{os.getpid()}"
+
+CLUSTER_IPC_ADDR = os.getenv('CLUSTER_IPC_ADDR')  # host:port of the cluster.py hub
+CLUSTER_WORKER_ID = int(os.getenv('CLUSTER_WORKER_ID', '0'))
+
 def get_ist_time():
     """Get current time in IST"""
     return datetime.now(pytz.UTC).astimezone(pytz.timezone('Asia/Kolkata'))
@@ -80,6 +363,134 @@ def convert_to_ist(dt):
 def similar(a, b):
     return SequenceMatcher(None, a, b).ratio()
 
+SQL_COMMENT = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+SQL_TOKEN = re.compile(r"'(?:[^']|'')*'|\"[^\"]*\"|\d+(?:\.\d+)?|\w+|<>|!=|<=|>=|\|\||::|\S")
+
+SqlFeatures = collections.namedtuple('SqlFeatures', 'text tokens unique bigrams chars')
+
+class SimilarityEngine:
+    """SQL similarity on hashed token arrays.
+
+    Token overlap and character-histogram bounds are computed with NumPy; the
+    quadratic SequenceMatcher only runs when those bounds cannot decide the
+    verdict. Encoded queries are cached, so reference answers are tokenized once.
+    """
+
+    def __init__(self, accept_overlap=0.9, max_ratio_chars=4000, cache_size=4096):
+        self.accept_overlap = accept_overlap
+        self.max_ratio_chars = max_ratio_chars
+        self.encode = functools.lru_cache(maxsize=cache_size)(self._encode)
+
+    def _encode(self, sql):
+        text = ' '.join(SQL_COMMENT.sub(' ', sql).lower().split()).rstrip(';').rstrip()
+        tokens = SQL_TOKEN.findall(text)
+        ids = np.fromiter((hash(token) for token in tokens), dtype=np.int64, count=len(tokens))
+        unique = np.unique(ids)
+        bigrams = np.unique(ids[:-1] * 1000003 ^ ids[1:]) if len(ids) > 1 else unique
+        chars = np.bincount(np.frombuffer(text.encode(), dtype=np.uint8), minlength=128) if text.isascii() else None
+        return SqlFeatures(text, ids, unique, bigrams, chars)
+
+    def structure(self, a, b):
+        # Same measure as the old compare_sql_structures: shared distinct tokens over the longer stream
+        common = np.intersect1d(a.unique, b.unique, assume_unique=True).size
+        return common / max(a.tokens.size, b.tokens.size, 1)
+
+    def overlap(self, a, b):
+        union = np.union1d(a.bigrams, b.bigrams).size
+        return np.intersect1d(a.bigrams, b.bigrams, assume_unique=True).size / union if union else 1.0
+
+    def ratio_bound(self, a, b):
+        # Upper bounds on SequenceMatcher.ratio(): length, then shared character counts
+        total = len(a.text) + len(b.text)
+        if not total:
+            return 1.0
+        bound = 2 * min(len(a.text), len(b.text)) / total
+        if a.chars is not None and b.chars is not None:
+            bound = min(bound, 2 * np.minimum(a.chars, b.chars).sum() / total)
+        return float(bound)
+
+    def ratio(self, a, b):
+        if len(a.text) + len(b.text) > self.max_ratio_chars:
+            # Token streams are several times shorter than the text they came from
+            return SequenceMatcher(None, a.tokens.tolist(), b.tokens.tolist(), autojunk=False).ratio()
+        return SequenceMatcher(None, a.text, b.text).ratio()
+
+    def score(self, answer, reference, threshold=0.5):
+        """Average of structure and string similarity, as check_answer has always graded.
+
+        Returns (score, bounded). When bounded is True the score is only an upper
+        bound, known to be below the threshold, and not the exact similarity.
+        """
+        a, b = self.encode(answer), self.encode(reference)
+        if a.text == b.text:
+            return 1.0, False
+        structure = self.structure(a, b)
+        needed = 2 * threshold - structure
+        bound = self.ratio_bound(a, b)
+        if bound < needed:
+            return (structure + bound) / 2, True
+        overlap = self.overlap(a, b)
+        if structure >= self.accept_overlap and overlap >= self.accept_overlap:
+            return (structure + overlap) / 2, False
+        return (structure + self.ratio(a, b)) / 2, False
+
+SIMILARITY = SimilarityEngine()
+
+# Words that can follow an expression without being an alias for it
+SQL_RESERVED = frozenset("""
+    select from where join left right inner outer full cross natural on using group by order having limit
+    offset fetch union intersect except all distinct and or not in is null like ilike between exists case
+    when then else end as asc desc nulls first last over partition rows range window with recursive
+    values insert into update set delete returning lateral filter within interval
+    int integer bigint smallint numeric decimal real float double precision text varchar char date
+    time timestamp timestamptz boolean bool json jsonb
+""".split())
+SQL_IDENTIFIER = re.compile(r'[a-z_]\w*')
+
+@functools.lru_cache(maxsize=4096)
+def canonicalize_sql(sql):
+    """Comment-, whitespace- and case-free token stream with aliases renamed in order of definition."""
+    tokens = SQL_TOKEN.findall(' '.join(SQL_COMMENT.sub(' ', sql).lower().split()).rstrip(';').rstrip())
+    aliases = {}
+    for i, token in enumerate(tokens[1:], 1):
+        if token in SQL_RESERVED or token in aliases or not SQL_IDENTIFIER.fullmatch(token):
+            continue
+        previous = tokens[i - 1]
+        # "expr AS alias", "table alias", "(subquery) alias", "SUM(x) alias"
+        if previous == 'as' or previous == ')' or (SQL_IDENTIFIER.fullmatch(previous) and previous not in SQL_RESERVED):
+            aliases[token] = f"_a{len(aliases) + 1}"
+    return ' '.join(aliases.get(token, token) for token in tokens)
+
+def sql_fingerprint(sql):
+    return hashlib.blake2b(canonicalize_sql(sql).encode(), digest_size=16).hexdigest()
+
+class LRUCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = collections.OrderedDict()
+
+    def get(self, key, default=None):
+        if key not in self._data:
+            return default
+        self._data.move_to_end(key)
+        return self._data[key]
+
+    def put(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        return self._data.pop(key, default)
+
+    def __len__(self):
+        return len(self._data)
+
+GRADE_MEMO = LRUCache(int(os.getenv('GRADE_MEMO_SIZE', '10000')))
+GRADE_MEMO_LOOKUPS = METRICS.register(Counter('sql_mentor_grade_memo_lookups_total', 'Grade memo lookups', labels=('result',)))
+METRICS.register(Gauge('sql_mentor_grade_memo_entries', 'Cached verdicts', lambda: len(GRADE_MEMO)))
+
 def create_discord_table(headers, data):
     table = "| " + " | ".join(headers) + " |\n"
     table += "|" + "|".join(["---" for _ in headers]) + "|\n"
@@ -87,6 +498,141 @@ def create_discord_table(headers, data):
         table += "| " + " | ".join(str(item) for item in row) + " |\n"
     return f"```\n{table}\n```"
 
+def keyset_fetcher(query, key_columns, params=(), descending=False):
+    """Build a page fetcher for KeysetPaginator.
+
+    `query` is a SELECT ending in a WHERE clause; the seek condition on
+    `key_columns` (which must be unique together) and the ORDER BY/LIMIT are
+    appended, so every page is an index range scan no matter how deep it is.
+    """
+    columns = ', '.join(key_columns)
+
+    async def fetch(direction, cursor, limit):
+        forward = direction == 'next'
+        op, order = ('<', 'DESC') if forward == descending else ('>', 'ASC')
+        args = list(params)
+        sql = query
+        if cursor is not None:
+            placeholders = ', '.join(f'${len(args) + i + 1}' for i in range(len(key_columns)))
+            sql += f" AND ({columns}) {op} ({placeholders})"
+            args.extend(cursor)
+        sql += " ORDER BY " + ', '.join(f"{column} {order}" for column in key_columns)
+        sql += f" LIMIT ${len(args) + 1}"
+        args.append(limit)
+
+        async with DB_SEMAPHORE:
+            async with bot.db.acquire() as conn:
+                rows = await conn.fetch(sql, *args)
+        return rows if forward else list(reversed(rows))
+
+    return fetch
+
+class KeysetPaginator(discord.ui.View):
+    """Previous/next buttons over a keyset query.
+
+    Only the visible page is fetched (plus one row to know whether another page
+    follows); adjacent pages are prefetched and cached for `cache_ttl` seconds.
+    """
+
+    def __init__(self, author_id, fetch_page, render, key_columns, page_size=10, cache_ttl=30, timeout=180):
+        super().__init__(timeout=timeout)
+        self.author_id = author_id
+        self.fetch_page = fetch_page
+        self.render = render
+        self.key_columns = key_columns
+        self.page_size = page_size
+        self.cache_ttl = cache_ttl
+        self.rows = []
+        self.page_index = 0
+        self.has_next = False
+        self.message = None
+        self._cache = {}
+        self._prefetches = set()
+
+    async def start(self, ctx):
+        rows = await self._load('next', None)
+        if not rows:
+            return False
+        self._show(rows[:self.page_size], 0, len(rows) > self.page_size)
+        self.message = await ctx.send(self.render(self.rows, self.page_index), view=self)
+        self._prefetch()
+        return True
+
+    def _cursor(self, row):
+        return tuple(row[column] for column in self.key_columns)
+
+    async def _load(self, direction, cursor):
+        key = (direction, cursor)
+        cached = self._cache.get(key)
+        if cached and cached[0] > time_module.monotonic():
+            return cached[1]
+        rows = await self.fetch_page(direction, cursor, self.page_size + 1)
+        self._cache[key] = (time_module.monotonic() + self.cache_ttl, rows)
+        return rows
+
+    def _prefetch(self):
+        async def warm():
+            try:
+                if self.has_next:
+                    await self._load('next', self._cursor(self.rows[-1]))
+                if self.page_index > 0:
+                    await self._load('prev', self._cursor(self.rows[0]))
+            except Exception as e:
+                logging.warning(f"Page prefetch failed: {e}")
+        # The loop only keeps weak references to tasks
+        task = asyncio.create_task(warm())
+        self._prefetches.add(task)
+        task.add_done_callback(self._prefetches.discard)
+
+    def _show(self, rows, page_index, has_next):
+        self.rows = rows
+        self.page_index = page_index
+        self.has_next = has_next
+        self.previous_page.disabled = page_index == 0
+        self.next_page.disabled = not has_next
+
+    async def interaction_check(self, interaction):
+        if interaction.user.id != self.author_id:
+            await interaction.response.send_message("These buttons belong to someone else's listing.", ephemeral=True)
+            return False
+        return True
+
+    @discord.ui.button(label='◀ Previous', style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction, button):
+        rows = await self._load('prev', self._cursor(self.rows[0]))
+        if rows and self.page_index > 1:
+            self._show(rows[-self.page_size:], self.page_index - 1, True)
+        else:
+            # Back to the first page (also covers rows deleted since we paged past them)
+            rows = await self._load('next', None)
+            self._show(rows[:self.page_size], 0, len(rows) > self.page_size)
+        await interaction.response.edit_message(content=self.render(self.rows, self.page_index), view=self)
+        self._prefetch()
+
+    @discord.ui.button(label='Next ▶', style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction, button):
+        rows = await self._load('next', self._cursor(self.rows[-1]))
+        if rows:
+            self._show(rows[:self.page_size], self.page_index + 1, len(rows) > self.page_size)
+        else:
+            self._show(self.rows, self.page_index, False)
+        await interaction.response.edit_message(content=self.render(self.rows, self.page_index), view=self)
+        self._prefetch()
+
+    async def on_timeout(self):
+        self._cache.clear()
+        if self.message:
+            self.previous_page.disabled = True
+            self.next_page.disabled = True
+            try:
+                await self.message.edit(view=self)
+            except discord.HTTPException:
+                pass
+
+def truncate(text, length):
+    text = str(text)
+    return text if len(text) <= length else text[:length - 1] + '…'
+
 async def create_db_pool():
     try:
         database_url = os.getenv('DATABASE_URL')
@@ -95,13 +641,443 @@ async def create_db_pool():
         
         logging.info("Attempting to connect to database using DATABASE_URL")
         
-        bot.db = await asyncpg.create_pool(database_url, min_size=1, max_size=10, ssl='require')
+        bot.db = await asyncpg.create_pool(database_url, min_size=1, max_size=DB_POOL_MAX_SIZE, ssl=DATABASE_SSL,
+                                           connection_class=InstrumentedConnection)
         logging.info("Database connection pool established")
     except Exception as e:
         logging.error(f"Failed to connect to the database: {e}")
         raise
 
-def retry_on_failure(max_retries=3, delay=1):
+class LeaderElector:
+    """Runs scheduled jobs on exactly one instance using a Postgres advisory lock.
+
+    The lock lives on a dedicated connection, so it is released as soon as the
+    leader's session dies. Every election bumps a fencing token in leader_lease;
+    jobs call holds_fence() inside their write transaction so a stale leader
+    can never overwrite the work of its successor. Broadcasts go out only
+    after that transaction commits; jobs that only broadcast call confirm().
+    """
+
+    def __init__(self, lock_key, jobs, poll_interval=2):
+        self.lock_key = lock_key
+        self.jobs = jobs
+        self.poll_interval = poll_interval
+        self.conn = None
+        self.token = None
+        self._task = None
+
+    @property
+    def is_leader(self):
+        return self.token is not None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._step_down()
+        await self._close()
+
+    async def holds_fence(self, conn):
+        """Check the fencing token from within the caller's transaction."""
+        if self.token is None:
+            return False
+        current = await conn.fetchval('''
+            SELECT token FROM leader_lease WHERE lock_key = $1 FOR SHARE
+        ''', self.lock_key)
+        if current != self.token:
+            logging.warning(f"Fencing token {self.token} is stale (current: {current}), stepping down")
+            self._step_down()
+            return False
+        return True
+
+    async def confirm(self):
+        """Fence check for jobs whose only side effect is a broadcast, right before sending it."""
+        async with DB_SEMAPHORE:
+            async with bot.db.acquire() as conn:
+                return await self.holds_fence(conn)
+
+    async def _connect(self):
+        # Keepalives let the server drop a dead leader's session (and its lock) within seconds
+        self.conn = await asyncpg.connect(
+            os.getenv('DATABASE_URL'), ssl=DATABASE_SSL,
+            server_settings={
+                'application_name': f'sql-mentor-leader:{INSTANCE_ID}',
+                'tcp_keepalives_idle': '5',
+                'tcp_keepalives_interval': '2',
+                'tcp_keepalives_count': '3',
+            })
+
+    async def _close(self):
+        if self.conn is not None and not self.conn.is_closed():
+            try:
+                await self.conn.close(timeout=5)
+            except Exception:
+                self.conn.terminate()
+        self.conn = None
+
+    async def _run(self):
+        while True:
+            try:
+                if self.conn is None or self.conn.is_closed():
+                    self._step_down()
+                    await self._connect()
+
+                if self.is_leader:
+                    # Heartbeat: losing the session means losing the lock
+                    await self.conn.fetchval('SELECT 1', timeout=self.poll_interval)
+                elif await self.conn.fetchval('SELECT pg_try_advisory_lock($1)', self.lock_key):
+                    self.token = await self.conn.fetchval('''
+                        INSERT INTO leader_lease (lock_key, token, holder, acquired_at)
+                        VALUES ($1, 1, $2, NOW())
+                        ON CONFLICT (lock_key) DO UPDATE
+                        SET token = leader_lease.token + 1, holder = $2, acquired_at = NOW()
+                        RETURNING token
+                    ''', self.lock_key, INSTANCE_ID)
+                    logging.info(f"Instance {INSTANCE_ID} became leader with fencing token {self.token}")
+                    self._start_jobs()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Leader election error on {INSTANCE_ID}: {e}")
+                self._step_down()
+                await self._close()
+            await asyncio.sleep(self.poll_interval)
+
+    def _start_jobs(self):
+        for job in self.jobs:
+            if not job.is_running():
+                job.start()
+
+    def _step_down(self):
+        if self.token is None:
+            return
+        logging.warning(f"Instance {INSTANCE_ID} lost leadership (token {self.token}), stopping scheduled jobs")
+        self.token = None
+        for job in self.jobs:
+            job.cancel()
+
+class ClusterBus:
+    """Client for the newline-delimited JSON hub run by cluster.py.
+
+    publish() fans an event out to every worker, including this one.
+    request() asks all other workers and resolves with the first non-null reply.
+    A dropped connection is re-established with backoff; until then publish()
+    raises ConnectionError and request() returns None.
+    """
+
+    def __init__(self, address, worker_id):
+        host, port = address.rsplit(':', 1)
+        self.host = host
+        self.port = int(port)
+        self.worker_id = worker_id
+        self.writer = None
+        self._listeners = {}
+        self._handlers = {}
+        self._pending = {}
+        self._ids = itertools.count(1)
+        self._send_lock = asyncio.Lock()
+        self._task = None
+        self._tasks = set()
+
+    def on(self, topic, coro):
+        self._listeners[topic] = coro
+
+    def handle(self, topic, coro):
+        self._handlers[topic] = coro
+
+    async def connect(self):
+        reader = await self._open()
+        self._task = asyncio.create_task(self._run(reader))
+
+    async def _open(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port, limit=16 * 1024 * 1024)
+        # hello goes out before anything else queued on the send lock
+        async with self._send_lock:
+            writer.write(self._encode({'op': 'hello', 'worker': self.worker_id}))
+            await writer.drain()
+            self.writer = writer
+        logging.info(f"Worker {self.worker_id} connected to cluster hub at {self.host}:{self.port}")
+        return reader
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+        if self.writer:
+            self.writer.close()
+
+    async def publish(self, topic, payload):
+        await self._send({'op': 'publish', 'topic': topic, 'payload': payload})
+
+    async def request(self, topic, payload, timeout=2):
+        request_id = f"{self.worker_id}:{next(self._ids)}"
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            await self._send({'op': 'request', 'id': request_id, 'topic': topic, 'payload': payload})
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Cluster request {topic} timed out after {timeout}s")
+            return None
+        except ConnectionError as e:
+            logging.warning(f"Cluster request {topic} failed: {e}")
+            return None
+        finally:
+            self._pending.pop(request_id, None)
+
+    @staticmethod
+    def _encode(message):
+        return json.dumps(message, default=str).encode() + b'\n'
+
+    async def _send(self, message):
+        async with self._send_lock:
+            if self.writer is None:
+                raise ConnectionError("not connected to the cluster hub")
+            self.writer.write(self._encode(message))
+            await self.writer.drain()
+
+    def _spawn(self, coro):
+        # The loop only keeps weak references to tasks
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, reader):
+        while True:
+            try:
+                await self._read_loop(reader)
+                logging.error("Cluster hub closed the connection")
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                logging.error(f"Lost the cluster hub connection: {e}")
+            self._disconnected()
+            reader = await self._reconnect()
+
+    def _disconnected(self):
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+        # Their replies went down with the connection
+        for future in self._pending.values():
+            if not future.done():
+                future.set_result(None)
+
+    async def _reconnect(self):
+        for attempt in itertools.count():
+            await asyncio.sleep(min(2 ** attempt, 30) * random.uniform(0.5, 1.5))
+            try:
+                return await self._open()
+            except OSError as e:
+                logging.warning(f"Reconnecting to the cluster hub failed (attempt {attempt + 1}): {e}")
+
+    async def _read_loop(self, reader):
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            message = json.loads(line)
+            op = message.get('op')
+            if op == 'event':
+                listener = self._listeners.get(message['topic'])
+                if listener:
+                    self._spawn(self._run_listener(listener, message))
+            elif op == 'request':
+                self._spawn(self._answer(message))
+            elif op == 'reply':
+                future = self._pending.get(message['id'])
+                if future and not future.done():
+                    future.set_result(message.get('payload'))
+
+    async def _run_listener(self, listener, message):
+        try:
+            await listener(message['payload'])
+        except Exception as e:
+            logging.error(f"Error handling cluster event {message['topic']}: {e}", exc_info=True)
+
+    async def _answer(self, message):
+        payload = None
+        handler = self._handlers.get(message['topic'])
+        try:
+            if handler:
+                payload = await handler(message['payload'])
+        except Exception as e:
+            logging.error(f"Error handling cluster request {message['topic']}: {e}", exc_info=True)
+        try:
+            await self._send({'op': 'reply', 'id': message['id'], 'payload': payload})
+        except ConnectionError as e:
+            logging.warning(f"Could not reply to cluster request {message['topic']}: {e}")
+
+CLUSTER_BUS = ClusterBus(CLUSTER_IPC_ADDR, CLUSTER_WORKER_ID) if CLUSTER_IPC_ADDR else None
+
+DISCORD_MESSAGE_LIMIT = 2000
+
+BroadcastResult = collections.namedtuple('BroadcastResult', ['channel_id', 'ok', 'messages_sent', 'error'])
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time_module.monotonic()
+
+    def _refill(self):
+        now = time_module.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, cost=1):
+        self._refill()
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return True
+        return False
+
+    async def acquire(self, cost=1):
+        while not self.try_acquire(cost):
+            await asyncio.sleep((cost - self.tokens) / self.rate)
+
+    def take(self, cost, force=False):
+        """Spend cost tokens and return 0, or return the seconds until they are available.
+
+        force always spends, going into debt, so priority traffic still slows everyone else down.
+        """
+        self._refill()
+        if self.tokens >= cost or force:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+def split_message(message, limit=DISCORD_MESSAGE_LIMIT):
+    """Split a message on line boundaries, closing and reopening code blocks cut in half."""
+    if len(message) <= limit:
+        return [message]
+
+    closing = '\n```'
+    chunks = []
+    current = ''
+    fence = None  # opening line of the code block we are inside, e.g. "```sql"
+    for line in message.splitlines(keepends=True):
+        stripped = line.strip()
+        while len(current) + len(line) + len(closing) > limit:
+            reopen = fence + '\n' if fence else ''
+            if len(reopen) + len(line) + len(closing) > limit:
+                # Too long for any chunk: fill this one and carry the rest over
+                room = limit - len(closing) - len(current)
+                current, line = current + line[:room], line[room:]
+            chunks.append(current.rstrip('\n') + closing if fence else current)
+            current = reopen
+        current += line
+        if stripped.count('```') % 2:
+            fence = None if fence else stripped
+    if current.strip():
+        chunks.append(current)
+    return chunks
+
+class BroadcastDispatcher:
+    """Sends a message to many channels concurrently.
+
+    Each channel gets its own token bucket (Discord allows 5 messages per 5s per
+    channel) on top of a global bucket, transient failures are retried with
+    jittered backoff, and the caller gets one BroadcastResult per channel.
+    """
+
+    def __init__(self, resolve_channel, channel_rate=1.0, channel_burst=5, global_rate=45,
+                 max_retries=3, concurrency=25):
+        self.resolve_channel = resolve_channel
+        self.channel_rate = channel_rate
+        self.channel_burst = channel_burst
+        self.max_retries = max_retries
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.channel_buckets = {}
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def broadcast(self, channel_ids, message):
+        chunks = split_message(message)
+        results = await asyncio.gather(*(self._deliver(channel_id, chunks) for channel_id in channel_ids))
+        for result in results:
+            if not result.ok:
+                logging.warning(f"Broadcast to channel {result.channel_id} failed after {result.messages_sent} message(s): {result.error}")
+        return results
+
+    async def _deliver(self, channel_id, chunks):
+        channel = self.resolve_channel(channel_id)
+        if channel is None:
+            return BroadcastResult(channel_id, False, 0, 'channel not found')
+
+        bucket = self.channel_buckets.get(channel_id)
+        if bucket is None:
+            bucket = self.channel_buckets[channel_id] = TokenBucket(self.channel_rate, self.channel_burst)
+
+        sent = 0
+        for chunk in chunks:  # chunks of one message stay in order within a channel
+            for attempt in range(self.max_retries + 1):
+                await bucket.acquire()
+                await self.global_bucket.acquire()
+                try:
+                    async with self._semaphore:
+                        await channel.send(chunk)
+                    sent += 1
+                    break
+                except discord.HTTPException as e:
+                    if e.status < 500 and e.status != 429 or attempt == self.max_retries:
+                        return BroadcastResult(channel_id, False, sent, f"{e.status} {e.text}")
+                except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+                    if attempt == self.max_retries:
+                        return BroadcastResult(channel_id, False, sent, repr(e))
+                await asyncio.sleep(min(2 ** attempt, 30) * random.uniform(0.5, 1.5))
+        return BroadcastResult(channel_id, True, sent, None)
+
+BROADCASTER = BroadcastDispatcher(lambda channel_id: bot.get_channel(channel_id))
+
+async def send_to_local_channels(message):
+    channel_ids = CHANNEL_IDS
+    if CLUSTER_BUS:
+        # In a cluster, channels on other workers' shards are delivered by those workers
+        channel_ids = [channel_id for channel_id in CHANNEL_IDS if bot.get_channel(channel_id)]
+    return await BROADCASTER.broadcast(channel_ids, message)
+
+async def broadcast_to_channels(message):
+    """Send a message to every CHANNEL_ID. Returns per-channel results (None when relayed to the cluster)."""
+    if CLUSTER_BUS:
+        await CLUSTER_BUS.publish('broadcast', {'message': message})
+        return None
+    return await send_to_local_channels(message)
+
+async def get_user_question(user_id):
+    """Return the user's active question, claiming it from another worker if needed."""
+    question = await user_questions.get(user_id)
+    if question or not CLUSTER_BUS:
+        return question
+
+    session = await CLUSTER_BUS.request('session_take', {'user_id': user_id})
+    if not session:
+        return None
+    await user_questions.set(user_id, session['question'])
+    await user_attempts.set(user_id, session['attempts'])
+    return session['question']
+
+async def connect_cluster_bus():
+    CLUSTER_BUS.on('broadcast', lambda payload: send_to_local_channels(payload['message']))
+    CLUSTER_BUS.handle('session_take', take_local_session)
+    CLUSTER_BUS.handle('challenge_drain', drain_local_challenge)
+    await CLUSTER_BUS.connect()
+
+async def take_local_session(payload):
+    user_id = payload['user_id']
+    question = await user_questions.pop(user_id, None)
+    if question is None:
+        return None
+    attempts = await user_attempts.pop(user_id, 0)
+    if user_id in user_timers:
+        user_timers.pop(user_id).cancel()
+    return {'question': dict(question), 'attempts': attempts}
+
+def retry_on_failure(max_retries=3, delay=1, max_delay=8):
     def decorator(func):
         @functools.wraps(func)
         async def wrapper(*args, **kwargs):
@@ -111,8 +1087,10 @@ def retry_on_failure(max_retries=3, delay=1):
                 except (asyncpg.InterfaceError, asyncio.TimeoutError) as e:
                     if attempt == max_retries - 1:
                         raise
-                    logging.warning(f"Database operation failed, retrying in {delay} seconds...")
-                    await asyncio.sleep(delay)
+                    # Full jitter: callers that failed together must not retry together
+                    backoff = random.uniform(0, min(max_delay, delay * 2 ** attempt))
+                    logging.warning(f"Database operation failed, retrying in {backoff:.2f} seconds...")
+                    await asyncio.sleep(backoff)
             return await func(*args, **kwargs)
         return wrapper
     return decorator
@@ -120,13 +1098,8 @@ def retry_on_failure(max_retries=3, delay=1):
 @retry_on_failure()
 async def ensure_user_exists(user_id, username):
     try:
-        async with DB_SEMAPHORE:
-            async with bot.db.acquire() as conn:
-                await conn.execute('''
-                    INSERT INTO users (user_id, username)
-                    VALUES ($1, $2)
-                    ON CONFLICT (user_id) DO UPDATE SET username = $2
-                ''', user_id, username)
+        # The users row is written in the background, and only for new users and renames
+        return await PROFILES.get(user_id, username)
     except Exception as e:
         logging.error(f"Error ensuring user exists: {e}")
         raise
@@ -144,23 +1117,138 @@ async def get_user_stats(user_id):
             ''', user_id)
     return stats
 
+QUESTION_CACHE_SIZE = int(os.getenv('QUESTION_CACHE_SIZE', '500'))
+CATALOG_REFRESH_SECONDS = int(os.getenv('CATALOG_REFRESH_SECONDS', '300'))
+DATASET_INLINE_CHARS = int(os.getenv('DATASET_INLINE_CHARS', '1200'))
+DATASET_COMPRESS_CHARS = int(os.getenv('DATASET_COMPRESS_CHARS', '4096'))
+
+def unpack_datasets(row):
+    # !compact_datasets moves large datasets into datasets_gz and clears datasets,
+    # so a non-null datasets is a later direct edit and wins over the compressed copy
+    if row['datasets'] is not None:
+        return row['datasets']
+    if row['datasets_gz'] is not None:
+        return zlib.decompress(row['datasets_gz']).decode()
+    return None
+
+class QuestionCatalog:
+    """Slim (id, difficulty, topic, company) rows for every question, kept in memory.
+
+    Selection and filtering run against these. The heavy text columns are
+    fetched by id on first use and kept in an LRU of cache_size questions.
+    The slim rows are reloaded every refresh_interval; cached texts are kept
+    unless their row's version (xmin) changed, so edits made directly in the
+    database show up without a restart.
+    """
+
+    def __init__(self, cache_size, refresh_interval):
+        self.rows = {}
+        self.texts = LRUCache(cache_size)
+        self.refresh_interval = refresh_interval
+        self._task = None
+
+    async def load(self):
+        try:
+            async with DB_SEMAPHORE:
+                async with bot.db.acquire() as conn:
+                    rows = await conn.fetch('SELECT id, difficulty, topic, company, xmin::text AS version FROM questions')
+        except Exception as e:
+            logging.error(f"Error loading the question catalog: {e}")
+            return
+        versions = {row['id']: row['version'] for row in rows}
+        self.rows = {row['id']: {column: row[column] for column in ('id', 'difficulty', 'topic', 'company')} for row in rows}
+        # Every UPDATE gives the row a new xmin: drop deleted and edited questions only
+        stale = [question_id for question_id, (version, _) in self.texts._data.items() if versions.get(question_id) != version]
+        for question_id in stale:
+            self.texts.pop(question_id)
+        logging.info(f"Loaded {len(self.rows)} questions into the catalog, {len(stale)} cached texts changed")
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            await self.load()
+
+    async def select(self, exclude=(), **filters):
+        """Slim rows matching every filter given as a value (None means any), minus the ids in exclude."""
+        if not self.rows:
+            await self.load()
+        filters = {column: value for column, value in filters.items() if value is not None}
+        return [row for question_id, row in self.rows.items()
+                if question_id not in exclude and all(row[column] == value for column, value in filters.items())]
+
+    async def get(self, question_id, conn=None):
+        return (await self.get_many([question_id], conn)).get(question_id)
+
+    async def get_many(self, question_ids, conn=None):
+        """Full question dicts by id; ids that do not exist are left out."""
+        found = {}
+        missing = []
+        for question_id in question_ids:
+            cached = self.texts.get(question_id)
+            if cached is None:
+                missing.append(question_id)
+            else:
+                QUESTION_TEXT_LOOKUPS.inc('hit')
+                found[question_id] = cached[1]
+        if missing:
+            QUESTION_TEXT_LOOKUPS.inc('miss', amount=len(missing))
+            query = '''
+                SELECT id, difficulty, topic, company, question, answer, hint, datasets, datasets_gz,
+                       xmin::text AS version
+                FROM questions
+                WHERE id = ANY($1::INT[])
+            '''
+            if conn is None:
+                async with DB_SEMAPHORE:
+                    async with bot.db.acquire() as conn:
+                        rows = await conn.fetch(query, missing)
+            else:
+                rows = await conn.fetch(query, missing)
+            for row in rows:
+                question = {column: row[column] for column in ('id', 'difficulty', 'topic', 'company',
+                                                               'question', 'answer', 'hint')}
+                question['datasets'] = unpack_datasets(row)
+                # Questions added since the last load are picked up here
+                self.rows[row['id']] = {column: row[column] for column in ('id', 'difficulty', 'topic', 'company')}
+                self.texts.put(row['id'], (row['version'], question))
+                found[row['id']] = question
+        # Copies: sessions add their own keys; the text values are shared with the cache
+        return {question_id: dict(question) for question_id, question in found.items()}
+
+QUESTIONS = QuestionCatalog(QUESTION_CACHE_SIZE, CATALOG_REFRESH_SECONDS)
+QUESTION_TEXT_LOOKUPS = METRICS.register(Counter('sql_mentor_question_text_lookups_total',
+                                                 'Question text cache lookups', labels=('result',)))
+METRICS.register(Gauge('sql_mentor_question_catalog_rows', 'Questions in the slim catalog', lambda: len(QUESTIONS.rows)))
+
+async def get_solved_question_ids(user_id, conn=None):
+    query = '''
+        SELECT DISTINCT question_id FROM user_submissions
+        WHERE user_id = $1 AND is_correct = TRUE
+    '''
+    if conn is None:
+        async with DB_SEMAPHORE:
+            async with bot.db.acquire() as conn:
+                rows = await conn.fetch(query, user_id)
+    else:
+        rows = await conn.fetch(query, user_id)
+    return {row['question_id'] for row in rows}
+
 async def get_question(difficulty=None, user_id=None, topic=None, company=None):
     try:
         logging.info(f"Fetching question for user_id: {user_id}, difficulty: {difficulty}, topic: {topic}, company: {company}")
-        async with DB_SEMAPHORE:
-            async with bot.db.acquire() as conn:
-                query = '''
-                    SELECT q.* FROM questions q
-                    LEFT JOIN user_submissions us ON q.id = us.question_id AND us.user_id = $1
-                    WHERE (us.question_id IS NULL OR us.is_correct = FALSE)
-                    AND ($2::VARCHAR IS NULL OR q.difficulty = $2::VARCHAR)
-                    AND ($3::VARCHAR IS NULL OR q.topic = $3::VARCHAR)
-                    AND ($4::VARCHAR IS NULL OR q.company = $4::VARCHAR)
-                    ORDER BY RANDOM() LIMIT 1
-                '''
-                logging.info(f"Executing query: {query}")
-                question = await conn.fetchrow(query, user_id, difficulty, topic, company)
-        logging.info(f"Fetched question: {question}")
+        solved = await get_solved_question_ids(user_id) if user_id else set()
+        candidates = await QUESTIONS.select(exclude=solved, difficulty=difficulty, topic=topic, company=company)
+        if not candidates:
+            return None
+        question = await QUESTIONS.get(random.choice(candidates)['id'])
+        logging.info(f"Fetched question: {question['id'] if question else None}")
         return question
     except Exception as e:
         logging.error(f"Error fetching question: {e}")
@@ -168,14 +1256,7 @@ async def get_question(difficulty=None, user_id=None, topic=None, company=None):
 
 async def get_question_by_id(question_id):
     try:
-        async with DB_SEMAPHORE:
-            async with bot.db.acquire() as conn:
-                query = '''
-                    SELECT * FROM questions
-                    WHERE id = $1
-                '''
-                question = await conn.fetchrow(query, question_id)
-        return question
+        return await QUESTIONS.get(question_id)
     except Exception as e:
         logging.error(f"Error fetching question by ID: {e}")
         return None
@@ -214,19 +1295,441 @@ async def get_weekly_points(user_id):
         logging.error(f"Error getting weekly points: {e}")
         return 0
 
-async def get_daily_points(user_id, date):
-    try:
+class DailyCounterStore:
+    """Per-user submission counters for the current IST day.
+
+    A user is seeded from user_submissions the first time they are looked up
+    on a given day; update_user_stats keeps the counters current after that.
+
+    The counters are per process: after seeding, a worker never sees submissions
+    made through another one, so under cluster.py a user active in guilds on
+    different workers' shards gets the daily limit once per worker.
+    """
+
+    def __init__(self):
+        self.day = None
+        self.counters = {}
+        self.seeding = {}
+
+    def roll_over(self, day):
+        if day != self.day:
+            self.day = day
+            self.counters.clear()
+            self.seeding.clear()
+
+    @staticmethod
+    def day_bounds(day):
+        # submitted_at is naive UTC; compare against the IST day's UTC range so the index is usable
+        ist = pytz.timezone('Asia/Kolkata')
+        start = ist.localize(datetime.combine(day, time.min)).astimezone(pytz.UTC).replace(tzinfo=None)
+        return start, start + timedelta(days=1)
+
+    async def get(self, user_id):
+        day = get_ist_time().date()
+        self.roll_over(day)
+        counts = self.counters.get(user_id)
+        if counts is not None:
+            return counts
+        future = self.seeding.get(user_id)
+        if future is None:
+            future = self.claim(user_id)
+            asyncio.ensure_future(self._fill(user_id, day, future))
+        counts = await asyncio.shield(future)
+        return counts or self.empty()
+
+    def claim(self, user_id):
+        """Mark user_id as being seeded; whoever holds the future must pass it to resolve()."""
+        future = asyncio.get_running_loop().create_future()
+        self.seeding[user_id] = future
+        return future
+
+    def resolve(self, user_id, future, counts):
+        # A submission recorded (or a rollover) while the seed was running drops the claim;
+        # waiters still get the counts, and the next lookup reseeds
+        if self.seeding.get(user_id) is future:
+            del self.seeding[user_id]
+            if counts is not None:
+                self.counters[user_id] = counts
+        if not future.done():
+            future.set_result(counts)
+
+    async def _fill(self, user_id, day, future):
+        counts = None
+        try:
+            counts = await self._seed(user_id, day)
+        finally:
+            self.resolve(user_id, future, counts)
+
+    async def _seed(self, user_id, day):
+        start, end = self.day_bounds(day)
+        try:
+            async with DB_SEMAPHORE:
+                async with bot.db.acquire() as conn:
+                    row = await conn.fetchrow('''
+                        SELECT COUNT(*) AS attempts,
+                               COUNT(*) FILTER (WHERE is_correct) AS correct,
+                               COALESCE(SUM(points), 0) AS points,
+                               ARRAY_REMOVE(ARRAY_AGG(DISTINCT question_id), NULL) AS questions
+                        FROM user_submissions
+                        WHERE user_id = $1 AND submitted_at >= $2 AND submitted_at < $3
+                    ''', user_id, start, end)
+            return self.from_row(row)
+        except Exception as e:
+            logging.error(f"Error seeding daily counters for user {user_id}: {e}")
+            return None
+
+    @staticmethod
+    def from_row(row):
+        return {'attempts': row['attempts'], 'correct': row['correct'],
+                'points': row['points'], 'questions': set(row['questions'])}
+
+    def record(self, user_id, question_id, is_correct, points):
+        if get_ist_time().date() != self.day:
+            return
+        counts = self.counters.get(user_id)
+        if counts is None:
+            self.seeding.pop(user_id, None)
+            return
+        counts['attempts'] += 1
+        counts['correct'] += bool(is_correct)
+        counts['points'] += points
+        counts['questions'].add(question_id)
+
+    @staticmethod
+    def empty():
+        return {'attempts': 0, 'correct': 0, 'points': 0, 'questions': set()}
+
+DAILY_COUNTERS = DailyCounterStore()
+
+class KnownUsers:
+    """Last written username per user, warmed from the users table at startup.
+
+    observe() never touches the database: new users and renames are queued
+    and upserted in batches by a background task.
+    """
+
+    def __init__(self, flush_interval=1.0, batch_size=1000):
+        self.usernames = {}
+        self.pending = {}
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._task = None
+
+    async def warm(self):
+        try:
+            async with DB_SEMAPHORE:
+                async with bot.db.acquire() as conn:
+                    rows = await conn.fetch('SELECT user_id, username FROM users')
+            self.usernames.update((row['user_id'], row['username']) for row in rows)
+            logging.info(f"Loaded {len(rows)} known users")
+        except Exception as e:
+            # An empty registry only costs one queued upsert per user
+            logging.error(f"Error loading known users: {e}")
+
+    def observe(self, user_id, username):
+        if self.usernames.get(user_id) != username:
+            self.usernames[user_id] = username
+            self.pending[user_id] = username
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        while self.pending:
+            batch = dict(itertools.islice(self.pending.items(), self.batch_size))
+            for user_id in batch:
+                del self.pending[user_id]
+            try:
+                async with DB_SEMAPHORE:
+                    async with bot.db.acquire() as conn:
+                        await conn.execute('''
+                            INSERT INTO users (user_id, username)
+                            SELECT * FROM UNNEST($1::BIGINT[], $2::VARCHAR[])
+                            ON CONFLICT (user_id) DO UPDATE SET username = EXCLUDED.username
+                        ''', list(batch), list(batch.values()))
+                USER_WRITES.inc(amount=len(batch))
+            except Exception as e:
+                logging.error(f"Error writing {len(batch)} users: {e}")
+                # Keep anything observed since; retry the rest on the next flush
+                for user_id, username in batch.items():
+                    self.pending.setdefault(user_id, username)
+                return
+
+KNOWN_USERS = KnownUsers()
+USER_WRITES = METRICS.register(Counter('sql_mentor_user_writes_total', 'Rows upserted into users'))
+METRICS.register(Gauge('sql_mentor_user_writes_pending', 'New users and renames waiting to be written',
+                       lambda: len(KNOWN_USERS.pending)))
+
+class HyperLogLog:
+    """Distinct-count sketch: 2**p one-byte registers (4 KiB and ~1.6% error at p=12)."""
+
+    def __init__(self, p=12, registers=None):
+        self.p = p
+        self.registers = registers if registers is not None else np.zeros(1 << p, dtype=np.uint8)
+
+    def add(self, value):
+        h = int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), 'big')
+        index = h >> (64 - self.p)
+        rank = (64 - self.p) - (h & ((1 << (64 - self.p)) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(np.exp2(-self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # linear counting for small sets
+        return int(round(estimate))
+
+    def to_bytes(self):
+        return self.registers.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        registers = np.frombuffer(data, dtype=np.uint8).copy()
+        return cls(int(len(registers)).bit_length() - 1, registers)
+
+    @classmethod
+    def union(cls, sketches):
+        result = cls()
+        for sketch in sketches:
+            result.merge(sketch)
+        return result
+
+def overlap(a, b):
+    # Inclusion-exclusion; noisy for small overlaps, so clamp at zero
+    return max(0, a.count() + b.count() - HyperLogLog.union([a, b]).count())
+
+class ActivityTracker:
+    """Daily active-user sketches and users.last_active, both flushed in batches.
+
+    Each instance merges its sketches into activity_sketches, so DAU/WAU/MAU
+    cover the whole cluster while memory stays at one sketch per unflushed day.
+    """
+
+    def __init__(self, flush_interval=30.0, keep_days=90):
+        self.flush_interval = flush_interval
+        self.keep_days = keep_days
+        self.sketches = {}
+        self.last_active = {}
+        self._task = None
+
+    def touch(self, user_id):
+        day = get_ist_time().date()
+        sketch = self.sketches.get(day)
+        if sketch is None:
+            sketch = self.sketches[day] = HyperLogLog()
+        sketch.add(user_id)
+        self.last_active[user_id] = datetime.now(timezone.utc)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        if not self.sketches and not self.last_active:
+            return
+        sketches, self.sketches = self.sketches, {}
+        seen, self.last_active = self.last_active, {}
+        try:
+            async with DB_SEMAPHORE:
+                async with bot.db.acquire() as conn:
+                    async with conn.transaction():
+                        for day, sketch in sorted(sketches.items()):
+                            status = await conn.execute('''
+                                INSERT INTO activity_sketches (day, registers) VALUES ($1, $2)
+                                ON CONFLICT (day) DO NOTHING
+                            ''', day, sketch.to_bytes())
+                            if status == 'INSERT 0 0':
+                                stored = await conn.fetchval('''
+                                    SELECT registers FROM activity_sketches WHERE day = $1 FOR UPDATE
+                                ''', day)
+                                sketch.merge(HyperLogLog.from_bytes(stored))
+                                await conn.execute('''
+                                    UPDATE activity_sketches SET registers = $2 WHERE day = $1
+                                ''', day, sketch.to_bytes())
+                        if seen:
+                            # Rows for brand-new users may still be queued in KNOWN_USERS; they catch up next flush
+                            await conn.execute('''
+                                UPDATE users u SET last_active = v.last_active
+                                FROM UNNEST($1::BIGINT[], $2::TIMESTAMPTZ[]) AS v(user_id, last_active)
+                                WHERE u.user_id = v.user_id
+                                AND (u.last_active IS NULL OR u.last_active < v.last_active)
+                            ''', list(seen), list(seen.values()))
+                        await conn.execute('''
+                            DELETE FROM activity_sketches WHERE day < $1
+                        ''', get_ist_time().date() - timedelta(days=self.keep_days))
+        except Exception as e:
+            logging.error(f"Error flushing activity: {e}")
+            for day, sketch in sketches.items():
+                current = self.sketches.get(day)
+                self.sketches[day] = current.merge(sketch) if current is not None else sketch
+            for user_id, seen_at in seen.items():
+                self.last_active.setdefault(user_id, seen_at)
+
+    async def report(self):
+        await self.flush()
+        today = get_ist_time().date()
         async with DB_SEMAPHORE:
             async with bot.db.acquire() as conn:
-                points = await conn.fetchval('''
-                    SELECT COALESCE(points, 0)
-                    FROM daily_points
-                    WHERE user_id = $1 AND date = $2
-                ''', user_id, date)
-        return points or 0  # Return 0 if points is None
-    except Exception as e:
-        logging.error(f"Error getting daily points: {e}")
-        return 0
+                rows = await conn.fetch('''
+                    SELECT day, registers FROM activity_sketches WHERE day > $1
+                ''', today - timedelta(days=60))
+        sketches = {row['day']: HyperLogLog.from_bytes(row['registers']) for row in rows}
+
+        def active(first, last):
+            return HyperLogLog.union(sketches[day] for day in
+                                     (today - timedelta(days=offset) for offset in range(first, last + 1))
+                                     if day in sketches)
+
+        def retention(earlier, later):
+            base = earlier.count()
+            return overlap(earlier, later) / base if base else None
+
+        dau, yesterday = active(0, 0), active(1, 1)
+        wau, last_week = active(0, 6), active(7, 13)
+        mau, last_month = active(0, 29), active(30, 59)
+        return {
+            'daily': [(today - timedelta(days=offset), active(offset, offset).count()) for offset in range(7)],
+            'dau': dau.count(),
+            'wau': wau.count(),
+            'mau': mau.count(),
+            'day_retention': retention(yesterday, dau),
+            'week_retention': retention(last_week, wau),
+            'month_retention': retention(last_month, mau),
+        }
+
+ACTIVITY = ActivityTracker()
+METRICS.register(Gauge('sql_mentor_activity_pending_users', 'Users whose last_active is waiting to be flushed',
+                       lambda: len(ACTIVITY.last_active)))
+
+PROFILE_CACHE_SIZE = int(os.getenv('PROFILE_CACHE_SIZE', '5000'))
+PROFILE_TTL_SECONDS = float(os.getenv('PROFILE_TTL_SECONDS', '900'))  # bounds staleness across instances
+
+class UserProfile:
+    def __init__(self, user_id, row):
+        self.user_id = user_id
+        self.username = row['username']
+        self.preference = row['preferred_difficulty']
+        self.streak = row['streak'] or 0
+        self.last_streak_update = row['last_streak_update']
+        # Incorrect submissions per question, for get_max_attempts
+        self.misses = dict(zip(row['missed_questions'] or [], row['miss_counts'] or []))
+        self.loaded_at = time_module.monotonic()
+
+class UserProfileStore:
+    """Bounded LRU of UserProfile, loaded in one query and kept current write-through.
+
+    Loading a profile also seeds DAILY_COUNTERS for the user, so the first
+    command of the day costs one round trip instead of four or five.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.cache = LRUCache(maxsize)
+        self.ttl = ttl
+        self.loading = {}
+
+    async def get(self, user_id, username=None):
+        profile = self.cache.get(user_id)
+        if profile is not None and time_module.monotonic() - profile.loaded_at > self.ttl:
+            profile = None
+        if profile is None:
+            PROFILE_LOOKUPS.inc('miss')
+            task = self.loading.get(user_id)
+            if task is None:
+                task = self.loading[user_id] = asyncio.ensure_future(self._load(user_id))
+                task.add_done_callback(lambda _: self.loading.pop(user_id, None))
+            profile = await asyncio.shield(task)
+        else:
+            PROFILE_LOOKUPS.inc('hit')
+        if username is not None:
+            KNOWN_USERS.observe(user_id, username)
+            profile.username = username
+        return profile
+
+    async def _load(self, user_id):
+        day = get_ist_time().date()
+        DAILY_COUNTERS.roll_over(day)
+        claim = None
+        if user_id not in DAILY_COUNTERS.counters and user_id not in DAILY_COUNTERS.seeding:
+            claim = DAILY_COUNTERS.claim(user_id)
+        start, end = DailyCounterStore.day_bounds(day)
+        counts = None
+        try:
+            async with DB_SEMAPHORE:
+                async with bot.db.acquire() as conn:
+                    row = await conn.fetchrow('''
+                        SELECT u.username, p.preferred_difficulty, s.streak, s.last_streak_update,
+                               m.missed_questions, m.miss_counts,
+                               d.attempts, d.correct, d.points, d.questions
+                        FROM (SELECT $1::BIGINT AS user_id) me
+                        LEFT JOIN users u ON u.user_id = me.user_id
+                        LEFT JOIN user_preferences p ON p.user_id = me.user_id
+                        LEFT JOIN user_stats s ON s.user_id = me.user_id
+                        CROSS JOIN LATERAL (
+                            SELECT ARRAY_AGG(question_id) AS missed_questions, ARRAY_AGG(misses) AS miss_counts
+                            FROM (
+                                SELECT question_id, COUNT(*) AS misses
+                                FROM user_submissions
+                                WHERE user_id = me.user_id AND is_correct = FALSE
+                                GROUP BY question_id
+                            ) per_question
+                        ) m
+                        CROSS JOIN LATERAL (
+                            SELECT COUNT(*) AS attempts,
+                                   COUNT(*) FILTER (WHERE is_correct) AS correct,
+                                   COALESCE(SUM(points), 0) AS points,
+                                   ARRAY_REMOVE(ARRAY_AGG(DISTINCT question_id), NULL) AS questions
+                            FROM user_submissions
+                            WHERE user_id = me.user_id AND submitted_at >= $2 AND submitted_at < $3
+                        ) d
+                    ''', user_id, start, end)
+            counts = DailyCounterStore.from_row(row)
+        finally:
+            if claim is not None:
+                DAILY_COUNTERS.resolve(user_id, claim, counts)
+        profile = UserProfile(user_id, row)
+        self.cache.put(user_id, profile)
+        return profile
+
+    def update(self, user_id, **fields):
+        profile = self.cache.get(user_id)
+        if profile is not None:
+            for name, value in fields.items():
+                setattr(profile, name, value)
+
+    def record_submission(self, user_id, question_id, is_correct):
+        profile = self.cache.get(user_id)
+        if profile is not None and not is_correct:
+            profile.misses[question_id] = profile.misses.get(question_id, 0) + 1
+
+PROFILES = UserProfileStore(PROFILE_CACHE_SIZE, PROFILE_TTL_SECONDS)
+PROFILE_LOOKUPS = METRICS.register(Counter('sql_mentor_profile_lookups_total', 'User profile cache lookups', labels=('result',)))
+METRICS.register(Gauge('sql_mentor_profile_entries', 'Cached user profiles', lambda: len(PROFILES.cache)))
 
 async def update_daily_points(user_id, date, points):
     try:
@@ -242,60 +1745,71 @@ async def update_daily_points(user_id, date, points):
         logging.error(f"Error updating daily points: {e}")
         raise
 
-async def display_question(ctx, question):
+QUESTION_POINTS = {'easy': 60, 'medium': 80, 'hard': 120}
+QUESTION_TIME_LIMITS = {'easy': 10, 'medium': 15, 'hard': 25}  # minutes
+
+def question_time_limit(question):
+    return QUESTION_TIME_LIMITS.get(question['difficulty'], 10)
+
+def format_question(question, max_attempts=None):
+    """Render a question; practice questions (with max_attempts) also get the practice instructions."""
     difficulty = question['difficulty'].capitalize()
-    points = {'easy': 60, 'medium': 80, 'hard': 120}.get(question['difficulty'], 0)
-    time_limit = {'easy': 10, 'medium': 15, 'hard': 25}.get(question['difficulty'], 10)
-    
-    user_id = ctx.author.id
-    max_attempts = await get_max_attempts(user_id, question['id'])
+    points = QUESTION_POINTS.get(question['difficulty'], 0)
     
     message = f"Question ID: {question['id']}\n"
     message += f"Difficulty: {difficulty} ({points} points)\n"
-    message += f"Time Limit: {time_limit} minutes ⏳\n"
-    message += f"Attempts Remaining: {max_attempts}\n"
+    message += f"Time Limit: {question_time_limit(question)} minutes ⏳\n"
+    if max_attempts is not None:
+        message += f"Attempts Remaining: {max_attempts}\n"
     if question.get('topic'):
         message += f"Topic: {question['topic']}\n"
     if question.get('company'):
         message += f"Company: {question['company']}\n"
     message += f"\n{question['question']}\n"
-    if question['datasets']:
-        message += f"\nDataset:\n```\n{question['datasets']}\n```"
+    if question.get('datasets'):
+        if not dataset_attached(question):
+            message += f"\nDataset:\n```\n{question['datasets']}\n```"
+        else:
+            message += "\nDataset: see the attached file 📎"
     message += "\nUse `!submit` followed by your SQL query to answer!"
-    message += "\nUse `!skip` if you want to try a different question.\n"
-    message += "\nUse `!hint` to get a hint!.\n"
-    message += "\nUse CREATE TABLE on the site for free! [Click Here](https://zeroanalyst.com/sql) to create a table."
-    message += "\nCome back within the given time and submit your solution code using the `!submit` command."
+    if max_attempts is not None:
+        message += "\nUse `!skip` if you want to try a different question.\n"
+        message += "\nUse `!hint` to get a hint!.\n"
+        message += "\nUse CREATE TABLE on the site for free! [Click Here](https://zeroanalyst.com/sql) to create a table."
+        message += "\nCome back within the given time and submit your solution code using the `!submit` command."
+    return message
+
+def dataset_attached(question):
+    """True if the question's dataset is too long to show inline and is sent as a file."""
+    datasets = question.get('datasets')
+    return bool(datasets) and len(datasets) > DATASET_INLINE_CHARS
+
+def dataset_file(question):
+    """The question's dataset as an attachment if it is too long to show inline, else None."""
+    if not dataset_attached(question):
+        return None
+    return discord.File(io.BytesIO(question['datasets'].encode()), filename=f"question_{question['id']}_dataset.sql")
 
-    await ctx.send(message)
+async def display_question(ctx, question):
+    user_id = ctx.author.id
+    time_limit = question_time_limit(question)
+    max_attempts = await get_max_attempts(user_id, question['id'])
+    await ctx.send(format_question(question, max_attempts), file=dataset_file(question))
     
     if user_id in user_timers:
         user_timers[user_id].cancel()
     user_timers[user_id] = asyncio.create_task(question_timer(ctx, question['id'], time_limit))
+    return time_limit
 
 async def check_daily_limit(ctx, user_id):
-    today = get_ist_time().date()
-    daily_points = await get_daily_points(user_id, today)
-    daily_submissions = await get_daily_submissions(user_id, today)
+    counts = await DAILY_COUNTERS.get(user_id)
+    daily_points, daily_submissions = counts['points'], counts['attempts']
     logging.info(f"User {user_id} daily points: {daily_points}, daily submissions: {daily_submissions}")
     if daily_points <= -50 or daily_submissions >= 25:
         await ctx.send("You've reached the daily limit. Please try again tomorrow! 🌙")
         return False
     return True
 
-async def get_daily_submissions(user_id, date):
-    try:
-        async with DB_SEMAPHORE:
-            async with bot.db.acquire() as conn:
-                submissions = await conn.fetchval('''
-                    SELECT COUNT(*) FROM user_submissions
-                    WHERE user_id = $1 AND DATE(submitted_at AT TIME ZONE 'UTC' AT TIME ZONE 'Asia/Kolkata') = $2
-                ''', user_id, date)
-        return submissions
-    except Exception as e:
-        logging.error(f"Error getting daily submissions: {e}")
-        return 0
-
 def db_connection_required():
     async def predicate(ctx):
         if not hasattr(bot, 'db'):
@@ -308,19 +1822,11 @@ def db_connection_required():
 @commands.cooldown(1, 60, commands.BucketType.user)
 async def sql(ctx):
     user_id = ctx.author.id
-    await user_last_active.set(user_id, datetime.now(timezone.utc))
     username = str(ctx.author)
-    await ensure_user_exists(user_id, username)
+    profile = await ensure_user_exists(user_id, username)
 
     try:
-        async with DB_SEMAPHORE:
-            async with bot.db.acquire() as conn:
-                preference = await conn.fetchval('''
-                    SELECT preferred_difficulty FROM user_preferences
-                    WHERE user_id = $1
-                ''', user_id)
-        
-        question = await get_question(difficulty=preference, user_id=user_id)
+        question = await get_question(difficulty=profile.preference, user_id=user_id)
         if question:
             await user_questions.set(user_id, question)
             await user_attempts.set(user_id, 0)
@@ -341,8 +1847,7 @@ async def sql_error(ctx, error):
 @bot.command()
 async def submit(ctx, *, answer):
     user_id = ctx.author.id
-    await user_last_active.set(user_id, datetime.now(timezone.utc))
-    question = await user_questions.get(user_id)
+    question = await get_user_question(user_id)
     
     if question:
         await process_answer(ctx, user_id, answer)
@@ -361,7 +1866,7 @@ async def process_answer(ctx, user_id, answer):
         await ctx.send("You don't have an active question. Use `!sql` to get a new question.")
         return
 
-    is_correct, feedback = check_answer(answer, question['answer'])
+    is_correct, feedback = await GRADER.grade(question['id'], answer, question['answer'])
     points = await calculate_points(user_id, is_correct, question['difficulty'])
     
     try:
@@ -437,33 +1942,149 @@ async def my_stats(ctx):
                        "Use `!sql` to get your first question and start your journey.\n\n"
                        "Remember, every SQL master started as a beginner. Your coding adventure begins now! 💪✨")
 
-@tasks.loop(time=time(hour=0, minute=0))  # Midnight IST
-async def reset_daily_points():
-    try:
-        async with DB_SEMAPHORE:
-            async with bot.db.acquire() as conn:
-                await conn.execute('''
-                    DELETE FROM daily_points
-                    WHERE date < CURRENT_DATE
-                ''')
-        logging.info("Daily points reset successfully")
-    except Exception as e:
-        logging.error(f"Error in reset_daily_points task: {e}")
+@tasks.loop(time=time(hour=18, minute=30))  # Midnight IST
+async def roll_over_daily_counters():
+    # Runs on every instance: the counters live in process memory
+    DAILY_COUNTERS.roll_over(get_ist_time().date())
+    logging.info("Daily counters rolled over")
 
 @bot.event
 async def on_ready():
-    update_leaderboard.start()
-    update_weekly_heroes.start()
-    daily_challenge.start()
-    challenge_time_over.start()
+    # Scheduled jobs are started by LEADER once this instance wins the election
     logging.info(f'{bot.user} has connected to Discord!')
 
 @bot.event
 async def on_error(event, *args, **kwargs):
     logging.error(f"Unhandled error in {event}", exc_info=True)
 
+ADMISSION_RATE = float(os.getenv('ADMISSION_RATE', '50'))  # command cost units per second, all users
+ADMISSION_BURST = float(os.getenv('ADMISSION_BURST', '100'))
+ADMISSION_USER_RATE = float(os.getenv('ADMISSION_USER_RATE', '0.5'))
+ADMISSION_USER_BURST = float(os.getenv('ADMISSION_USER_BURST', '8'))
+SHED_DB_WAIT_MS = float(os.getenv('SHED_DB_WAIT_MS', '100'))
+ADMISSION_DEFER_SECONDS = float(os.getenv('ADMISSION_DEFER_SECONDS', '3'))
+
+# Relative cost of a command in token-bucket units; unlisted commands cost 1
+COMMAND_COSTS = {
+    'sql': 2, 'question': 2, 'company': 2, 'topic': 2, 'easy': 2, 'medium': 2, 'hard': 2,
+    'my_stats': 2, 'my_achievements': 2, 'challenge_history': 2,
+    'question_stats': 3, 'weekly_progress': 3, 'view_stats': 3,
+}
+# Never shed: answers are time-limited, and a late grade is worse than a refused stats page
+CRITICAL_COMMANDS = frozenset({'submit', 'submit_challenge'})
+# Deferred, then shed, while the database is saturated
+LOW_PRIORITY_COMMANDS = frozenset({
+    'question_stats', 'daily_progress', 'weekly_progress', 'my_stats', 'my_achievements',
+    'challenge_history', 'view_stats',
+})
+LISTING_COMMANDS = frozenset({'topic', 'company'})  # low priority only when run without an argument
+
+ADMISSION_SHED = METRICS.register(Counter('sql_mentor_commands_shed_total', 'Commands refused by admission control',
+                                          labels=('command', 'reason')))
+ADMISSION_DEFERRED = METRICS.register(Counter('sql_mentor_commands_deferred_total',
+                                              'Low-priority commands held back while the database was saturated',
+                                              labels=('command',)))
+
+class CommandShed(commands.CheckFailure):
+    def __init__(self, retry_after, reason):
+        super().__init__(f"Command shed ({reason}), retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+        self.reason = reason
+
+class AdmissionController:
+    """Rate-limits commands by cost and sheds low-priority ones while DB_SEMAPHORE is congested.
+
+    Congestion is an EWMA of semaphore wait times that decays while no waits
+    are observed, so an idle pool is not mistaken for a saturated one.
+    """
+
+    def __init__(self, rate, burst, user_rate, user_burst, shed_wait, defer_seconds,
+                 alpha=0.2, decay_seconds=5.0):
+        self.bucket = TokenBucket(rate, burst)
+        self.user_buckets = LRUCache(10000)
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.shed_wait = shed_wait
+        self.defer_seconds = defer_seconds
+        self.alpha = alpha
+        self.decay_seconds = decay_seconds
+        self.wait_ewma = 0.0
+        self.observed_at = time_module.monotonic()
+
+    def observe_wait(self, seconds):
+        now = time_module.monotonic()
+        self.wait_ewma = (1 - self.alpha) * self._decayed(now) + self.alpha * seconds
+        self.observed_at = now
+
+    def _decayed(self, now):
+        return self.wait_ewma * math.exp(-(now - self.observed_at) / self.decay_seconds)
+
+    def congestion(self):
+        return self._decayed(time_module.monotonic())
+
+    def overloaded(self):
+        return self.congestion() > self.shed_wait
+
+    def user_bucket(self, user_id):
+        bucket = self.user_buckets.get(user_id)
+        if bucket is None:
+            bucket = TokenBucket(self.user_rate, self.user_burst)
+            self.user_buckets.put(user_id, bucket)
+        return bucket
+
+    @staticmethod
+    def is_low_priority(ctx):
+        name = ctx.command.qualified_name
+        # A bare !topic or !company lists the whole catalog rather than fetching a question
+        return name in LOW_PRIORITY_COMMANDS or (name in LISTING_COMMANDS and len(ctx.message.content.split(maxsplit=1)) == 1)
+
+    async def admit(self, ctx):
+        name = ctx.command.qualified_name
+        if ctx.author.id in ADMIN_IDS:
+            return True
+        cost = COMMAND_COSTS.get(name, 1)
+        critical = name in CRITICAL_COMMANDS
+
+        retry_after = self.user_bucket(ctx.author.id).take(cost, force=critical)
+        if retry_after:
+            ADMISSION_SHED.inc(name, 'user_rate')
+            raise CommandShed(retry_after, 'user_rate')
+
+        if self.is_low_priority(ctx) and self.overloaded():
+            ADMISSION_DEFERRED.inc(name)
+            deadline = time_module.monotonic() + self.defer_seconds
+            while self.overloaded():
+                if time_module.monotonic() >= deadline:
+                    ADMISSION_SHED.inc(name, 'overload')
+                    raise CommandShed(self.defer_seconds * 2, 'overload')
+                await asyncio.sleep(0.25)
+
+        retry_after = self.bucket.take(cost, force=critical)
+        if retry_after:
+            ADMISSION_SHED.inc(name, 'global_rate')
+            raise CommandShed(retry_after, 'global_rate')
+        return True
+
+ADMISSION = AdmissionController(ADMISSION_RATE, ADMISSION_BURST, ADMISSION_USER_RATE, ADMISSION_USER_BURST,
+                                SHED_DB_WAIT_MS / 1000, ADMISSION_DEFER_SECONDS)
+METRICS.register(Gauge('sql_mentor_db_wait_ewma_seconds', 'Smoothed DB_SEMAPHORE wait used for load shedding',
+                       ADMISSION.congestion))
+
+@bot.check
+async def admission_check(ctx):
+    # Global checks run before cooldowns, so a shed command does not use up its cooldown
+    return await ADMISSION.admit(ctx)
+
 @bot.event
 async def on_command_error(ctx, error):
+    if isinstance(error, CommandShed):
+        if error.reason == 'user_rate':
+            await ctx.send(f"You're sending commands too quickly. Try again in {max(error.retry_after, 1):.0f} seconds.")
+        else:
+            await ctx.send(f"The bot is under heavy load right now. Please try again in {max(error.retry_after, 1):.0f} seconds.")
+        return
+    if ctx.command:
+        COMMAND_ERRORS.inc(ctx.command.qualified_name)
     if isinstance(error, commands.CommandOnCooldown):
         await ctx.send(f"This command is on cooldown. Try again in {error.retry_after:.2f} seconds.")
     elif isinstance(error, commands.CommandNotFound):
@@ -476,6 +2097,270 @@ async def on_command_error(ctx, error):
 async def on_disconnect():
     print("Bot disconnected from Discord")
 
+@bot.before_invoke
+async def before_command(ctx):
+    ctx.started_at = time_module.perf_counter()
+    ACTIVITY.touch(ctx.author.id)
+
+@bot.after_invoke
+async def after_command(ctx):
+    # Runs even when the command raised, so every invocation is timed
+    started = getattr(ctx, 'started_at', None)
+    if started is not None and ctx.command:
+        duration = time_module.perf_counter() - started
+        COMMAND_LATENCY.observe(duration, ctx.command.qualified_name)
+        if TRAFFIC:
+            TRAFFIC.record(ctx, duration)
+
+TRAFFIC_CAPTURE_PATH = os.getenv('TRAFFIC_CAPTURE_PATH')  # opt-in; replay with benchmarks/replay.py
+
+# Free-text arguments replay needs as typed: SQL answers and catalog search terms
+CAPTURE_VERBATIM = frozenset({
+    ('submit', 'answer'), ('submit_challenge', 'answer'), ('topic', 'topic_name'), ('company', 'company_name'),
+})
+DISCORD_MENTION = re.compile(r'<(@[!&]?|#)(\d+)>')
+
+class TrafficRecorder:
+    """Appends command events to a JSONL file, flushed off the event loop.
+
+    User, channel and mentioned ids become salted hashes. Free text is kept
+    only for the arguments in CAPTURE_VERBATIM; any other string is replaced
+    by a placeholder of the same length.
+    """
+
+    def __init__(self, path, salt, flush_interval=1.0):
+        self.path = path
+        self.salt = hashlib.sha256(salt.encode()).digest()  # blake2b keys are capped at 64 bytes
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self._task = None
+
+    def anonymize(self, value):
+        return hashlib.blake2b(str(value).encode(), key=self.salt, digest_size=8).hexdigest()
+
+    def scrub(self, command, name, value):
+        # Mentions and other Discord objects only keep a salted hash of their id
+        if isinstance(value, discord.abc.Snowflake):
+            return f"snowflake:{self.anonymize(value.id)}"
+        if value is None or isinstance(value, (int, float, bool)):
+            return value
+        if isinstance(value, str) and (command, name) in CAPTURE_VERBATIM:
+            return DISCORD_MENTION.sub(lambda m: f"<{m.group(1)}{self.anonymize(m.group(2))}>", value)
+        return 'x' * len(str(value))
+
+    def record(self, ctx, duration):
+        command = ctx.command.qualified_name
+        names = list(ctx.command.clean_params)
+        self.buffer.append(json.dumps({
+            'ts': round(time_module.time() - duration, 4),
+            'command': command,
+            'args': [self.scrub(command, name, arg) for name, arg in zip(names, ctx.args[1:])],
+            'kwargs': {key: self.scrub(command, key, value) for key, value in ctx.kwargs.items()},
+            'user': self.anonymize(ctx.author.id),
+            'channel': self.anonymize(ctx.channel.id),
+            'duration_ms': round(duration * 1000, 2),
+            'failed': ctx.command_failed,
+        }))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        if not self.buffer:
+            return
+        lines, self.buffer = self.buffer, []
+        try:
+            await asyncio.to_thread(self._append, lines)
+        except OSError as e:
+            logging.error(f"Error writing traffic capture: {e}")
+
+    def _append(self, lines):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+
+# Without a fixed salt the user hashes change on every restart
+TRAFFIC = TrafficRecorder(TRAFFIC_CAPTURE_PATH, os.getenv('TRAFFIC_CAPTURE_SALT') or os.urandom(16).hex()) if TRAFFIC_CAPTURE_PATH else None
+
+async def metrics_handler(request):
+    return web.Response(body=METRICS.render().encode(),
+                        headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+async def start_metrics_server():
+    app = web.Application()
+    app.router.add_get('/metrics', metrics_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, METRICS_HOST, METRICS_PORT).start()
+    bot.metrics_runner = runner
+    logging.info(f"Metrics available at http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+
+LOOP_BLOCK_THRESHOLD_MS = float(os.getenv('LOOP_BLOCK_THRESHOLD_MS', '100'))
+
+class LoopWatchdog:
+    """Measures event loop lag and, from a side thread, snapshots whatever is blocking it."""
+
+    def __init__(self, threshold_ms, interval=0.1):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval
+        self.blockers = {}
+        self.beat = time_module.monotonic()
+        self._loop = None
+        self._loop_thread_id = None
+        self._captured_beat = None
+        self._pending = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._task = None
+        self._thread = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+
+    async def _heartbeat(self):
+        while True:
+            started = self._loop.time()
+            self.beat = time_module.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, self._loop.time() - started - self.interval)
+            LOOP_LAG.observe(lag)
+            if lag >= self.threshold:
+                self._record_block(lag)
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval / 4):
+            beat = self.beat
+            if time_module.monotonic() - beat - self.interval < self.threshold or beat == self._captured_beat:
+                continue
+            # Still inside the blocking callback: grab the loop thread's stack while it is on it
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame, limit=30)
+            task = asyncio.current_task(self._loop)
+            with self._lock:
+                self._captured_beat = beat
+                self._pending = (blocking_site(stack), stack, task.get_name() if task else 'callback')
+
+    def _record_block(self, lag):
+        with self._lock:
+            pending, self._pending = self._pending, None
+        site, stack, task_name = pending or ('unknown (blocked between watchdog samples)', None, '?')
+        entry = self.blockers.setdefault(site, {'count': 0, 'total': 0.0, 'max': 0.0, 'task': task_name, 'stack': None})
+        entry['count'] += 1
+        entry['total'] += lag
+        entry['max'] = max(entry['max'], lag)
+        entry['task'] = task_name
+        if stack:
+            frames = [frame for frame in stack if f'{os.sep}asyncio{os.sep}' not in frame.filename]
+            entry['stack'] = ''.join(traceback.format_list(frames[-8:]))
+        LOOP_BLOCKS.inc(site)
+        LOOP_BLOCKED_SECONDS.inc(site, amount=lag)
+        logging.warning(f"Event loop blocked for {lag * 1000:.0f} ms in {site} (task {task_name})"
+                        + (f"\n{entry['stack']}" if stack else ''))
+
+    def top(self, limit=10):
+        ranked = sorted(self.blockers.items(), key=lambda item: item[1]['total'], reverse=True)
+        return ranked[:limit]
+
+def blocking_site(stack):
+    # Innermost frame of our own code; library frames only say where the time went, not who called it
+    for frame in reversed(stack):
+        if frame.filename == __file__ and frame.name != '_watch':
+            return f"{frame.name} ({os.path.basename(frame.filename)}:{frame.lineno})"
+    frame = stack[-1]
+    return f"{frame.name} ({os.path.basename(frame.filename)}:{frame.lineno})"
+
+WATCHDOG = LoopWatchdog(LOOP_BLOCK_THRESHOLD_MS)
+
+class SamplingProfiler:
+    """Samples every thread's stack from a side thread; nothing is hooked into the profiled code."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.running = threading.Lock()
+
+    def run(self, seconds):
+        # Blocking: call through asyncio.to_thread so the loop keeps running while it is sampled
+        stacks = collections.Counter()
+        own_thread = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        samples = 0
+        deadline = time_module.monotonic() + seconds
+        while time_module.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                stacks[';'.join(reversed(stack))] += 1
+            samples += 1
+            time_module.sleep(self.interval)
+        return samples, stacks
+
+def summarize_profile(stacks, limit=15):
+    own, total = collections.Counter(), collections.Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(';')[1:]
+        if not frames:
+            continue
+        own[frames[-1]] += count
+        for frame in set(frames):
+            total[frame] += count
+    return own.most_common(limit), total
+
+def collapsed_stacks(stacks):
+    # Brendan Gregg's folded format, ready for flamegraph.pl or speedscope
+    return '\n'.join(f"{stack} {count}" for stack, count in stacks.most_common()) + '\n'
+
+def approx_size(obj, depth=3):
+    size = sys.getsizeof(obj)
+    if depth and isinstance(obj, dict):
+        size += sum(approx_size(k, depth - 1) + approx_size(v, depth - 1) for k, v in obj.items())
+    elif depth and isinstance(obj, (list, tuple, set)):
+        size += sum(approx_size(item, depth - 1) for item in obj)
+    return size
+
+def session_state_sizes():
+    tables = {
+        'user_questions': user_questions._dict,
+        'user_attempts': user_attempts._dict,
+        'user_skips': user_skips._dict,
+        'activity_pending': ACTIVITY.last_active,
+        'user_timers': user_timers,
+        'mailboxes': MAILBOXES.actors,
+        'daily_counters': DAILY_COUNTERS.counters,
+        'challenge_submitters': CHALLENGE_BURST.submitted,
+        'profiles': PROFILES.cache._data,
+    }
+    return [(name, len(table), approx_size(table)) for name, table in tables.items()]
+
+PROFILER = SamplingProfiler()
+MEMPROFILE_RUNNING = asyncio.Lock()  # overlapping runs would stop each other's tracing
+
 @bot.command(name='help')
 async def help(ctx):
     help_text = """
@@ -485,6 +2370,7 @@ async def help(ctx):
     `!topic`: List all available topics or get a question on a specific SQL topic
     `!company`: List all available companies or practice questions from a specific company
     `!submit <answer>`: Submit your answer to the current question
+    `!dataset <question_id>`: Get a question's dataset (as a file when it is large)
     `!my_stats`: Check your personal progress and achievements
     `!set_preference <difficulty>`: Set your preferred question difficulty
     `!reset_preference`: Reset your difficulty preference
@@ -508,7 +2394,6 @@ async def hard(ctx):
 
 async def get_difficulty_question(ctx, difficulty):
     user_id = ctx.author.id
-    await user_last_active.set(user_id, datetime.now(timezone.utc))
     username = str(ctx.author)
     await ensure_user_exists(user_id, username)
     try:
@@ -526,7 +2411,6 @@ async def get_difficulty_question(ctx, difficulty):
 @bot.command()
 async def question(ctx, question_id: int = None):
     user_id = ctx.author.id
-    await user_last_active.set(user_id, datetime.now(timezone.utc))
     username = str(ctx.author)
     await ensure_user_exists(user_id, username)
 
@@ -535,34 +2419,21 @@ async def question(ctx, question_id: int = None):
             return
 
         if question_id:
-            async with DB_SEMAPHORE:
-                async with bot.db.acquire() as conn:
-                    # Get the specific question
-                    question = await conn.fetchrow('''
-                        SELECT * FROM questions WHERE id = $1
-                        AND id NOT IN (
-                            SELECT question_id FROM user_submissions 
-                            WHERE user_id = $2 AND is_correct = true
-                        )
-                    ''', question_id, user_id)
-                    
-                    if not question:
-                        await ctx.send(f"❌ Question {question_id} is either not found or you've already solved it. Try another question!")
-                        return
-                    
-                    # Ensure difficulty is set
-                    if not question.get('difficulty'):
-                        question['difficulty'] = 'medium'  # Default to medium if not set
+            # Get the specific question
+            solved = await get_solved_question_ids(user_id)
+            question = await QUESTIONS.get(question_id) if question_id not in solved else None
+            
+            if not question:
+                await ctx.send(f"❌ Question {question_id} is either not found or you've already solved it. Try another question!")
+                return
+            
+            # Ensure difficulty is set
+            if not question.get('difficulty'):
+                question['difficulty'] = 'medium'  # Default to medium if not set
         else:
             # Original logic for random question based on preference
-            async with DB_SEMAPHORE:
-                async with bot.db.acquire() as conn:
-                    preference = await conn.fetchval('''
-                        SELECT preferred_difficulty FROM user_preferences
-                        WHERE user_id = $1
-                    ''', user_id)
-            
-            question = await get_question(difficulty=preference, user_id=user_id)
+            profile = await PROFILES.get(user_id)
+            question = await get_question(difficulty=profile.preference, user_id=user_id)
 
         if question:
             await user_questions.set(user_id, question)
@@ -581,10 +2452,9 @@ async def question(ctx, question_id: int = None):
 @commands.cooldown(1, 30, commands.BucketType.user)  # One hint every 30 seconds
 async def hint(ctx):
     user_id = ctx.author.id
-    await user_last_active.set(user_id, datetime.now(timezone.utc))
     
     # Get current question
-    question = await user_questions.get(user_id)
+    question = await get_user_question(user_id)
     if not question:
         await ctx.send("You don't have an active question. Use `!sql` to get a new question.")
         return
@@ -598,6 +2468,26 @@ async def hint(ctx):
     hint_message = f"💡 Hint:\n{question['hint']}"
     await ctx.send(hint_message)
 
+@bot.command()
+async def dataset(ctx, question_id: int):
+    try:
+        question = await QUESTIONS.get(question_id)
+    except Exception as e:
+        logging.error(f"Error in dataset command: {e}")
+        await ctx.send("An error occurred while fetching the dataset. Please try again later.")
+        return
+    if not question:
+        await ctx.send(f"Question with ID {question_id} does not exist.")
+        return
+    if not question['datasets']:
+        await ctx.send(f"Question {question_id} has no dataset.")
+        return
+    attachment = dataset_file(question)
+    if attachment is None:
+        await ctx.send(f"📚 Dataset for question {question_id}:\n```sql\n{question['datasets']}\n```")
+    else:
+        await ctx.send(f"📚 Dataset for question {question_id}:", file=attachment)
+
 @hint.error
 async def hint_error(ctx, error):
     if isinstance(error, commands.CommandOnCooldown):
@@ -608,8 +2498,7 @@ async def hint_error(ctx, error):
 @bot.command()
 async def try_again(ctx):
     user_id = ctx.author.id
-    await user_last_active.set(user_id, datetime.now(timezone.utc))
-    question = await user_questions.get(user_id)
+    question = await get_user_question(user_id)
     if not question:
         await ctx.send("You don't have an active question. Use `!sql` to get a new question.")
         return
@@ -630,8 +2519,7 @@ async def report(ctx, question_id: int, *, feedback):
         async with DB_SEMAPHORE:
             async with bot.db.acquire() as conn:
                 # Check if the question exists
-                question = await conn.fetchrow('SELECT * FROM questions WHERE id = $1', question_id)
-                if not question:
+                if question_id not in QUESTIONS.rows and not await QUESTIONS.get(question_id, conn):
                     await ctx.send(f"Question with ID {question_id} does not exist.")
                     return
 
@@ -649,7 +2537,6 @@ async def report(ctx, question_id: int, *, feedback):
 @bot.command()
 async def topic(ctx, *, topic_name=None):
     user_id = ctx.author.id
-    await user_last_active.set(user_id, datetime.now(timezone.utc))
     username = str(ctx.author)
     await ensure_user_exists(user_id, username)
 
@@ -658,33 +2545,25 @@ async def topic(ctx, *, topic_name=None):
         return
 
     try:
-        async with DB_SEMAPHORE:
-            async with bot.db.acquire() as conn:
-                # Get questions where topic contains the search term
-                questions = await conn.fetch("""
-                    SELECT DISTINCT topic 
-                    FROM questions 
-                    WHERE LOWER(topic) LIKE $1
-                    AND id NOT IN (
-                        SELECT question_id 
-                        FROM user_submissions 
-                        WHERE user_id = $2 AND is_correct = true
-                    )
-                """, f"%{topic_name.lower()}%", user_id)
+        # Unsolved questions whose topic contains the search term
+        needle = topic_name.lower()
+        solved = await get_solved_question_ids(user_id)
+        matches = [row for row in await QUESTIONS.select(exclude=solved) if row['topic'] and needle in row['topic'].lower()]
 
-                if not questions:
-                    await ctx.send(f"No questions found for topic containing '{topic_name}'. Here are the available topics:")
-                    await list_topics(ctx)
-                    return
+        if not matches:
+            await ctx.send(f"No questions found for topic containing '{topic_name}'. Here are the available topics:")
+            await list_topics(ctx)
+            return
 
-                # Get a random question from matching topics
-                question = await get_question(topic=random.choice(questions)['topic'], user_id=user_id)
-                if question:
-                    await user_questions.set(user_id, question)
-                    await user_attempts.set(user_id, 0)
-                    await display_question(ctx, question)
-                else:
-                    await ctx.send(f"Sorry, no new questions available for topics matching '{topic_name}' at the moment.")
+        # Get a random question from a random matching topic
+        chosen = random.choice(sorted({row['topic'] for row in matches}))
+        question = await QUESTIONS.get(random.choice([row for row in matches if row['topic'] == chosen])['id'])
+        if question:
+            await user_questions.set(user_id, question)
+            await user_attempts.set(user_id, 0)
+            await display_question(ctx, question)
+        else:
+            await ctx.send(f"Sorry, no new questions available for topics matching '{topic_name}' at the moment.")
 
     except Exception as e:
         logging.error(f"Error in topic command: {e}")
@@ -692,14 +2571,13 @@ async def topic(ctx, *, topic_name=None):
 
 async def list_topics(ctx):
     try:
-        async with DB_SEMAPHORE:
-            async with bot.db.acquire() as conn:
-                topics = await conn.fetch("SELECT DISTINCT topic FROM questions WHERE topic IS NOT NULL ORDER BY topic")
-        
-        if topics:
-            topic_list = ", ".join([f"{t['topic']}" for t in topics])
-            await ctx.send(f"Available topics:\n{topic_list}\n\nUse `!topic <topic name>` to get a question from a specific topic.")
-        else:
+        def render(topics, page_index):
+            topic_list = ", ".join(truncate(t['topic'], 60) for t in topics)
+            return f"Available topics (page {page_index + 1}):\n{topic_list}\n\nUse `!topic <topic name>` to get a question from a specific topic."
+
+        fetch = keyset_fetcher("SELECT DISTINCT topic FROM questions WHERE topic IS NOT NULL", ('topic',))
+        paginator = KeysetPaginator(ctx.author.id, fetch, render, ('topic',), page_size=25)
+        if not await paginator.start(ctx):
             await ctx.send("No topics available at the moment.")
     except Exception as e:
         logging.error(f"Error in list_topics: {e}")
@@ -707,6 +2585,13 @@ async def list_topics(ctx):
 
 @tasks.loop(time=time(hour=16, minute=30))  # 10:00 PM IST
 async def update_leaderboard():
+    try:
+        if await LEADER.confirm():
+            await post_leaderboard()
+    except Exception as e:
+        logging.error(f"Error in update_leaderboard task: {e}")
+
+async def post_leaderboard():
     try:
         top_10 = await get_top_10()
 
@@ -716,10 +2601,7 @@ async def update_leaderboard():
                 emoji = ["🥇", "🥈", "🥉"] + ["🏅"]*7
                 top_10_message += f"{emoji[i-1]} {user['username']}: {user['total_points']} points\n"
 
-            for channel_id in CHANNEL_IDS:
-                channel = bot.get_channel(channel_id)
-                if channel:
-                    await channel.send(top_10_message)
+            await broadcast_to_channels(top_10_message)
 
     except Exception as e:
         logging.error(f"Error in update_leaderboard task: {e}")
@@ -728,32 +2610,158 @@ async def update_leaderboard():
 async def update_leaderboard_error(error):
     logging.error(f"Unhandled error in update_leaderboard task: {error}", exc_info=True)
 
+CHALLENGE_QUEUE_DAYS = int(os.getenv('CHALLENGE_QUEUE_DAYS', '14'))
+
+class ChallengePlanner:
+    """Rolling queue of upcoming daily challenges, balanced across difficulty and topic.
+
+    refill() tops the challenge_queue table up to `size` questions and
+    daily_challenge pops its head. Call the async methods inside a transaction.
+    """
+
+    # Share of challenge days per difficulty
+    MIX = {'easy': 1, 'medium': 2, 'hard': 1}
+
+    def __init__(self, size, recent_window=14):
+        self.size = size
+        self.recent_window = recent_window
+
+    def plan(self, candidates, recent, count, rng=random):
+        """Pick up to count candidate ids, given the (difficulty, topic) of recent and already queued challenges.
+
+        Each pick takes the difficulty furthest below its MIX share, then that
+        difficulty's least recently used topic, then a random question.
+        """
+        slots = collections.defaultdict(list)
+        for row in candidates:
+            slots[(row['difficulty'], row['topic'])].append(row['id'])
+        difficulty_counts = collections.Counter(difficulty for difficulty, _ in recent)
+        topic_counts = collections.Counter(topic for _, topic in recent)
+        picks = []
+        while slots and len(picks) < count:
+            difficulty = min({difficulty for difficulty, _ in slots},
+                             key=lambda d: (difficulty_counts[d] / self.MIX.get(d, 1), rng.random()))
+            topic = min((topic for d, topic in slots if d == difficulty),
+                        key=lambda t: (topic_counts[t], rng.random()))
+            ids = slots[(difficulty, topic)]
+            picks.append(ids.pop(rng.randrange(len(ids))))
+            if not ids:
+                del slots[(difficulty, topic)]
+            difficulty_counts[difficulty] += 1
+            topic_counts[topic] += 1
+        return picks
+
+    async def refill(self, conn):
+        # Serializes planners on every instance; readers are not blocked
+        await conn.execute('LOCK TABLE challenge_queue IN SHARE ROW EXCLUSIVE MODE')
+        queued = await conn.fetch('''
+            SELECT q.difficulty, q.topic FROM challenge_queue cq
+            JOIN questions q ON q.id = cq.question_id
+        ''')
+        missing = self.size - len(queued)
+        if missing <= 0:
+            return 0
+        recent = await conn.fetch('''
+            SELECT q.difficulty, q.topic FROM challenge_history ch
+            JOIN questions q ON q.id = ch.question_id
+            ORDER BY ch.challenge_date DESC
+            LIMIT $1
+        ''', self.recent_window)
+        candidates = await conn.fetch('''
+            SELECT q.id, q.difficulty, q.topic FROM questions q
+            WHERE NOT EXISTS (SELECT 1 FROM challenge_history ch WHERE ch.question_id = q.id)
+              AND NOT EXISTS (SELECT 1 FROM challenge_queue cq WHERE cq.question_id = q.id)
+        ''')
+        picks = self.plan(candidates, [(row['difficulty'], row['topic']) for row in [*recent, *queued]], missing)
+        if picks:
+            await conn.execute('''
+                INSERT INTO challenge_queue (question_id, position)
+                SELECT t.id, (SELECT COALESCE(MAX(position), 0) FROM challenge_queue) + t.ord
+                FROM UNNEST($1::INTEGER[]) WITH ORDINALITY AS t(id, ord)
+            ''', picks)
+            logging.info(f"Planned {len(picks)} daily challenges")
+        return len(picks)
+
+    async def pop(self, conn):
+        await self.refill(conn)
+        while True:
+            question_id = await conn.fetchval('''
+                DELETE FROM challenge_queue
+                WHERE question_id = (SELECT question_id FROM challenge_queue ORDER BY position LIMIT 1)
+                RETURNING question_id
+            ''')
+            if question_id is None:
+                return None
+            question = await QUESTIONS.get(question_id, conn)
+            if question:
+                break
+            logging.warning(f"Queued challenge question {question_id} no longer exists, skipping it")
+        await conn.execute('''
+            INSERT INTO challenge_history (question_id, challenge_date)
+            VALUES ($1, $2)
+            ON CONFLICT DO NOTHING
+        ''', question_id, get_ist_time().date())
+        await self.refill(conn)
+        return question
+
+    async def preview(self, conn):
+        await self.refill(conn)
+        return await conn.fetch('''
+            SELECT q.id, q.difficulty, q.topic, q.question
+            FROM challenge_queue cq
+            JOIN questions q ON q.id = cq.question_id
+            ORDER BY cq.position
+        ''')
+
+    async def move(self, conn, question_id, position):
+        order = [row['question_id'] for row in await conn.fetch(
+            'SELECT question_id FROM challenge_queue ORDER BY position FOR UPDATE')]
+        if question_id not in order:
+            return None
+        order.remove(question_id)
+        index = max(0, min(position - 1, len(order)))
+        order.insert(index, question_id)
+        await conn.execute('''
+            UPDATE challenge_queue cq SET position = t.ord
+            FROM UNNEST($1::INTEGER[]) WITH ORDINALITY AS t(id, ord)
+            WHERE cq.question_id = t.id
+        ''', order)
+        return index + 1
+
+CHALLENGE_PLANNER = ChallengePlanner(CHALLENGE_QUEUE_DAYS)
+
 @tasks.loop(time=time(hour=12, minute=0))  # 5:30 PM IST
 async def daily_challenge():
     try:
         logging.info("Starting daily challenge task")
-        question = await get_fresh_challenge_question()
-        if not question:
-            logging.error("No available questions for challenge")
-            return
-
-        # Define base points based on difficulty
-        base_points = {'easy': 60, 'medium': 80, 'hard': 120}.get(question['difficulty'], 60)
-        
-        # Set end time to 5 minutes from now
+        # Set end time to 4 hours from now
         now = datetime.now(pytz.UTC)
         end_time = now + timedelta(hours=4)
         
         async with DB_SEMAPHORE:
             async with bot.db.acquire() as conn:
-                # Clear any existing challenge first
-                await conn.execute('DELETE FROM current_challenge')
-                
-                # Set the new challenge
-                await conn.execute('''
-                    INSERT INTO current_challenge (question_id, end_time)
-                    VALUES ($1, $2)
-                ''', question['id'], end_time)
+                async with conn.transaction():
+                    if not await LEADER.holds_fence(conn):
+                        return
+
+                    question = await CHALLENGE_PLANNER.pop(conn)
+                    if not question:
+                        logging.error("No available questions for challenge")
+                        return
+
+                    # Clear any existing challenge first
+                    await conn.execute('DELETE FROM current_challenge')
+                    
+                    # Set the new challenge
+                    await conn.execute('''
+                        INSERT INTO current_challenge (question_id, end_time)
+                        VALUES ($1, $2)
+                    ''', question['id'], end_time)
+
+        await CHALLENGE_BURST.pin()
+
+        # Define base points based on difficulty
+        base_points = {'easy': 60, 'medium': 80, 'hard': 120}.get(question['difficulty'], 60)
         
         challenge_message = (
             "🌟 **DAILY SQL CHALLENGE** 🌟\n\n"
@@ -765,8 +2773,10 @@ async def daily_challenge():
             f"**Challenge Question:**\n{question['question']}\n"
         )
         
-        if question['datasets']:
+        if question['datasets'] and not dataset_attached(question):
             challenge_message += f"\n📚 **Dataset:**\n```sql\n{question['datasets']}\n```"
+        elif question['datasets']:
+            challenge_message += f"\n📚 **Dataset:** too large to post here, use `!dataset {question['id']}` to get it as a file\n"
         
         challenge_message += (
             "\n🔥 **How to Participate:**\n"
@@ -777,10 +2787,7 @@ async def daily_challenge():
         )
 
         # Send to all channels
-        for channel_id in CHANNEL_IDS:
-            channel = bot.get_channel(channel_id)
-            if channel:
-                await channel.send(challenge_message)
+        await broadcast_to_channels(challenge_message)
                 
     except Exception as e:
         logging.error(f"Error in daily challenge: {e}")
@@ -811,27 +2818,6 @@ async def is_challenge_active():
         logging.error(f"Error checking if challenge is active: {e}")
         return False
 
-async def get_fresh_challenge_question():
-    try:
-        async with DB_SEMAPHORE:
-            async with bot.db.acquire() as conn:
-                question = await conn.fetchrow('''
-                    SELECT q.* FROM questions q
-                    LEFT JOIN challenge_history ch ON q.id = ch.question_id
-                    WHERE ch.question_id IS NULL
-                    ORDER BY RANDOM()
-                    LIMIT 1
-                ''')
-                if question:
-                    await conn.execute('''
-                        INSERT INTO challenge_history (question_id, challenge_date)
-                        VALUES ($1, $2)
-                    ''', question['id'], get_ist_time().date())
-        return question
-    except Exception as e:
-        logging.error(f"Error getting fresh challenge question: {e}")
-        return None
-
 async def set_current_challenge(question_id, end_time):
     try:
         async with DB_SEMAPHORE:
@@ -860,7 +2846,6 @@ async def reveal_answer(ctx, question_id: int = None):
         return
         
     user_id = ctx.author.id
-    await user_last_active.set(user_id, datetime.now(timezone.utc))
     
     try:
         async with DB_SEMAPHORE:
@@ -876,10 +2861,7 @@ async def reveal_answer(ctx, question_id: int = None):
                     return
                 
                 # Get the question details
-                question = await conn.fetchrow('''
-                    SELECT question, answer, datasets FROM questions
-                    WHERE id = $1
-                ''', question_id)
+                question = await QUESTIONS.get(question_id, conn)
                 
                 if not question:
                     await ctx.send("❌ Question not found! Please check the question ID.")
@@ -894,7 +2876,7 @@ async def reveal_answer(ctx, question_id: int = None):
                     f"📝 **Question {question_id}:**\n{question['question']}\n\n"
                 )
                 
-                if question['datasets']:
+                if question['datasets'] and not dataset_attached(question):
                     response += f"📊 **Dataset:**\n```\n{question['datasets']}\n```\n\n"
                 
                 response += (
@@ -903,7 +2885,7 @@ async def reveal_answer(ctx, question_id: int = None):
                     "Keep practicing to improve your SQL skills! 💪"
                 )
                 
-                await ctx.send(response)
+                await ctx.send(response, file=dataset_file(question))
                 
     except ValueError:
         await ctx.send("❌ Please provide a valid question ID. Example: `!reveal_answer 22`")
@@ -912,49 +2894,160 @@ async def reveal_answer(ctx, question_id: int = None):
         await ctx.send("❌ An error occurred while processing your request. Please try again later.")
 
 
+CHALLENGE_FLUSH_MS = int(os.getenv('CHALLENGE_FLUSH_MS', '50'))
+
+class ChallengeBurst:
+    """The current challenge and its answer, pinned in memory for the challenge window.
+
+    submit_challenge dedupes against the in-memory set of submitters and
+    answers straight away; grading runs in the background and submissions
+    are inserted in micro-batches of up to batch_size rows.
+    """
+
+    def __init__(self, flush_interval, batch_size=500, recheck_seconds=5):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.recheck_seconds = recheck_seconds
+        self.challenge = None
+        self.submitted = set()
+        self.pending = []
+        self.grading = set()
+        self._checked_at = float('-inf')
+        self._pinning = None
+        self._task = None
+
+    async def current(self):
+        stale = self.challenge is None or datetime.now(pytz.UTC) > self.challenge['end_time']
+        # Another instance may have posted a new challenge; look again, but at most every recheck_seconds
+        if stale and time_module.monotonic() - self._checked_at >= self.recheck_seconds:
+            if self._pinning is None:
+                self._pinning = asyncio.create_task(self.pin())
+                self._pinning.add_done_callback(lambda _: setattr(self, '_pinning', None))
+            await asyncio.shield(self._pinning)
+        return self.challenge
+
+    async def pin(self):
+        self._checked_at = time_module.monotonic()
+        try:
+            async with DB_SEMAPHORE:
+                async with bot.db.acquire() as conn:
+                    row = await conn.fetchrow('''
+                        SELECT cc.id, cc.question_id, cc.end_time, q.answer
+                        FROM current_challenge cc
+                        JOIN questions q ON q.id = cc.question_id
+                        ORDER BY cc.id DESC
+                        LIMIT 1
+                    ''')
+                    submitters = []
+                    if row:
+                        submitters = await conn.fetch(
+                            'SELECT user_id FROM challenge_submissions WHERE challenge_id = $1', row['id'])
+        except Exception as e:
+            logging.error(f"Error pinning current challenge: {e}")
+            return
+        if row is None:
+            self.challenge = None
+            return
+        challenge = dict(row)
+        challenge['end_time'] = row['end_time'].replace(tzinfo=pytz.UTC)
+        if self.challenge is None or self.challenge['id'] != challenge['id']:
+            self.submitted = set()
+        self.submitted.update(r['user_id'] for r in submitters)
+        # Tokenize the reference once now rather than on the first of hundreds of submissions
+        SIMILARITY.encode(canonicalize_sql(challenge['answer']))
+        self.challenge = challenge
+        logging.info(f"Pinned challenge {challenge['id']} with {len(self.submitted)} submissions so far")
+
+    def claim(self, user_id):
+        if user_id in self.submitted:
+            return False
+        self.submitted.add(user_id)
+        return True
+
+    def submit(self, user_id, answer):
+        task = asyncio.create_task(self._grade(self.challenge, user_id, answer, datetime.now(pytz.UTC)))
+        self.grading.add(task)
+        task.add_done_callback(self.grading.discard)
+
+    async def _grade(self, challenge, user_id, answer, submitted_at):
+        try:
+            is_correct, _ = await GRADER.grade(challenge['question_id'], answer, challenge['answer'])
+        except Exception as e:
+            logging.error(f"Error grading challenge submission from {user_id}: {e}")
+            is_correct = False
+        self.pending.append((user_id, challenge['id'], answer, is_correct, submitted_at))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self.drain()
+
+    async def drain(self):
+        if self.grading:
+            await asyncio.gather(*self.grading, return_exceptions=True)
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        while self.pending:
+            batch = self.pending[:self.batch_size]
+            del self.pending[:len(batch)]
+            try:
+                async with DB_SEMAPHORE:
+                    async with bot.db.acquire() as conn:
+                        # Other instances keep their own submitter sets; the unique key settles the rest
+                        await conn.execute('''
+                            INSERT INTO challenge_submissions (user_id, challenge_id, answer, is_correct, submitted_at)
+                            SELECT * FROM UNNEST($1::BIGINT[], $2::INTEGER[], $3::TEXT[], $4::BOOLEAN[], $5::TIMESTAMPTZ[])
+                            ON CONFLICT (user_id, challenge_id) DO NOTHING
+                        ''', *(list(column) for column in zip(*batch)))
+                CHALLENGE_SUBMISSION_WRITES.inc(amount=len(batch))
+            except Exception as e:
+                logging.error(f"Error writing {len(batch)} challenge submissions: {e}")
+                self.pending[:0] = batch
+                return
+            except BaseException:
+                # Cancelled mid-insert: these users were already told their answer is in
+                self.pending[:0] = batch
+                raise
+
+CHALLENGE_BURST = ChallengeBurst(CHALLENGE_FLUSH_MS / 1000)
+CHALLENGE_SUBMISSION_WRITES = METRICS.register(Counter('sql_mentor_challenge_submission_writes_total',
+                                                       'Challenge submissions inserted'))
+METRICS.register(Gauge('sql_mentor_challenge_submissions_pending', 'Challenge submissions waiting to be graded or written',
+                       lambda: len(CHALLENGE_BURST.grading) + len(CHALLENGE_BURST.pending)))
+
 @bot.command()
 async def submit_challenge(ctx, *, answer):
     user_id = ctx.author.id
-    username = str(ctx.author)
     
     try:
-        async with DB_SEMAPHORE:
-            async with bot.db.acquire() as conn:
-                current_challenge = await conn.fetchrow('SELECT * FROM current_challenge')
-                if not current_challenge:
-                    await ctx.send("🤔 There is no active challenge right now. The next challenge will be posted at 5:30 PM IST!")
-                    return
-
-                now = datetime.now(pytz.UTC)
-                end_time = current_challenge['end_time'].replace(tzinfo=pytz.UTC)
-                
-                if now > end_time:
-                    await ctx.send("⏰ The challenge time is over! Wait for the next challenge at 5:30 PM tomorrow.")
-                    return
-
-                previous_submission = await conn.fetchrow('''
-                    SELECT * FROM challenge_submissions 
-                    WHERE user_id = $1 AND challenge_id = $2
-                ''', user_id, current_challenge['id'])
-                
-                if previous_submission:
-                    await ctx.send("🔄 You've already submitted an answer for this challenge!\n✨ Stay tuned for the results!")
-                    return
+        current_challenge = await CHALLENGE_BURST.current()
+        if not current_challenge:
+            await ctx.send("🤔 There is no active challenge right now. The next challenge will be posted at 5:30 PM IST!")
+            return
 
-                # Fetch the correct answer from the questions table
-                question = await conn.fetchrow('SELECT answer FROM questions WHERE id = $1', current_challenge['question_id'])
-                if not question:
-                    await ctx.send("❌ An error occurred while fetching the challenge question. Please try again later.")
-                    return
+        if datetime.now(pytz.UTC) > current_challenge['end_time']:
+            await ctx.send("⏰ The challenge time is over! Wait for the next challenge at 5:30 PM tomorrow.")
+            return
 
-                # Use the same similarity check as regular questions
-                is_correct, _ = check_answer(answer, question['answer'])
+        if not CHALLENGE_BURST.claim(user_id):
+            await ctx.send("🔄 You've already submitted an answer for this challenge!\n✨ Stay tuned for the results!")
+            return
 
-                # Store submission with correctness flag
-                await conn.execute('''
-                    INSERT INTO challenge_submissions (user_id, challenge_id, answer, is_correct)
-                    VALUES ($1, $2, $3, $4)
-                ''', user_id, current_challenge['id'], answer, is_correct)
+        # Graded with the same similarity check as regular questions, then written in the next batch
+        CHALLENGE_BURST.submit(user_id, answer)
 
         # Send confirmation message
         await ctx.send(
@@ -970,77 +3063,99 @@ async def submit_challenge(ctx, *, answer):
         await ctx.send("❌ An error occurred while processing your submission. Please try again.")
 
 
+async def drain_challenge_submissions():
+    """Wait until every worker has graded and written its challenge submissions."""
+    if not CLUSTER_BUS:
+        await CHALLENGE_BURST.drain()
+        return
+    # Every worker replies None, so the hub only answers once all of them have drained
+    await asyncio.gather(CHALLENGE_BURST.drain(),
+                         CLUSTER_BUS.request('challenge_drain', {}, timeout=30))
+
+async def drain_local_challenge(payload):
+    await CHALLENGE_BURST.drain()
+    return None
+
 @tasks.loop(time=time(hour=16, minute=0))  # 9:30 PM IST
 async def challenge_time_over():
     try:
+        # Results must see every submission still being graded or batched, on any worker
+        await drain_challenge_submissions()
+        awards = []
         async with DB_SEMAPHORE:
             async with bot.db.acquire() as conn:
-                logging.info("Processing challenge results...")
-                current_challenge = await conn.fetchrow('SELECT * FROM current_challenge')
-                if not current_challenge:
-                    return
+                # Fence, awards and clearing the challenge commit together, so a stale leader cannot award twice
+                async with conn.transaction():
+                    logging.info("Processing challenge results...")
+                    current_challenge = await conn.fetchrow('SELECT * FROM current_challenge FOR UPDATE')
+                    if not current_challenge:
+                        return
 
-                question = await conn.fetchrow('SELECT * FROM questions WHERE id = $1', current_challenge['question_id'])
-                if not question:
-                    logging.error(f"Could not find question with ID {current_challenge['question_id']}")
-                    return
+                    if not await LEADER.holds_fence(conn):
+                        return
 
-                submissions = await conn.fetch('''
-                    SELECT cs.*, u.username
-                    FROM challenge_submissions cs
-                    JOIN users u ON cs.user_id = u.user_id
-                    WHERE cs.challenge_id = $1
-                ''', current_challenge['id'])
-
-                base_points = {'easy': 60, 'medium': 80, 'hard': 120}.get(question['difficulty'], 60)
-                challenge_points = base_points * 2
-
-                challenge_over_message = (
-                    "🏆 **DAILY CHALLENGE RESULTS** 🏆\n"
-                    "━━━━━━━━━━━━━━━━━━━━━━\n\n"
-                    f"📝 Challenge ID: {current_challenge['id']}\n"
-                    f"📊 Difficulty: {question['difficulty'].capitalize()}\n"
-                    f"💫 Points Available: {challenge_points}\n\n"
-                )
+                    question = await QUESTIONS.get(current_challenge['question_id'], conn)
+                    if not question:
+                        logging.error(f"Could not find question with ID {current_challenge['question_id']}")
+                        return
+
+                    submissions = await conn.fetch('''
+                        SELECT cs.*, u.username
+                        FROM challenge_submissions cs
+                        JOIN users u ON cs.user_id = u.user_id
+                        WHERE cs.challenge_id = $1
+                    ''', current_challenge['id'])
+
+                    base_points = {'easy': 60, 'medium': 80, 'hard': 120}.get(question['difficulty'], 60)
+                    challenge_points = base_points * 2
+
+                    challenge_over_message = (
+                        "🏆 **DAILY CHALLENGE RESULTS** 🏆\n"
+                        "━━━━━━━━━━━━━━━━━━━━━━\n\n"
+                        f"📝 Challenge ID: {current_challenge['id']}\n"
+                        f"📊 Difficulty: {question['difficulty'].capitalize()}\n"
+                        f"💫 Points Available: {challenge_points}\n\n"
+                    )
+
+                    correct_submissions = []
+                    incorrect_submissions = []
 
-                correct_submissions = []
-                incorrect_submissions = []
+                    for sub in submissions:
+                        user_answer = sqlparse.format(sub['answer'], strip_comments=True, reindent=True).strip().lower()
+                        correct_answer = sqlparse.format(question['answer'], strip_comments=True, reindent=True).strip().lower()
+                        is_correct = user_answer == correct_answer
 
-                for sub in submissions:
-                    user_answer = sqlparse.format(sub['answer'], strip_comments=True, reindent=True).strip().lower()
-                    correct_answer = sqlparse.format(question['answer'], strip_comments=True, reindent=True).strip().lower()
-                    is_correct = user_answer == correct_answer
+                        if is_correct:
+                            correct_submissions.append(f"🌟 {sub['username']} (+{challenge_points} points)")
+                            awards.append((sub['user_id'], question['id'], True, challenge_points))
+                        else:
+                            incorrect_submissions.append(f"❌ {sub['username']} (-20 points)")
+                            awards.append((sub['user_id'], question['id'], False, -20))
 
-                    if is_correct:
-                        correct_submissions.append(f"🌟 {sub['username']} (+{challenge_points} points)")
-                        await update_user_stats(sub['user_id'], question['id'], True, challenge_points)
+                    if correct_submissions:
+                        challenge_over_message += "**🎉 CORRECT SUBMISSIONS:**\n" + "\n".join(correct_submissions) + "\n"
                     else:
-                        incorrect_submissions.append(f"❌ {sub['username']} (-20 points)")
-                        await update_user_stats(sub['user_id'], question['id'], False, -20)
-
-                if correct_submissions:
-                    challenge_over_message += "**🎉 CORRECT SUBMISSIONS:**\n" + "\n".join(correct_submissions) + "\n"
-                else:
-                    challenge_over_message += "**😮 No correct submissions this time!**\n"
-
-                if incorrect_submissions:
-                    challenge_over_message += "\n**❌ INCORRECT SUBMISSIONS:**\n" + "\n".join(incorrect_submissions) + "\n"
-
-                challenge_over_message += (
-                    f"\n📚 **Correct Answer:**\n```sql\n{question['answer']}\n```\n"
-                    "━━━━━━━━━━━━━━━━━━━━━━\n"
-                    "🌟 Next challenge at 5:30 PM IST! tomorrow\n"
-                    "💪 Keep practicing and level up your SQL skills!"
-                )
+                        challenge_over_message += "**😮 No correct submissions this time!**\n"
+
+                    if incorrect_submissions:
+                        challenge_over_message += "\n**❌ INCORRECT SUBMISSIONS:**\n" + "\n".join(incorrect_submissions) + "\n"
 
-                # Send results to all channels
-                for channel_id in CHANNEL_IDS:
-                    channel = bot.get_channel(channel_id)
-                    if channel:
-                        await channel.send(challenge_over_message)
+                    for award in awards:
+                        await write_user_stats(conn, *award)
+                    await conn.execute('DELETE FROM current_challenge WHERE id = $1', current_challenge['id'])
+
+                    challenge_over_message += (
+                        f"\n📚 **Correct Answer:**\n```sql\n{question['answer']}\n```\n"
+                        "━━━━━━━━━━━━━━━━━━━━━━\n"
+                        "🌟 Next challenge at 5:30 PM IST! tomorrow\n"
+                        "💪 Keep practicing and level up your SQL skills!"
+                    )
+                # Still holding the connection, as in update_user_stats
+                for award in awards:
+                    note_user_stats(*award)
 
-                # Clear current challenge
-                await clear_current_challenge()
+        # Send results to all channels
+        await broadcast_to_channels(challenge_over_message)
 
     except Exception as e:
         logging.error(f"Error in challenge_time_over task: {e}")
@@ -1097,6 +3212,17 @@ def setup_logging():
     handler.setFormatter(formatter)
     logger.addHandler(handler)
 
+    slow_handler = RotatingFileHandler(
+        filename='slow_queries.log',
+        encoding='utf-8',
+        maxBytes=8 * 1024 * 1024,  # 8 MiB
+        backupCount=3,
+    )
+    slow_handler.setFormatter(logging.Formatter('[{asctime}] {message}', dt_fmt, style='{'))
+    slow_query_logger.addHandler(slow_handler)
+    slow_query_logger.setLevel(logging.INFO)
+    slow_query_logger.propagate = False
+
     return logger
 
 logger = setup_logging()
@@ -1123,19 +3249,63 @@ async def question_timer(ctx, question_id, time_limit):
 
 
 async def get_challenge_questions(num_questions=5):
-    async with DB_SEMAPHORE:
-        async with bot.db.acquire() as conn:
-            questions = await conn.fetch('''
-                SELECT * FROM questions
-                ORDER BY RANDOM()
-                LIMIT $1
-            ''', num_questions)
-    return questions
+    rows = await QUESTIONS.select()
+    picks = [row['id'] for row in random.sample(rows, min(num_questions, len(rows)))]
+    by_id = await QUESTIONS.get_many(picks)
+    return [by_id[question_id] for question_id in picks if question_id in by_id]
+
+class SubmissionRouter:
+    """Hands `!submit` messages to whoever is waiting on (channel_id, author_id).
+
+    Replaces bot.wait_for('message', check=...), which runs every waiter's check
+    against every message. A delivered message is consumed: on_message does not
+    also run it as a regular !submit.
+    """
+
+    def __init__(self):
+        self.waiters = {}
+
+    def subscribe(self, channel_id, author_ids, sink):
+        """Route these authors' submissions to sink(message), which returns True if it took the message."""
+        keys = [(channel_id, author_id) for author_id in author_ids]
+        for key in keys:
+            # The newest waiter wins; an older one for the same key stops receiving
+            self.waiters[key] = sink
+        return keys
+
+    def unsubscribe(self, keys, sink):
+        for key in keys:
+            if self.waiters.get(key) is sink:
+                del self.waiters[key]
+
+    async def wait(self, channel_id, author_ids, timeout):
+        future = asyncio.get_running_loop().create_future()
+
+        def accept(message):
+            if future.done():
+                return False
+            future.set_result(message)
+            return True
+
+        keys = self.subscribe(channel_id, author_ids, accept)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self.unsubscribe(keys, accept)
+
+    def deliver(self, message):
+        if message.content.split(maxsplit=1)[:1] != ['!submit']:
+            return False
+        sink = self.waiters.get((message.channel.id, message.author.id))
+        return bool(sink and sink(message))
+
+SUBMISSIONS = SubmissionRouter()
+METRICS.register(Gauge('sql_mentor_submission_waiters', 'Players waiting on a challenge or battle answer',
+                       lambda: len(SUBMISSIONS.waiters)))
 
 @bot.command()
 async def challenge(ctx, num_questions: int = 5):
     user_id = ctx.author.id
-    await user_last_active.set(user_id, datetime.now(timezone.utc))
     username = str(ctx.author)
     await ensure_user_exists(user_id, username)
 
@@ -1153,13 +3323,11 @@ async def challenge(ctx, num_questions: int = 5):
         await ctx.send(f"Question {i}/{num_questions}:")
         time_limit = await display_question(ctx, question)
 
-        def check(m):
-            return m.author == ctx.author and m.content.startswith('!submit')
-
         try:
-            msg = await bot.wait_for('message', check=check, timeout=time_limit * 60)  # Convert minutes to seconds
+            msg = await SUBMISSIONS.wait(ctx.channel.id, [ctx.author.id], timeout=time_limit * 60)  # Convert minutes to seconds
             answer = msg.content[8:].strip()  # Remove '!submit ' from the beginning
-            if similar(answer.lower(), question['answer'].lower()) >= 0.8:
+            is_correct, _ = await GRADER.grade(question['id'], answer, question['answer'])
+            if is_correct:
                 await ctx.send("Correct!")
                 correct_answers += 1
             else:
@@ -1181,77 +3349,153 @@ async def challenge(ctx, num_questions: int = 5):
 @bot.command()
 async def challenge_history(ctx):
     user_id = ctx.author.id
-    async with DB_SEMAPHORE:
-        async with bot.db.acquire() as conn:
-            history = await conn.fetch('''
-                SELECT * FROM user_challenges
-                WHERE user_id = $1
-                ORDER BY completed_at DESC
-                LIMIT 5
-            ''', user_id)
 
-    if history:
-        await ctx.send("Your recent challenge history:")
+    def render(history, page_index):
+        lines = [f"Your challenge history (page {page_index + 1}):"]
         for challenge in history:
-            await ctx.send(f"Date: {challenge['completed_at'].replace(tzinfo=timezone.utc).astimezone(timezone(timedelta(hours=5, minutes=30)))}, Score: {challenge['correct_answers']}/{challenge['total_questions']}, Time: {challenge['time_taken']:.2f} minutes")
-    else:
+            lines.append(f"Date: {challenge['completed_at'].replace(tzinfo=timezone.utc).astimezone(timezone(timedelta(hours=5, minutes=30)))}, Score: {challenge['correct_answers']}/{challenge['total_questions']}, Time: {challenge['time_taken']:.2f} minutes")
+        return "\n".join(lines)
+
+    fetch = keyset_fetcher('''
+        SELECT id, completed_at, correct_answers, total_questions, time_taken
+        FROM user_challenges
+        WHERE user_id = $1
+    ''', ('completed_at', 'id'), params=(user_id,), descending=True)
+    paginator = KeysetPaginator(user_id, fetch, render, ('completed_at', 'id'), page_size=10)
+    if not await paginator.start(ctx):
         await ctx.send("You haven't completed any challenges yet.")
 
+BATTLE_ATTEMPTS_PER_ROUND = 3
+ACTIVE_BATTLES = {}  # channel id -> SQLBattle
+
+async def pick_battle_questions(player_ids, count):
+    """Questions none of the players has solved, topped up with solved ones if there are too few."""
+    all_ids = {row['id'] for row in await QUESTIONS.select()}
+    async with DB_SEMAPHORE:
+        async with bot.db.acquire() as conn:
+            solved_rows = await conn.fetch('''
+                SELECT user_id, ARRAY_AGG(DISTINCT question_id) AS solved
+                FROM user_submissions
+                WHERE user_id = ANY($1::BIGINT[]) AND is_correct = TRUE
+                GROUP BY user_id
+            ''', list(player_ids))
+            solved = {row['user_id']: set(row['solved']) for row in solved_rows}
+            unsolved = all_ids.intersection(*(all_ids - solved.get(player_id, set()) for player_id in player_ids))
+            picks = random.sample(sorted(unsolved), min(count, len(unsolved)))
+            if len(picks) < count:
+                picks += random.sample(sorted(all_ids - set(picks)), min(count - len(picks), len(all_ids) - len(picks)))
+            by_id = await QUESTIONS.get_many(picks, conn)
+    return [by_id[question_id] for question_id in picks if question_id in by_id]
+
 class SQLBattle:
+    """One battle, run as an actor over its own event queue.
+
+    Events are ('submit', round, message) from SUBMISSIONS, ('graded', round,
+    seq, message, is_correct) from grading tasks and ('timeout', round) from the
+    round timer. Every submission is graded concurrently, but verdicts are
+    settled in arrival order, so the earliest correct answer wins the round.
+
+    Submissions are only taken while a round is open and the player has
+    attempts left; anything else runs as a regular !submit.
+    """
+
     def __init__(self, channel, players, num_questions=5):
         self.channel = channel
-        self.players = players
+        self.players = {player.id: player for player in players}
         self.num_questions = num_questions
         self.scores = {player.id: 0 for player in players}
-        self.current_question = None
-        self.answered = False
+        self.events = asyncio.Queue()
+        self.round = None  # (round number, attempts per player) while answers are accepted
+
+    def _on_submit(self, message):
+        if self.round is None:
+            return False
+        round_number, attempts = self.round
+        if attempts[message.author.id] >= BATTLE_ATTEMPTS_PER_ROUND:
+            return False
+        attempts[message.author.id] += 1
+        self.events.put_nowait(('submit', round_number, message))
+        return True
 
     async def start(self):
-        await self.channel.send("SQL Battle started! Get ready for the questions!")
-        for i in range(self.num_questions):
-            await self.ask_question()
-        await self.end_battle()
-
-    async def ask_question(self):
-        self.current_question = await get_question()
-        self.answered = False
-        time_limit = await display_question(self.channel, self.current_question)
-        
+        ACTIVE_BATTLES[self.channel.id] = self
+        sink = self._on_submit  # one bound method, so unsubscribe() can match it by identity
+        keys = SUBMISSIONS.subscribe(self.channel.id, self.players, sink)
         try:
-            def check(m):
-                return m.author in self.players and m.content.startswith('!submit')
-            
-            msg = await bot.wait_for('message', check=check, timeout=time_limit * 60)
-            await self.process_answer(msg)
-        except asyncio.TimeoutError:
-            await self.channel.send("Time's up! No one answered correctly.")
-
-    async def process_answer(self, msg):
-        if self.answered:
-            return
-        
-        answer = msg.content[8:].strip()
-        if similar(answer.lower(), self.current_question['answer'].lower()) >= 0.8:
-            self.scores[msg.author.id] += 1
-            self.answered = True
-            await self.channel.send(f"{msg.author.mention} answered correctly! They get a point!")
-        else:
-            await self.channel.send(f"{msg.author.mention}'s answer is incorrect.")
+            questions = await pick_battle_questions(self.players, self.num_questions)
+            if not questions:
+                await self.channel.send("Unable to start the battle. No questions are available.")
+                return
+            await self.channel.send("SQL Battle started! Get ready for the questions!")
+            for round_number, question in enumerate(questions, 1):
+                await self.play_round(round_number, len(questions), question)
+            await self.end_battle()
+        finally:
+            SUBMISSIONS.unsubscribe(keys, sink)
+            ACTIVE_BATTLES.pop(self.channel.id, None)
+
+    async def play_round(self, round_number, rounds, question):
+        await self.channel.send(f"Round {round_number}/{rounds}\n" + format_question(question), file=dataset_file(question))
+
+        loop = asyncio.get_running_loop()
+        timer = loop.call_later(question_time_limit(question) * 60, self.events.put_nowait, ('timeout', round_number))
+        self.round = (round_number, collections.Counter())
+        grading = set()
+        verdicts = {}
+        submitted = settled = 0
+        try:
+            while True:
+                event = await self.events.get()
+                if event[0] == 'timeout' and event[1] == round_number:
+                    await self.channel.send("Time's up! No one answered correctly.")
+                    return
+                if event[0] == 'submit' and event[1] == round_number:
+                    message = event[2]
+                    task = asyncio.create_task(self._grade(round_number, submitted, message, question))
+                    grading.add(task)
+                    task.add_done_callback(grading.discard)
+                    submitted += 1
+                elif event[0] == 'graded' and event[1] == round_number:
+                    _, _, seq, message, is_correct = event
+                    verdicts[seq] = (message, is_correct)
+                    while settled in verdicts:
+                        message, is_correct = verdicts.pop(settled)
+                        settled += 1
+                        if is_correct:
+                            self.scores[message.author.id] += 1
+                            await self.channel.send(f"{message.author.mention} answered correctly! They get a point!")
+                            return
+                        await self.channel.send(f"{message.author.mention}'s answer is incorrect.")
+        finally:
+            self.round = None
+            timer.cancel()
+            for task in grading:
+                task.cancel()
+
+    async def _grade(self, round_number, seq, message, question):
+        answer = message.content[len('!submit'):].strip()
+        try:
+            is_correct, _ = await GRADER.grade(question['id'], answer, question['answer'])
+        except Exception as e:
+            logging.error(f"Error grading battle answer: {e}")
+            is_correct = False
+        self.events.put_nowait(('graded', round_number, seq, message, is_correct))
 
     async def end_battle(self):
         sorted_scores = sorted(self.scores.items(), key=lambda x: x[1], reverse=True)
         result = "Final Scores:\n"
         for player_id, score in sorted_scores:
-            player = bot.get_user(player_id)
-            result += f"{player.name}: {score} points\n"
+            result += f"{self.players[player_id].name}: {score} points\n"
         await self.channel.send(result)
-        winner = bot.get_user(sorted_scores[0][0])
+        winner = self.players[sorted_scores[0][0]]
         await self.channel.send(f"🎉 {winner.mention} wins the SQL Battle! 🏆")
 
 @bot.command()
 @commands.cooldown(1, 5, commands.BucketType.user)
 async def sql_battle(ctx):
-    await user_last_active.set(ctx.author.id, datetime.now(timezone.utc))
+    if ctx.channel.id in ACTIVE_BATTLES:
+        await ctx.send("A battle is already running in this channel. Join the next one, or start one elsewhere!")
+        return
     await ctx.send("SQL Battle is starting! React with 👍 to join. The battle will begin in 30 seconds.")
     message = await ctx.send("Waiting for players...")
     await message.add_reaction("👍")
@@ -1268,6 +3512,9 @@ async def sql_battle(ctx):
     if len(players) < 2:
         await ctx.send("Not enough players to start the battle. At least 2 players are required.")
         return
+    if ctx.channel.id in ACTIVE_BATTLES:
+        await ctx.send("Another battle started in this channel while players were joining.")
+        return
 
     battle = SQLBattle(ctx.channel, players)
     await battle.start()
@@ -1275,7 +3522,6 @@ async def sql_battle(ctx):
 @bot.command()
 async def set_difficulty(ctx, difficulty: str):
     user_id = ctx.author.id
-    await user_last_active.set(user_id, datetime.now(timezone.utc))
     valid_difficulties = ['easy', 'medium', 'hard']
     difficulty_emojis = {'easy': '🟢', 'medium': '🟡', 'hard': '🔴'}
     
@@ -1290,6 +3536,7 @@ async def set_difficulty(ctx, difficulty: str):
                 VALUES ($1, $2)
                 ON CONFLICT (user_id) DO UPDATE SET preferred_difficulty = $2
             ''', user_id, difficulty.lower())
+    PROFILES.update(user_id, preference=difficulty.lower())
     
     emoji = difficulty_emojis[difficulty.lower()]
     await ctx.send(f"{emoji} Great choice! Your preferred difficulty has been set to **{difficulty}**.\n\n"
@@ -1307,6 +3554,7 @@ async def reset_preference(ctx):
                     SET preferred_difficulty = NULL
                     WHERE user_id = $1
                 ''', user_id)
+        PROFILES.update(user_id, preference=None)
         await ctx.send("🔄 Your difficulty preference has been reset. You'll now receive questions from all difficulties.\n\n"
                        "To set a new preference, use `!set_difficulty <easy/medium/hard>`")
     except Exception as e:
@@ -1382,7 +3630,6 @@ async def check_achievements(user_id):
 @bot.command()
 async def my_achievements(ctx):
     user_id = ctx.author.id
-    await user_last_active.set(user_id, datetime.now(timezone.utc))  # Add this line
     async with DB_SEMAPHORE:
         async with bot.db.acquire() as conn:
             achievements = await conn.fetch('''
@@ -1434,12 +3681,7 @@ async def update_user_achievements(ctx, user_id):
                 )
                 
                 # Send to the specified bot channels
-                for channel_id in CHANNEL_IDS:
-                    channel = bot.get_channel(channel_id)
-                    if channel:
-                        await channel.send(channel_msg)
-                    else:
-                        logging.warning(f"Channel with ID {channel_id} not found")
+                await broadcast_to_channels(channel_msg)
 
     except Exception as e:
         logging.error(f"Error in update_user_achievements: {e}")
@@ -1456,6 +3698,19 @@ async def ensure_tables_exist():
                         user_id BIGINT PRIMARY KEY,
                         username VARCHAR(255) NOT NULL
                     );
+                    ALTER TABLE users ADD COLUMN IF NOT EXISTS last_active TIMESTAMP WITH TIME ZONE;
+
+                    CREATE TABLE IF NOT EXISTS activity_sketches (
+                        day DATE PRIMARY KEY,
+                        registers BYTEA NOT NULL
+                    );
+
+                    CREATE TABLE IF NOT EXISTS leader_lease (
+                        lock_key BIGINT PRIMARY KEY,
+                        token BIGINT NOT NULL,
+                        holder VARCHAR(255) NOT NULL,
+                        acquired_at TIMESTAMP WITH TIME ZONE NOT NULL
+                    );
 
                     CREATE TABLE IF NOT EXISTS scheduled_posts (
                         id SERIAL PRIMARY KEY,
@@ -1471,6 +3726,12 @@ async def ensure_tables_exist():
                         UNIQUE(question_id, challenge_date)
                     );
 
+                    CREATE TABLE IF NOT EXISTS challenge_queue (
+                        question_id INTEGER PRIMARY KEY,
+                        position INTEGER NOT NULL,
+                        planned_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+                    );
+
                     CREATE TABLE IF NOT EXISTS challenge_submissions (
                         id SERIAL PRIMARY KEY,
                         user_id BIGINT NOT NULL,
@@ -1506,6 +3767,9 @@ async def ensure_tables_exist():
                         topic VARCHAR(255),
                         company VARCHAR(255)
                     );
+                    ALTER TABLE questions ADD COLUMN IF NOT EXISTS datasets TEXT;
+                    ALTER TABLE questions ADD COLUMN IF NOT EXISTS hint TEXT;
+                    ALTER TABLE questions ADD COLUMN IF NOT EXISTS datasets_gz BYTEA;
                                    
                     -- In your table creation script
                         CREATE TABLE IF NOT EXISTS user_stats (
@@ -1568,6 +3832,13 @@ async def ensure_tables_exist():
                         remarks TEXT,
                         reported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                     );
+
+                    -- Keyset pagination indexes for the paged listings
+                    CREATE INDEX IF NOT EXISTS idx_reports_reported_at ON reports (reported_at DESC, id DESC);
+                    CREATE INDEX IF NOT EXISTS idx_user_challenges_user_completed ON user_challenges (user_id, completed_at DESC, id DESC);
+                    CREATE INDEX IF NOT EXISTS idx_questions_topic ON questions (topic);
+                    CREATE INDEX IF NOT EXISTS idx_questions_company ON questions (company);
+                    CREATE INDEX IF NOT EXISTS idx_user_submissions_user_submitted ON user_submissions (user_id, submitted_at);
                 ''')
         logging.info("All tables created successfully")
     except Exception as e:
@@ -1595,6 +3866,21 @@ async def wait_for_db():
 
 async def graceful_shutdown():
     print("Shutting down gracefully...")
+    MAILBOXES.close()
+    WATCHDOG.stop()
+    roll_over_daily_counters.cancel()
+    await LEADER.stop()
+    if TRAFFIC:
+        await TRAFFIC.stop()
+    await KNOWN_USERS.stop()
+    await ACTIVITY.stop()
+    await CHALLENGE_BURST.stop()
+    GRADER.stop()
+    QUESTIONS.stop()
+    if CLUSTER_BUS:
+        await CLUSTER_BUS.close()
+    if hasattr(bot, 'metrics_runner'):
+        await bot.metrics_runner.cleanup()
     if hasattr(bot, 'db'):
         await bot.db.close()
     await bot.close()
@@ -1602,7 +3888,6 @@ async def graceful_shutdown():
 @bot.command()
 async def check_db(ctx):
     user_id = ctx.author.id
-    await user_last_active.set(user_id, datetime.now(timezone.utc))
     try:
         result = await db_operation(lambda conn: conn.fetchval("SELECT 1"))
         if result == 1:
@@ -1637,7 +3922,6 @@ async def calculate_points(user_id, is_correct, difficulty):
 
 async def get_topic_question(ctx, topic_name):
     user_id = ctx.author.id
-    await user_last_active.set(user_id, datetime.now(timezone.utc))
     username = str(ctx.author)
     await ensure_user_exists(user_id, username)
     try:
@@ -1668,7 +3952,6 @@ def get_ist_time():
 @bot.command()
 async def set_preference(ctx, *, preference=None):
     user_id = ctx.author.id
-    await user_last_active.set(user_id, datetime.now(timezone.utc))
     username = str(ctx.author)
     await ensure_user_exists(user_id, username)
 
@@ -1694,6 +3977,7 @@ async def set_preference(ctx, *, preference=None):
                     VALUES ($1, $2)
                     ON CONFLICT (user_id) DO UPDATE SET preferred_difficulty = $2
                 ''', user_id, preference.lower())
+        PROFILES.update(user_id, preference=preference.lower())
 
         await ctx.send(f"Your preferred difficulty has been set to '{preference}'. "
                        f"You can reset it anytime using the `!reset_preference` command.")
@@ -1705,7 +3989,6 @@ async def set_preference(ctx, *, preference=None):
 @bot.command()
 async def submit_question(ctx, *, question):
     user_id = ctx.author.id
-    await user_last_active.set(user_id, datetime.now(timezone.utc))
     username = str(ctx.author)
     submitted_at = datetime.now(timezone.utc)
     
@@ -1945,37 +4228,14 @@ async def submit_question(ctx, *, question):
 @bot.command()
 async def daily_progress(ctx):
     user_id = ctx.author.id
-    await user_last_active.set(user_id, datetime.now(timezone.utc))
-    today = get_ist_time().date()
     
     try:
-        async with DB_SEMAPHORE:
-            async with bot.db.acquire() as conn:
-                # Get total attempts and submissions for today (including all attempts)
-                daily_stats = await conn.fetchrow('''
-                    WITH daily_attempts AS (
-                        SELECT 
-                            COUNT(*) as total_attempts,
-                            SUM(CASE WHEN is_correct THEN 1 ELSE 0 END) as correct_answers,
-                            SUM(CASE WHEN NOT is_correct THEN 1 ELSE 0 END) as incorrect_answers,
-                            COALESCE(SUM(points), 0) as total_points,
-                            COUNT(DISTINCT question_id) as unique_questions
-                        FROM user_submissions
-                        WHERE user_id = $1 
-                        AND DATE(submitted_at AT TIME ZONE 'UTC' AT TIME ZONE 'Asia/Kolkata') = 
-                            DATE($2 AT TIME ZONE 'Asia/Kolkata')
-                    )
-                    SELECT 
-                        *,
-                        25 - total_attempts as attempts_remaining
-                    FROM daily_attempts
-                ''', user_id, today)
-                
-                streak = await get_user_streak(user_id)
+        counts = await DAILY_COUNTERS.get(user_id)
+        streak = await get_user_streak(user_id)
         
-        if daily_stats and daily_stats['total_attempts'] > 0:
-            success_rate = (daily_stats['correct_answers'] / daily_stats['total_attempts']) * 100
-            points_today = daily_stats['total_points']
+        if counts['attempts'] > 0:
+            success_rate = (counts['correct'] / counts['attempts']) * 100
+            points_today = counts['points']
             
             # Calculate buffer (starts at 100, decreases with negative points)
             buffer_remaining = max(100 + min(points_today, 0), 0)
@@ -1984,16 +4244,16 @@ async def daily_progress(ctx):
                 "📊 **Today's SQL Progress Report** 📊\n"
                 "━━━━━━━━━━━━━━━━━━━━━━\n\n"
                 f"🎯 **Questions Stats**\n"
-                f"• Unique Questions: {daily_stats['unique_questions']}\n"
-                f"• Total Attempts: {daily_stats['total_attempts']}\n"
-                f"• Correct Answers: {daily_stats['correct_answers']} ✅\n"
-                f"• Incorrect Answers: {daily_stats['incorrect_answers']} ❌\n"
+                f"• Unique Questions: {len(counts['questions'])}\n"
+                f"• Total Attempts: {counts['attempts']}\n"
+                f"• Correct Answers: {counts['correct']} ✅\n"
+                f"• Incorrect Answers: {counts['attempts'] - counts['correct']} ❌\n"
                 f"• Success Rate: {success_rate:.1f}% 📈\n\n"
                 f"💫 **Rewards**\n"
                 f"• Points Today: {points_today} 💰\n"
                 f"• Current Streak: {streak} 🔥\n\n"
                 f"⏳ **Daily Limits**\n"
-                f"• Attempts Left: {daily_stats['attempts_remaining']} of 25 ⏳\n"
+                f"• Attempts Left: {25 - counts['attempts']} of 25 ⏳\n"
                 f"• Points Buffer: {buffer_remaining} 🛡️\n\n"
                 "Keep pushing forward! Every query makes you stronger! 💪\n"
                 "Use `!sql` to continue your learning journey! 🚀"
@@ -2019,7 +4279,6 @@ async def daily_progress(ctx):
 @bot.command()
 async def weekly_progress(ctx):
     user_id = ctx.author.id
-    await user_last_active.set(user_id, datetime.now(timezone.utc))
     week_start = await get_week_start()
     
     try:
@@ -2077,7 +4336,6 @@ async def weekly_progress(ctx):
 @bot.command()
 async def company(ctx, *, company_name=None):
     user_id = ctx.author.id
-    await user_last_active.set(user_id, datetime.now(timezone.utc))
     username = str(ctx.author)
     await ensure_user_exists(user_id, username)
 
@@ -2089,37 +4347,28 @@ async def company(ctx, *, company_name=None):
         return
 
     try:
-        async with DB_SEMAPHORE:
-            async with bot.db.acquire() as conn:
-                # Get questions where company name contains the search term
-                questions = await conn.fetch("""
-                    SELECT q.* 
-                    FROM questions q
-                    WHERE LOWER(company) LIKE $1
-                    AND q.id NOT IN (
-                        SELECT question_id 
-                        FROM user_submissions 
-                        WHERE user_id = $2 AND is_correct = true
-                    )
-                """, f"%{company_name.lower()}%", user_id)
-
-                if not questions:
-                    await ctx.send(f"No questions found for company containing '{company_name}'. Here are the available companies:")
-                    await list_companies(ctx)
-                    return
+        # Unsolved questions whose company name contains the search term
+        needle = company_name.lower()
+        solved = await get_solved_question_ids(user_id)
+        matches = [row for row in await QUESTIONS.select(exclude=solved) if row['company'] and needle in row['company'].lower()]
+
+        if not matches:
+            await ctx.send(f"No questions found for company containing '{company_name}'. Here are the available companies:")
+            await list_companies(ctx)
+            return
 
-                # Get a random question from matching questions
-                question = dict(random.choice(questions))  # Convert to dict to allow modification
-                if question:
-                    # Ensure difficulty is set
-                    if not question.get('difficulty'):
-                        question['difficulty'] = 'medium'  # Default to medium if not set
-                        
-                    await user_questions.set(user_id, question)
-                    await user_attempts.set(user_id, 0)
-                    await display_question(ctx, question)
-                else:
-                    await ctx.send(f"Sorry, no new questions available for companies matching '{company_name}' at the moment.")
+        # Only the chosen question's text is fetched
+        question = await QUESTIONS.get(random.choice(matches)['id'])
+        if question:
+            # Ensure difficulty is set
+            if not question.get('difficulty'):
+                question['difficulty'] = 'medium'  # Default to medium if not set
+                
+            await user_questions.set(user_id, question)
+            await user_attempts.set(user_id, 0)
+            await display_question(ctx, question)
+        else:
+            await ctx.send(f"Sorry, no new questions available for companies matching '{company_name}' at the moment.")
 
     except Exception as e:
         logging.error(f"Error in company question command: {e}")
@@ -2127,55 +4376,89 @@ async def company(ctx, *, company_name=None):
 
 async def list_companies(ctx):
     try:
-        async with DB_SEMAPHORE:
-            async with bot.db.acquire() as conn:
-                companies = await conn.fetch("SELECT DISTINCT company FROM questions WHERE company IS NOT NULL ORDER BY company")
-        
-        if companies:
-            company_list = ", ".join([f"{c['company']}" for c in companies])
-            await ctx.send(f"Available companies:\n{company_list}\n\nUse `!company <company name>` to get a question from a specific company.")
-        else:
+        def render(companies, page_index):
+            company_list = ", ".join(truncate(c['company'], 60) for c in companies)
+            return f"Available companies (page {page_index + 1}):\n{company_list}\n\nUse `!company <company name>` to get a question from a specific company."
+
+        fetch = keyset_fetcher("SELECT DISTINCT company FROM questions WHERE company IS NOT NULL", ('company',))
+        paginator = KeysetPaginator(ctx.author.id, fetch, render, ('company',), page_size=25)
+        if not await paginator.start(ctx):
             await ctx.send("No companies available at the moment.")
     except Exception as e:
         logging.error(f"Error in list_companies: {e}")
         await ctx.send("An error occurred while fetching the company list. Please try again later.")
 
-def check_answer(user_answer, correct_answer):
-    # Normalize and parse the SQL queries
-    user_sql = sqlparse.format(user_answer.strip().lower(), reindent=True, keyword_case='upper')
-    correct_sql = sqlparse.format(correct_answer.strip().lower(), reindent=True, keyword_case='upper')
+def timed_grading(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time_module.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            GRADING_LATENCY.observe(time_module.perf_counter() - started)
+    return wrapper
+
+GRADING_WORKERS = int(os.getenv('GRADING_WORKERS', '0'))
 
-    # Compare the parsed SQL structures
-    user_parsed = sqlparse.parse(user_sql)
-    correct_parsed = sqlparse.parse(correct_sql)
+class GradingService:
+    """Memoized grading, run inline or on a process pool.
 
-    # Calculate similarity
-    structure_similarity = compare_sql_structures(user_parsed, correct_parsed)
-    string_similarity = SequenceMatcher(None, user_sql, correct_sql).ratio()
-    overall_similarity = (structure_similarity + string_similarity) / 2
+    check_answer takes well under a millisecond on ordinary answers, so by
+    default it runs on the event loop. GRADING_WORKERS > 0 moves cache misses
+    to worker processes, so huge answers cannot stall the bot.
+    """
 
+    def __init__(self, workers):
+        self.workers = workers
+        self.pool = None
+
+    def start(self):
+        if self.workers:
+            # spawn, not fork: the parent already runs the watchdog and asyncio threads
+            self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def stop(self):
+        if self.pool:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+    async def grade(self, question_id, answer, correct_answer):
+        # Reformatted or re-aliased copies of an already graded query share its fingerprint;
+        # the reference's fingerprint retires old verdicts when a question's answer is edited
+        key = (question_id, sql_fingerprint(correct_answer), sql_fingerprint(answer))
+        result = GRADE_MEMO.get(key)
+        if result is not None:
+            GRADE_MEMO_LOOKUPS.inc('hit')
+            return result
+        GRADE_MEMO_LOOKUPS.inc('miss')
+        if self.pool is None:
+            result = check_answer(answer, correct_answer)
+        else:
+            # Timed here: the worker's own metrics never reach /metrics
+            GRADING_QUEUE_DEPTH.inc()
+            started = time_module.perf_counter()
+            try:
+                result = await asyncio.get_running_loop().run_in_executor(self.pool, check_answer, answer, correct_answer)
+            finally:
+                GRADING_QUEUE_DEPTH.dec()
+                GRADING_LATENCY.observe(time_module.perf_counter() - started)
+        GRADE_MEMO.put(key, result)
+        return result
+
+GRADER = GradingService(GRADING_WORKERS)
+
+@timed_grading
+def check_answer(user_answer, correct_answer):
+    # Graded on canonical forms, so anything sharing a fingerprint gets the same verdict
+    overall_similarity, bounded = SIMILARITY.score(canonicalize_sql(user_answer), canonicalize_sql(correct_answer), threshold=0.5)
     is_correct = overall_similarity >= 0.5
-    feedback = f"Similarity: {overall_similarity:.2%}"
+    # The early exit only knows the score is under the threshold; don't show its bound as a percentage
+    feedback = "Similarity: below 50.00%" if bounded else f"Similarity: {overall_similarity:.2%}"
     return is_correct, feedback
 
-def compare_sql_structures(user_parsed, correct_parsed):
-    def get_tokens(parsed):
-        return [token for stmt in parsed for token in stmt.flatten() if not token.is_whitespace]
-
-    user_tokens = get_tokens(user_parsed)
-    correct_tokens = get_tokens(correct_parsed)
-
-    common_tokens = set(token.normalized for token in user_tokens) & set(token.normalized for token in correct_tokens)
-    return len(common_tokens) / max(len(user_tokens), len(correct_tokens))
-
 async def get_user_streak(user_id):
     try:
-        async with DB_SEMAPHORE:
-            async with bot.db.acquire() as conn:
-                streak = await conn.fetchval('''
-                    SELECT streak FROM user_stats WHERE user_id = $1
-                ''', user_id)
-        return streak or 0
+        return (await PROFILES.get(user_id)).streak
     except Exception as e:
         logging.error(f"Error getting user streak: {e}")
         return 0
@@ -2323,67 +4606,48 @@ async def get_user_streak(user_id):
 
 async def update_user_streak(user_id):
     try:
+        profile = await PROFILES.get(user_id)
+        ist_now = get_ist_time()
+        today = ist_now.date()
+        yesterday = today - timedelta(days=1)
+
+        # Check today's activity (in IST)
+        if not (await DAILY_COUNTERS.get(user_id))['correct']:
+            return  # No streak update if no correct answers today
+
+        # Convert last_update to IST date if it exists
+        last_update = profile.last_streak_update
+        last_update_date = convert_to_ist(last_update).date() if last_update else None
+
+        # Update streak logic
+        if not last_update or not profile.streak:
+            # First time solving a question
+            new_streak = 1
+        elif last_update_date == today:
+            # Already updated today, keep current streak
+            return
+        elif last_update_date == yesterday:
+            # Streaks only move on days with a correct answer, so this one continues
+            new_streak = profile.streak + 1
+        else:
+            # Check yesterday's activity (in IST)
+            start, end = DailyCounterStore.day_bounds(yesterday)
+            async with DB_SEMAPHORE:
+                async with bot.db.acquire() as conn:
+                    yesterday_solved = await conn.fetchval('''
+                        SELECT EXISTS(
+                            SELECT 1
+                            FROM user_submissions
+                            WHERE user_id = $1
+                            AND is_correct = TRUE
+                            AND submitted_at >= $2 AND submitted_at < $3
+                        )
+                    ''', user_id, start, end)
+            new_streak = profile.streak + 1 if yesterday_solved else 1
+
+        # Update streak and last update timestamp in database
         async with DB_SEMAPHORE:
             async with bot.db.acquire() as conn:
-                ist_now = get_ist_time()
-                today = ist_now.date()
-                yesterday = today - timedelta(days=1)
-                
-                # Check if streak was already updated today
-                last_update = await conn.fetchval('''
-                    SELECT last_streak_update 
-                    FROM user_stats 
-                    WHERE user_id = $1
-                ''', user_id)
-                
-                # Convert last_update to IST date if it exists
-                last_update_date = None
-                if last_update:
-                    last_update_date = convert_to_ist(last_update).date()
-                
-                # Check today's activity (in IST)
-                today_solved = await conn.fetchval('''
-                    SELECT EXISTS(
-                        SELECT 1 
-                        FROM user_submissions
-                        WHERE user_id = $1 
-                        AND is_correct = TRUE
-                        AND DATE(submitted_at AT TIME ZONE 'UTC' AT TIME ZONE 'Asia/Kolkata') = $2::date
-                    )
-                ''', user_id, today)
-                
-                if not today_solved:
-                    return  # No streak update if no correct answers today
-                
-                # Check yesterday's activity (in IST)
-                yesterday_solved = await conn.fetchval('''
-                    SELECT EXISTS(
-                        SELECT 1 
-                        FROM user_submissions
-                        WHERE user_id = $1 
-                        AND is_correct = TRUE
-                        AND DATE(submitted_at AT TIME ZONE 'UTC' AT TIME ZONE 'Asia/Kolkata') = $2::date
-                    )
-                ''', user_id, yesterday)
-                
-                # Get current streak
-                current_streak = await get_user_streak(user_id)
-                
-                # Update streak logic
-                if not last_update or not current_streak:
-                    # First time solving a question
-                    new_streak = 1
-                elif last_update_date == today:
-                    # Already updated today, keep current streak
-                    return
-                elif yesterday_solved:
-                    # Continued streak from yesterday
-                    new_streak = current_streak + 1
-                else:
-                    # Broke the streak, but solved today
-                    new_streak = 1
-                
-                # Update streak and last update timestamp in database
                 await conn.execute('''
                     INSERT INTO user_stats (user_id, streak, last_streak_update)
                     VALUES ($1, $2, $3)
@@ -2392,23 +4656,80 @@ async def update_user_streak(user_id):
                         streak = $2,
                         last_streak_update = $3
                 ''', user_id, new_streak, ist_now)
-                
-                logging.info(f"Updated streak for user {user_id}: {new_streak}")
-                
+        profile.streak = new_streak
+        profile.last_streak_update = ist_now
+
+        logging.info(f"Updated streak for user {user_id}: {new_streak}")
+
     except Exception as e:
         logging.error(f"Error updating user streak: {e}")
 
-user_locks = {}
+MAILBOX_SIZE = int(os.getenv('MAILBOX_SIZE', '5'))
+MAILBOX_IDLE_SECONDS = 60
+# These wait for the user's later messages or sleep for minutes, so they would stall the mailbox
+UNSERIALIZED_COMMANDS = frozenset({'challenge', 'sql_battle', 'profile', 'memprofile'})
+
+class UserMailboxes:
+    """One actor per active user: a user's commands run in arrival order, different users in parallel.
+
+    Mailboxes are bounded, and an actor exits once it has been idle for idle_seconds.
+    """
+
+    def __init__(self, maxsize, idle_seconds):
+        self.maxsize = maxsize
+        self.idle_seconds = idle_seconds
+        self.actors = {}
 
-async def get_user_lock(user_id):
-    if user_id not in user_locks:
-        user_locks[user_id] = asyncio.Lock()
-    return user_locks[user_id]
+    def post(self, user_id, ctx):
+        actor = self.actors.get(user_id)
+        if actor is None:
+            queue = asyncio.Queue(self.maxsize)
+            actor = self.actors[user_id] = (queue, asyncio.create_task(self._run(user_id, queue)))
+        try:
+            actor[0].put_nowait(ctx)
+            return True
+        except asyncio.QueueFull:
+            MAILBOX_REJECTED.inc()
+            return False
+
+    async def _run(self, user_id, queue):
+        while True:
+            # asyncio.wait rather than wait_for: a timed-out wait_for can drop an item it just dequeued
+            getter = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({getter}, timeout=self.idle_seconds)
+            if not done:
+                getter.cancel()
+                if queue.empty():
+                    del self.actors[user_id]
+                    return
+                continue
+            ctx = getter.result()
+            try:
+                await bot.invoke(ctx)
+            except Exception:
+                logging.error(f"Unhandled error running {ctx.command} for user {user_id}", exc_info=True)
+
+    def close(self):
+        for _, task in self.actors.values():
+            task.cancel()
+        self.actors.clear()
+
+MAILBOXES = UserMailboxes(MAILBOX_SIZE, MAILBOX_IDLE_SECONDS)
+MAILBOX_REJECTED = METRICS.register(Counter('sql_mentor_mailbox_rejected_total', 'Commands refused because the user mailbox was full'))
+METRICS.register(Gauge('sql_mentor_mailboxes', 'Users with a live command actor', lambda: len(MAILBOXES.actors)))
 
-# Use the lock in critical sections, e.g.:
-async def update_user_data(user_id, data):
-    async with await get_user_lock(user_id):
-        pass  
+@bot.event
+async def on_message(message):
+    if message.author.bot:
+        return
+    if SUBMISSIONS.deliver(message):
+        return
+    ctx = await bot.get_context(message)
+    if ctx.command is None or ctx.command.qualified_name in UNSERIALIZED_COMMANDS:
+        # Unknown commands still reach invoke() so CommandNotFound is reported
+        await bot.invoke(ctx)
+    elif not MAILBOXES.post(message.author.id, ctx):
+        await ctx.send("You're sending commands faster than I can handle them. Please wait for the previous ones to finish.")
 
 async def setup():
     required_vars = ['DATABASE_URL', 'DISCORD_TOKEN', 'CHANNEL_ID']
@@ -2421,6 +4742,22 @@ async def setup():
         raise ValueError("Missing required environment variables")
 
     await wait_for_db()
+    await KNOWN_USERS.warm()
+    await QUESTIONS.load()
+    QUESTIONS.start()
+    GRADER.start()
+    KNOWN_USERS.start()
+    ACTIVITY.start()
+    CHALLENGE_BURST.start()
+    if METRICS_PORT:
+        await start_metrics_server()
+    WATCHDOG.start()
+    roll_over_daily_counters.start()
+    if TRAFFIC:
+        TRAFFIC.start()
+    if CLUSTER_BUS:
+        await connect_cluster_bus()
+    LEADER.start()
 
 async def db_operation(operation, *args):
     async with DB_SEMAPHORE:
@@ -2433,19 +4770,39 @@ async def db_operation(operation, *args):
         except Exception as e:
             logging.error(f"Database operation error: {e}")
             raise
+async def write_user_stats(conn, user_id, question_id, is_correct, points):
+    """The rows behind update_user_stats, written on the caller's connection and transaction."""
+    await conn.execute('''
+        INSERT INTO user_submissions (user_id, question_id, is_correct, points)
+        VALUES ($1, $2, $3, $4)
+    ''', user_id, question_id, is_correct, points)
+    await conn.execute('''
+        INSERT INTO weekly_points (user_id, points, week_start)
+        VALUES ($1, $2, $3)
+        ON CONFLICT (user_id, week_start)
+        DO UPDATE SET points = weekly_points.points + EXCLUDED.points
+    ''', user_id, points, await get_week_start())
+    await conn.execute('''
+        INSERT INTO daily_points (user_id, date, points)
+        VALUES ($1, $2, $3)
+        ON CONFLICT (user_id, date)
+        DO UPDATE SET points = daily_points.points + EXCLUDED.points
+    ''', user_id, get_ist_time().date(), points)
+
+def note_user_stats(user_id, question_id, is_correct, points):
+    # Call right after the commit, with no await in between
+    DAILY_COUNTERS.record(user_id, question_id, is_correct, points)
+    PROFILES.record_submission(user_id, question_id, is_correct)
+
 async def update_user_stats(user_id, question_id, is_correct, points):
     try:
         async with DB_SEMAPHORE:
             async with bot.db.acquire() as conn:
-                await conn.execute('''
-                    INSERT INTO user_submissions (user_id, question_id, is_correct, points)
-                    VALUES ($1, $2, $3, $4)
-                ''', user_id, question_id, is_correct, points)
-        
-        await update_weekly_points(user_id, points)
-        
-        today = get_ist_time().date()
-        await update_daily_points(user_id, today, points)
+                async with conn.transaction():
+                    await write_user_stats(conn, user_id, question_id, is_correct, points)
+                # Before releasing the connection (an await), so a concurrent seed can't
+                # read the committed row and have record() count it a second time
+                note_user_stats(user_id, question_id, is_correct, points)
         
     except Exception as e:
         logging.error(f"Error updating user stats: {e}")
@@ -2453,12 +4810,7 @@ async def update_user_stats(user_id, question_id, is_correct, points):
 
 async def get_max_attempts(user_id, question_id):
     try:
-        async with DB_SEMAPHORE:
-            async with bot.db.acquire() as conn:
-                incorrect_submissions = await conn.fetchval('''
-                    SELECT COUNT(*) FROM user_submissions
-                    WHERE user_id = $1 AND question_id = $2 AND is_correct = FALSE
-                ''', user_id, question_id)
+        incorrect_submissions = (await PROFILES.get(user_id)).misses.get(question_id, 0)
         return max(5 - incorrect_submissions, 1)  # Minimum 1 attempt, maximum 5
     except Exception as e:
         logging.error(f"Error getting max attempts: {e}")
@@ -2505,7 +4857,7 @@ async def update_leaderboards(ctx):
     if ctx.author.id not in ADMIN_IDS:
         await ctx.send("You don't have permission to use this command.")
         return
-    await update_leaderboard()
+    await post_leaderboard()
     await ctx.send("Leaderboards have been manually updated.")
 
 @bot.command()
@@ -2517,19 +4869,25 @@ async def post_monthly_leaderboard(ctx):
     await ctx.send("Monthly leaderboard has been posted.")
 
 @bot.command()
-async def view_reports(ctx, limit: int = 10):
+async def view_reports(ctx, limit: int = 5):
     if ctx.author.id not in ADMIN_IDS:
         await ctx.send("You don't have permission to use this command.")
         return
-    reports = await get_recent_reports(limit)
-    if reports:
-        report_text = "Recent Reports:\n\n"
+
+    def render(reports, page_index):
+        report_text = f"Recent Reports (page {page_index + 1}):\n\n"
         for report in reports:
             report_text += f"Question ID: {report['question_id']}\n"
             report_text += f"Reported by: {report['reported_by']}\n"
-            report_text += f"Remarks: {report['remarks']}\n\n"
-        await ctx.send(report_text)
-    else:
+            report_text += f"Remarks: {truncate(report['remarks'], 250)}\n\n"
+        return report_text
+
+    # limit is the page size; 5 reports with truncated remarks always fit in one message
+    fetch = keyset_fetcher(
+        "SELECT id, question_id, reported_by, remarks, reported_at FROM reports WHERE reported_at IS NOT NULL",
+        ('reported_at', 'id'), descending=True)
+    paginator = KeysetPaginator(ctx.author.id, fetch, render, ('reported_at', 'id'), page_size=max(1, min(limit, 5)))
+    if not await paginator.start(ctx):
         await ctx.send("No recent reports found.")
 
 @bot.command()
@@ -2544,6 +4902,222 @@ async def view_stats(ctx):
     stats_text += f"Total Submissions: {stats['total_submissions']}\n"
     await ctx.send(stats_text)
 
+@bot.command()
+async def slow_queries(ctx, limit: int = 10):
+    if ctx.author.id not in ADMIN_IDS:
+        await ctx.send("You don't have permission to use this command.")
+        return
+    offenders = SLOW_QUERIES.top(max(1, min(limit, 15)))
+    if not offenders:
+        await ctx.send(f"No statements slower than {SLOW_QUERY_MS:.0f} ms since startup.")
+        return
+
+    lines = [f"Slowest statements (over {SLOW_QUERY_MS:.0f} ms, by total time):"]
+    for i, ((label, call_site), entry) in enumerate(offenders, 1):
+        plan = ' · plan in slow_queries.log' if entry['plan'] else ''
+        lines.append(f"{i}. {call_site} — {entry['count']}x, avg {entry['total'] / entry['count'] * 1000:.0f} ms, "
+                     f"max {entry['max'] * 1000:.0f} ms{plan}\n   `{truncate(label, 90)}`")
+    for chunk in split_message('\n'.join(lines)):
+        await ctx.send(chunk)
+
+@bot.command()
+async def blocking_calls(ctx, limit: int = 5):
+    if ctx.author.id not in ADMIN_IDS:
+        await ctx.send("You don't have permission to use this command.")
+        return
+    blockers = WATCHDOG.top(max(1, min(limit, 10)))
+    if not blockers:
+        await ctx.send(f"The event loop has not been blocked for more than {LOOP_BLOCK_THRESHOLD_MS:.0f} ms since startup.")
+        return
+
+    lines = [f"Top event loop blockers (over {LOOP_BLOCK_THRESHOLD_MS:.0f} ms, by total time):"]
+    for i, (site, entry) in enumerate(blockers, 1):
+        lines.append(f"{i}. {site} — {entry['count']}x, total {entry['total']:.2f}s, max {entry['max'] * 1000:.0f} ms, "
+                     f"last task `{entry['task']}`")
+        if entry['stack']:
+            lines.append(f"```\n{truncate(entry['stack'], 600)}\n```")
+    for chunk in split_message('\n'.join(lines)):
+        await ctx.send(chunk)
+
+@bot.command()
+async def profile(ctx, seconds: int = 10):
+    if ctx.author.id not in ADMIN_IDS:
+        await ctx.send("You don't have permission to use this command.")
+        return
+    if not PROFILER.running.acquire(blocking=False):
+        await ctx.send("A profile is already running.")
+        return
+    try:
+        seconds = max(1, min(seconds, 60))
+        await ctx.send(f"Sampling for {seconds}s...")
+        samples, stacks = await asyncio.to_thread(PROFILER.run, seconds)
+    finally:
+        PROFILER.running.release()
+
+    hot, total = summarize_profile(stacks)
+    thread_samples = sum(stacks.values()) or 1
+    lines = [f"Top functions by own samples ({samples} samples over {seconds}s, all threads):", "```"]
+    for frame, count in hot:
+        lines.append(f"{count / thread_samples:6.1%} own {total[frame] / thread_samples:6.1%} total  {truncate(frame, 60)}")
+    lines.append("```")
+    collapsed = discord.File(io.BytesIO(collapsed_stacks(stacks).encode()),
+                             filename=f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}.collapsed")
+    await ctx.send('\n'.join(lines), file=collapsed)
+
+@bot.command()
+async def memprofile(ctx, seconds: int = 30):
+    if ctx.author.id not in ADMIN_IDS:
+        await ctx.send("You don't have permission to use this command.")
+        return
+    if MEMPROFILE_RUNNING.locked():
+        await ctx.send("A memory profile is already running.")
+        return
+    async with MEMPROFILE_RUNNING:
+        seconds = max(1, min(seconds, 300))
+        started_here = not tracemalloc.is_tracing()
+        if started_here:
+            tracemalloc.start(10)
+        try:
+            before_sizes = session_state_sizes()
+            before = tracemalloc.take_snapshot()
+            await ctx.send(f"Tracing allocations for {seconds}s...")
+            await asyncio.sleep(seconds)
+            after = tracemalloc.take_snapshot()
+            after_sizes = session_state_sizes()
+        finally:
+            if started_here:
+                tracemalloc.stop()
+
+    ignore = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, '<frozen importlib._bootstrap>'))
+    diff = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), 'lineno')
+    lines = [f"Allocation growth over {seconds}s:", "```"]
+    for stat in diff[:10]:
+        frame = stat.traceback[0]
+        lines.append(f"{stat.size_diff / 1024:+9.1f} KiB {stat.count_diff:+7d} blocks  "
+                     f"{os.path.basename(frame.filename)}:{frame.lineno}")
+    lines.extend(["```", "Session state (entries, approx. size):", "```"])
+    for (name, entries, size), (_, old_entries, old_size) in zip(after_sizes, before_sizes):
+        lines.append(f"{name:<17}{entries:>7} ({entries - old_entries:+d}) {size / 1024:>9.1f} KiB ({(size - old_size) / 1024:+.1f})")
+    lines.append("```")
+    for chunk in split_message('\n'.join(lines)):
+        await ctx.send(chunk)
+
+@bot.command()
+async def engagement(ctx):
+    if ctx.author.id not in ADMIN_IDS:
+        await ctx.send("You don't have permission to use this command.")
+        return
+    try:
+        report = await ACTIVITY.report()
+    except Exception as e:
+        logging.error(f"Error in engagement command: {e}")
+        await ctx.send("An error occurred while building the engagement report.")
+        return
+
+    def percent(value):
+        return f"{value:.0%}" if value is not None else "n/a"
+
+    stickiness = report['dau'] / report['mau'] if report['mau'] else None
+    lines = [
+        "📈 Engagement (IST days, HyperLogLog estimates ±2%):",
+        f"DAU (today so far): {report['dau']}   WAU: {report['wau']}   MAU: {report['mau']}   DAU/MAU: {percent(stickiness)}",
+        f"Retention: day {percent(report['day_retention'])}, week {percent(report['week_retention'])}, "
+        f"month {percent(report['month_retention'])} (share of the previous period's users active again)",
+        "```",
+    ]
+    lines.extend(f"{day:%a %d %b}  {count:>6}" for day, count in report['daily'])
+    lines.append("```")
+    await ctx.send('\n'.join(lines))
+
+@bot.command()
+async def challenge_queue(ctx):
+    if ctx.author.id not in ADMIN_IDS:
+        await ctx.send("You don't have permission to use this command.")
+        return
+    try:
+        async with DB_SEMAPHORE:
+            async with bot.db.acquire() as conn:
+                async with conn.transaction():
+                    queue = await CHALLENGE_PLANNER.preview(conn)
+    except Exception as e:
+        logging.error(f"Error in challenge_queue command: {e}")
+        await ctx.send("An error occurred while loading the challenge queue.")
+        return
+    if not queue:
+        await ctx.send("The challenge queue is empty: every question has already been a daily challenge.")
+        return
+
+    # Challenges go out at 5:30 PM IST; after that the head of the queue is tomorrow's
+    now = get_ist_time()
+    first_day = now.date() + timedelta(days=1 if now.time() >= time(17, 30) else 0)
+    lines = [f"Upcoming daily challenges ({len(queue)}):"]
+    for i, row in enumerate(queue):
+        lines.append(f"{i + 1}. {first_day + timedelta(days=i):%a %d %b} — #{row['id']} {row['difficulty']}, "
+                     f"{row['topic'] or 'General'}: {truncate(row['question'], 70)}")
+    lines.append("Use `!challenge_queue_move <question_id> <position>` to reorder.")
+    for chunk in split_message('\n'.join(lines)):
+        await ctx.send(chunk)
+
+@bot.command()
+async def challenge_queue_move(ctx, question_id: int, position: int):
+    if ctx.author.id not in ADMIN_IDS:
+        await ctx.send("You don't have permission to use this command.")
+        return
+    try:
+        async with DB_SEMAPHORE:
+            async with bot.db.acquire() as conn:
+                async with conn.transaction():
+                    position = await CHALLENGE_PLANNER.move(conn, question_id, position)
+    except Exception as e:
+        logging.error(f"Error in challenge_queue_move command: {e}")
+        await ctx.send("An error occurred while reordering the challenge queue.")
+        return
+    if position is None:
+        await ctx.send(f"Question {question_id} is not in the challenge queue. See `!challenge_queue`.")
+        return
+    await ctx.send(f"Question {question_id} moved to position {position} of the challenge queue.")
+
+@bot.command()
+async def compact_datasets(ctx):
+    if ctx.author.id not in ADMIN_IDS:
+        await ctx.send("You don't have permission to use this command.")
+        return
+    try:
+        async with DB_SEMAPHORE:
+            async with bot.db.acquire() as conn:
+                rows = await conn.fetch('''
+                    SELECT id, datasets FROM questions
+                    WHERE LENGTH(datasets) > $1
+                ''', DATASET_COMPRESS_CHARS)
+
+        def compress():
+            # (id, characters, uncompressed bytes, compressed bytes), kept only where compression pays
+            packed = [(row['id'], len(row['datasets']), row['datasets'].encode()) for row in rows]
+            packed = [(question_id, chars, len(raw), zlib.compress(raw, 9)) for question_id, chars, raw in packed]
+            return [entry for entry in packed if len(entry[3]) < entry[2]]
+        packed = await asyncio.to_thread(compress)
+
+        if packed:
+            async with DB_SEMAPHORE:
+                async with bot.db.acquire() as conn:
+                    # The length check skips rows edited since they were read; a row edited
+                    # after an earlier compaction has both columns and gets a fresh datasets_gz
+                    await conn.execute('''
+                        UPDATE questions q SET datasets_gz = t.gz, datasets = NULL
+                        FROM UNNEST($1::INT[], $2::INT[], $3::BYTEA[]) AS t(id, chars, gz)
+                        WHERE q.id = t.id AND LENGTH(q.datasets) = t.chars
+                    ''', [entry[0] for entry in packed], [entry[1] for entry in packed], [entry[3] for entry in packed])
+    except Exception as e:
+        logging.error(f"Error in compact_datasets command: {e}")
+        await ctx.send("An error occurred while compacting datasets.")
+        return
+    if not packed:
+        await ctx.send(f"No uncompressed datasets over {DATASET_COMPRESS_CHARS} characters.")
+        return
+    before = sum(entry[2] for entry in packed)
+    after = sum(len(entry[3]) for entry in packed)
+    await ctx.send(f"Compressed {len(packed)} datasets: {before / 1024:.1f} KiB -> {after / 1024:.1f} KiB.")
+
 @tasks.loop(time=time(hour=3, minute=30))  # 9:00 AM IST
 async def update_weekly_heroes():
     if datetime.now(pytz.timezone('Asia/Kolkata')).weekday() != 6:  # 6 is Sunday
@@ -2552,19 +5126,17 @@ async def update_weekly_heroes():
     try:
         weekly_heroes = await get_weekly_heroes()
 
+        # Reset weekly points first: only the instance still holding the fence goes on to post
+        if not await reset_weekly_points():
+            return
+
         if weekly_heroes:
             heroes_message = "🏆 Weekly Heroes 🏆\n\n"
             for i, hero in enumerate(weekly_heroes, 1):
                 emoji = ["🥇", "🥈", "🥉", "", "🏅"][i-1]
                 heroes_message += f"{emoji} {hero['username']}: {hero['total_points']} points\n"
 
-            for channel_id in CHANNEL_IDS:
-                channel = bot.get_channel(channel_id)
-                if channel:
-                    await channel.send(heroes_message)
-
-        # Reset weekly points after posting
-        await reset_weekly_points()
+            await broadcast_to_channels(heroes_message)
 
     except Exception as e:
         logging.error(f"Error in update_weekly_heroes task: {e}")
@@ -2573,9 +5145,14 @@ async def reset_weekly_points():
     try:
         async with DB_SEMAPHORE:
             async with bot.db.acquire() as conn:
-                await conn.execute('DELETE FROM weekly_points')
+                async with conn.transaction():
+                    if not await LEADER.holds_fence(conn):
+                        return False
+                    await conn.execute('DELETE FROM weekly_points')
+        return True
     except Exception as e:
         logging.error(f"Error resetting weekly points: {e}")
+        return False
 
 @bot.command()
 async def admin(ctx):
@@ -2596,8 +5173,8 @@ async def admin(ctx):
        Description: Manually posts the monthly leaderboard.
 
     3. `!view_reports`
-       Usage: !view_reports [limit]
-       Description: Views recent question reports. Optionally specify a limit (default 10).
+       Usage: !view_reports [page_size]
+       Description: Pages through question reports, newest first (up to 5 per page).
 
     4. `!view_stats`
        Usage: !view_stats
@@ -2606,19 +5183,42 @@ async def admin(ctx):
     5. `!schedule_post`
         Usage: `!schedule_post` `2024-10-26 22:00:00` (in IST) This is a scheduled message"
 
+    6. `!slow_queries`
+       Usage: !slow_queries [limit]
+       Description: Lists the slowest database statements by call site (plans are in slow_queries.log).
+
+    7. `!blocking_calls`
+       Usage: !blocking_calls [limit]
+       Description: Shows the code paths that blocked the event loop the longest, with their last stack.
+
+    8. `!profile`
+       Usage: !profile [seconds]
+       Description: Samples the running bot and replies with the hottest functions plus a collapsed-stack file for flame graphs.
+
+    9. `!memprofile`
+       Usage: !memprofile [seconds]
+       Description: Diffs two tracemalloc snapshots and shows growth of the per-user session dictionaries.
+
+    10. `!engagement`
+       Usage: !engagement
+       Description: Shows daily, weekly and monthly active users and retention.
+
+    11. `!challenge_queue`
+       Usage: !challenge_queue
+       Description: Previews the upcoming daily challenges, topping the queue up if needed.
+
+    12. `!challenge_queue_move`
+       Usage: !challenge_queue_move <question_id> <position>
+       Description: Moves a queued challenge question to a new position (1 is the next challenge).
+
+    13. `!compact_datasets`
+       Usage: !compact_datasets
+       Description: Stores datasets longer than DATASET_COMPRESS_CHARS compressed.
+
     Remember, with great power comes great responsibility. Use these commands wisely!
     """
-    await ctx.send(admin_help_text)
-
-async def get_recent_reports(limit):
-    async with DB_SEMAPHORE:
-        async with bot.db.acquire() as conn:
-            reports = await conn.fetch('''
-                SELECT * FROM reports
-                ORDER BY reported_at DESC
-                LIMIT $1
-            ''', limit)
-    return reports
+    for chunk in split_message(admin_help_text):
+        await ctx.send(chunk)
 
 async def get_bot_stats():
     async with DB_SEMAPHORE:
@@ -2724,20 +5324,21 @@ async def check_scheduled_posts():
             ''', now)
             
             for post in posts:
+                # Mark as posted before sending: a stale leader, or a retry, can never post twice
+                async with conn.transaction():
+                    if not await LEADER.holds_fence(conn):
+                        return
+                    claimed = await conn.fetchval('''
+                        UPDATE scheduled_posts
+                        SET posted = TRUE
+                        WHERE id = $1 AND NOT posted
+                        RETURNING id
+                    ''', post['id'])
+                if not claimed:
+                    continue
+
                 # Post the message to all channels
-                for channel_id in CHANNEL_IDS:
-                    channel = bot.get_channel(channel_id)
-                    if channel:
-                        await channel.send(post['message'])
-                    else:
-                        logging.warning(f"Channel with ID {channel_id} not found")
-                
-                # Mark as posted
-                await conn.execute('''
-                    UPDATE scheduled_posts
-                    SET posted = TRUE
-                    WHERE id = $1
-                ''', post['id'])
+                await broadcast_to_channels(post['message'])
     except Exception as e:
         logging.error(f"Error in check_scheduled_posts: {e}")
 
@@ -2748,9 +5349,8 @@ async def before_check_scheduled_posts():
 @bot.command()
 async def skip(ctx):
     user_id = ctx.author.id
-    await user_last_active.set(user_id, datetime.now(timezone.utc))
     
-    current_question = await user_questions.get(user_id)
+    current_question = await get_user_question(user_id)
     if not current_question:
         await ctx.send("You don't have an active question to skip. Use `!sql` to get a new question.")
         return
@@ -2766,6 +5366,13 @@ async def skip(ctx):
 
     await ctx.send("Question skipped. Use `!sql` to get a new question.")
 
+# Built last so every scheduled loop above already exists
+LEADER = LeaderElector(
+    LEADER_LOCK_KEY,
+    jobs=[update_leaderboard, daily_challenge, challenge_time_over, update_weekly_heroes, check_scheduled_posts],
+    poll_interval=LEADER_POLL_INTERVAL,
+)
+
 def main():
     loop = asyncio.get_event_loop()
     try:
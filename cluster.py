@@ -0,0 +1,330 @@
+import os
+import sys
+import json
+import signal
+import asyncio
+import logging
+import argparse
+import itertools
+import multiprocessing
+
+import aiohttp
+from dotenv import load_dotenv
+
+
+# Cluster launcher: runs bot.py as an AutoShardedBot split across worker processes.
+#
+#   python cluster.py --workers 4 --shards 8
+#   python cluster.py --workers 3 --fake-gateway   # local smoke test, no Discord or DB
+#
+# Every worker owns a slice of the shards and talks to the others through the
+# JSON-lines hub below (see ClusterBus in bot.py for the worker side).
+
+logging.basicConfig(level=logging.INFO, format='[%(asctime)s] [%(levelname)s] %(processName)s: %(message)s')
+load_dotenv()
+
+RESTART_DELAY = 5  # seconds before a crashed worker is restarted
+
+
+def plan_shards(shard_count, workers):
+    return [list(range(worker, shard_count, workers)) for worker in range(workers)]
+
+
+async def recommended_shard_count(token):
+    async with aiohttp.ClientSession() as session:
+        async with session.get('https://discord.com/api/v10/gateway/bot',
+                               headers={'Authorization': f'Bot {token}'}) as response:
+            response.raise_for_status()
+            data = await response.json()
+    return data['shards']
+
+
+class Hub:
+    """Relays events and request/reply pairs between worker processes."""
+
+    def __init__(self):
+        self.workers = {}
+        self.address = None
+        self._server = None
+        self._routes = {}
+        self._pending = {}
+        self._locks = {}
+        self._connections = set()
+        self._ids = itertools.count(1)
+        self._joined = asyncio.Condition()
+
+    async def start(self, host='127.0.0.1', port=0):
+        self._server = await asyncio.start_server(self._serve, host, port, limit=16 * 1024 * 1024)
+        host, port = self._server.sockets[0].getsockname()[:2]
+        self.address = f"{host}:{port}"
+        logging.info(f"Cluster hub listening on {self.address}")
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+        for writer in list(self.workers.values()):
+            writer.close()
+        if self._connections:
+            await asyncio.wait(self._connections, timeout=5)
+
+    async def wait_for_workers(self, count, timeout=60):
+        async with self._joined:
+            await asyncio.wait_for(self._joined.wait_for(lambda: len(self.workers) >= count), timeout)
+
+    async def publish(self, topic, payload):
+        message = {'op': 'event', 'topic': topic, 'payload': payload}
+        for writer in list(self.workers.values()):
+            await self._send(writer, message)
+
+    async def request(self, worker_id, topic, payload, timeout=5):
+        request_id = f"hub:{next(self._ids)}"
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            await self._send(self.workers[worker_id], {'op': 'request', 'id': request_id, 'topic': topic, 'payload': payload})
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def _send(self, writer, message):
+        lock = self._locks.setdefault(writer, asyncio.Lock())
+        async with lock:
+            writer.write(json.dumps(message, default=str).encode() + b'\n')
+            await writer.drain()
+
+    async def _serve(self, reader, writer):
+        worker_id = None
+        self._connections.add(asyncio.current_task())
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                op = message.get('op')
+                if op == 'hello':
+                    worker_id = message['worker']
+                    async with self._joined:
+                        self.workers[worker_id] = writer
+                        self._joined.notify_all()
+                    logging.info(f"Worker {worker_id} joined the hub")
+                elif op == 'publish':
+                    await self.publish(message['topic'], message['payload'])
+                elif op == 'request':
+                    await self._route_request(worker_id, writer, message)
+                elif op == 'reply':
+                    await self._route_reply(message)
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            logging.warning(f"Worker {worker_id} connection error: {e}")
+        finally:
+            if worker_id is not None and self.workers.get(worker_id) is writer:
+                del self.workers[worker_id]
+                logging.warning(f"Worker {worker_id} left the hub")
+            self._locks.pop(writer, None)
+            self._connections.discard(asyncio.current_task())
+            writer.close()
+
+    async def _route_request(self, worker_id, writer, message):
+        targets = [w for wid, w in self.workers.items() if wid != worker_id]
+        if not targets:
+            await self._send(writer, {'op': 'reply', 'id': message['id'], 'payload': None})
+            return
+
+        self._routes[message['id']] = {'requester': writer, 'outstanding': len(targets), 'answered': False}
+        # Drop the route even if a worker dies before replying
+        asyncio.get_running_loop().call_later(30, self._routes.pop, message['id'], None)
+        for target in targets:
+            await self._send(target, message)
+
+    async def _route_reply(self, message):
+        future = self._pending.get(message['id'])
+        if future is not None:
+            if not future.done():
+                future.set_result(message.get('payload'))
+            return
+
+        route = self._routes.get(message['id'])
+        if route is None:
+            return
+        route['outstanding'] -= 1
+        payload = message.get('payload')
+        if payload is not None and not route['answered']:
+            route['answered'] = True
+            await self._send(route['requester'], message)
+        if route['outstanding'] <= 0:
+            if not route['answered']:
+                await self._send(route['requester'], {'op': 'reply', 'id': message['id'], 'payload': None})
+            self._routes.pop(message['id'], None)
+
+
+class FakeChannel:
+    def __init__(self, channel_id, shard_id, worker_id):
+        self.id = channel_id
+        self.shard_id = shard_id
+        self.worker_id = worker_id
+        self.sent = []
+
+    async def send(self, content=None, **kwargs):
+        self.sent.append(content)
+        logging.info(f"[worker {self.worker_id} / shard {self.shard_id}] #{self.id}: {str(content)[:60]!r}")
+
+
+class FakeGateway:
+    """Stands in for the Discord gateway: a worker only sees channels on its own shards."""
+
+    def __init__(self, worker_id, shard_ids, shard_count):
+        self.worker_id = worker_id
+        self.shard_ids = set(shard_ids)
+        self.shard_count = shard_count
+        self.channels = {}
+
+    def shard_for(self, channel_id):
+        # Discord routes by guild id; the fake treats every channel as its own guild
+        return (channel_id >> 22) % self.shard_count
+
+    def get_channel(self, channel_id):
+        shard_id = self.shard_for(channel_id)
+        if shard_id not in self.shard_ids:
+            return None
+        if channel_id not in self.channels:
+            self.channels[channel_id] = FakeChannel(channel_id, shard_id, self.worker_id)
+        return self.channels[channel_id]
+
+    def deliveries(self):
+        return sum(len(channel.sent) for channel in self.channels.values())
+
+
+async def run_fake_worker(worker_id, shard_ids, shard_count):
+    import bot as mentor
+
+    gateway = FakeGateway(worker_id, shard_ids, shard_count)
+    mentor.bot.get_channel = gateway.get_channel
+
+    async def seed_session(payload):
+        question = {'id': payload['question_id'], 'difficulty': 'easy', 'question': 'SELECT 1?', 'answer': 'SELECT 1'}
+        await mentor.user_questions.set(payload['user_id'], question)
+        await mentor.user_attempts.set(payload['user_id'], 2)
+        return True
+
+    async def lookup_session(payload):
+        question = await mentor.get_user_question(payload['user_id'])
+        return question and question['id']
+
+    async def deliveries(payload):
+        return gateway.deliveries()
+
+    mentor.CLUSTER_BUS.handle('fake_seed_session', seed_session)
+    mentor.CLUSTER_BUS.handle('fake_lookup', lookup_session)
+    mentor.CLUSTER_BUS.handle('fake_deliveries', deliveries)
+    await mentor.connect_cluster_bus()
+    await asyncio.Event().wait()
+
+
+def worker_main(worker_id, shard_ids, shard_count, env, fake):
+    os.environ.update(env)
+    if fake:
+        asyncio.run(run_fake_worker(worker_id, shard_ids, shard_count))
+    else:
+        import bot as mentor
+        mentor.main()
+
+
+async def run_fake_scenario(hub, workers):
+    channel_ids = [int(i) for i in os.environ['CHANNEL_ID'].split(',')]
+    await hub.wait_for_workers(workers)
+
+    owner, claimer = 0, (1 if workers > 1 else 0)
+    await hub.request(owner, 'fake_seed_session', {'user_id': 42, 'question_id': 7})
+    claimed = await hub.request(claimer, 'fake_lookup', {'user_id': 42})
+    logging.info(f"Session for user 42 seeded on worker {owner}, looked up from worker {claimer}: question {claimed}")
+
+    await hub.publish('broadcast', {'message': 'Fake gateway broadcast check'})
+    await asyncio.sleep(1)
+    delivered = [await hub.request(worker, 'fake_deliveries', {}) for worker in range(workers)]
+    logging.info(f"Broadcast deliveries per worker: {delivered} (channels: {len(channel_ids)})")
+
+    ok = claimed == 7 and sum(delivered) == len(channel_ids)
+    logging.info("Fake gateway check PASSED" if ok else "Fake gateway check FAILED")
+    return ok
+
+
+async def run_cluster(args):
+    if args.fake_gateway:
+        os.environ.setdefault('CHANNEL_ID', ','.join(str(i << 22) for i in range(1, 4 * args.shards + 1)))
+        shard_count = args.shards
+    else:
+        shard_count = args.shards or await recommended_shard_count(os.getenv('DISCORD_TOKEN'))
+    workers = min(args.workers, shard_count)
+
+    hub = Hub()
+    await hub.start(port=args.ipc_port)
+
+    pool_size = max(2, args.db_pool_size // workers)
+    metrics_port = int(os.getenv('METRICS_PORT', '9100'))
+    plans = plan_shards(shard_count, workers)
+    context = multiprocessing.get_context('spawn')
+
+    def spawn(worker_id):
+        env = {
+            'SHARD_COUNT': str(shard_count),
+            'SHARD_IDS': ','.join(map(str, plans[worker_id])),
+            'CLUSTER_IPC_ADDR': hub.address,
+            'CLUSTER_WORKER_ID': str(worker_id),
+            'DB_POOL_MAX_SIZE': str(pool_size),
+            # One metrics endpoint per worker: base port + worker id
+            'METRICS_PORT': str(metrics_port + worker_id if metrics_port else 0),
+        }
+        process = context.Process(target=worker_main, name=f'worker-{worker_id}',
+                                  args=(worker_id, plans[worker_id], shard_count, env, args.fake_gateway))
+        process.start()
+        logging.info(f"Started worker {worker_id} (pid {process.pid}) with shards {plans[worker_id]}")
+        return process
+
+    processes = {worker_id: spawn(worker_id) for worker_id in range(workers)}
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    ok = True
+    try:
+        if args.fake_gateway:
+            ok = await run_fake_scenario(hub, workers)
+        else:
+            while not stopping.is_set():
+                for worker_id, process in list(processes.items()):
+                    if not process.is_alive():
+                        logging.error(f"Worker {worker_id} exited with code {process.exitcode}, restarting in {RESTART_DELAY}s")
+                        await asyncio.sleep(RESTART_DELAY)
+                        processes[worker_id] = spawn(worker_id)
+                try:
+                    await asyncio.wait_for(stopping.wait(), timeout=1)
+                except asyncio.TimeoutError:
+                    pass
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            await loop.run_in_executor(None, process.join, 10)
+        await hub.close()
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run SQL Mentor as a multi-process sharded cluster')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--shards', type=int, default=0, help='total shard count (default: Discord recommendation)')
+    parser.add_argument('--ipc-port', type=int, default=0, help='hub port on 127.0.0.1 (default: random)')
+    parser.add_argument('--db-pool-size', type=int, default=int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+                        help='total Postgres connections, split across workers')
+    parser.add_argument('--fake-gateway', action='store_true', help='run a local smoke test without Discord or Postgres')
+    args = parser.parse_args()
+    if args.fake_gateway and not args.shards:
+        args.shards = args.workers
+
+    ok = asyncio.run(run_cluster(args))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()